@@ -1,12 +1,15 @@
 """
 Database setup for relief centres using SQLite (lightweight, no external setup required)
 """
-from sqlalchemy import create_engine, Column, Integer, String, Float, Enum as SQLEnum, ForeignKey, DateTime, Text
+from sqlalchemy import create_engine, Column, Integer, String, Float, Enum as SQLEnum, ForeignKey, DateTime, Text, MetaData, Table, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 import enum
 import os
+import uuid
+
+from app.services.tracing import instrument_engine
 
 # SQLite database file path
 DATABASE_PATH = os.getenv("DATABASE_PATH", "relief_centres.db")
@@ -18,6 +21,8 @@ engine = create_engine(
     connect_args={"check_same_thread": False},  # Needed for SQLite
     echo=False
 )
+# SQL statements run during a request show up as "db.query" spans
+instrument_engine(engine)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -39,6 +44,8 @@ class ReliefCentre(Base):
     __tablename__ = "relief_centres"
     
     id = Column(Integer, primary_key=True, index=True)
+    # Identifier from the source list (e.g. a district code), for re-imports
+    external_id = Column(String(64), nullable=True, unique=True, index=True)
     name = Column(String(255), nullable=False, index=True)
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
@@ -49,6 +56,9 @@ class ReliefCentre(Base):
         default=ReliefCentreStatus.ACTIVE,
         index=True
     )
+    # Change tracking, maintained by triggers (see init_change_tracking)
+    version = Column(Integer, nullable=False, default=0, server_default=text("0"), index=True)
+    updated_at = Column(DateTime, nullable=True)
     
     def __repr__(self):
         return f"<ReliefCentre(name={self.name}, lat={self.latitude}, lng={self.longitude}, status={self.status})>"
@@ -80,6 +90,73 @@ class ReliefRequest(Base):
         index=True
     )
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # Change tracking, maintained by triggers (see init_change_tracking)
+    version = Column(Integer, nullable=False, default=0, server_default=text("0"), index=True)
+    updated_at = Column(DateTime, nullable=True)
+
+
+class RoadClosure(Base):
+    """
+    Reported road closure: a circular area vehicles can't pass. The set is
+    replaced as a whole (see app.services.road_closures) and its version is
+    kept in change_sequence under "road_closures".
+    """
+    __tablename__ = "road_closures"
+
+    id = Column(Integer, primary_key=True, index=True)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    radius_m = Column(Float, nullable=False)
+    description = Column(Text, nullable=True)
+
+
+# SQLite R*Tree spatial indexes over the point tables. They are virtual tables,
+# so they live outside Base.metadata and are created (together with the
+# triggers that keep them in sync) by init_spatial_index().
+SPATIAL_INDEXED_TABLES = ("relief_centres", "relief_requests")
+_spatial_metadata = MetaData()
+
+
+def _rtree_table(table_name: str) -> Table:
+    return Table(
+        f"{table_name}_rtree",
+        _spatial_metadata,
+        Column("id", Integer, primary_key=True),
+        Column("min_lat", Float),
+        Column("max_lat", Float),
+        Column("min_lng", Float),
+        Column("max_lng", Float),
+    )
+
+
+relief_centres_rtree = _rtree_table("relief_centres")
+relief_requests_rtree = _rtree_table("relief_requests")
+
+
+_database_id = None
+
+
+def database_id() -> str:
+    """
+    Random id of this database, created on first use
+
+    Stored in the database itself (database_meta), so anything derived from
+    its contents, such as snapshots, can tell whether it came from the same
+    database even if the file was replaced or another path is configured.
+    """
+    global _database_id
+    if _database_id is None:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS database_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            ))
+            conn.execute(text(
+                "INSERT OR IGNORE INTO database_meta (key, value) VALUES ('database_id', :value)"
+            ), {"value": uuid.uuid4().hex})
+            _database_id = conn.execute(text(
+                "SELECT value FROM database_meta WHERE key = 'database_id'"
+            )).scalar()
+    return _database_id
 
 
 def get_db():
@@ -93,10 +170,138 @@ def get_db():
         db.close()
 
 
-def init_db():
+def init_db(bind=None):
     """
     Initialize database - create all tables
     Run this once to set up the database schema
+    
+    Args:
+        bind: Engine to initialize (default: the app's engine)
+    """
+    bind = bind or engine
+    Base.metadata.create_all(bind=bind)
+    migrate_schema(bind)
+    init_spatial_index(bind)
+    init_change_tracking(bind)
+
+
+# Columns added after the first release: (table, column, DDL type)
+_ADDED_COLUMNS = (
+    ("relief_centres", "external_id", "VARCHAR(64)"),
+    ("relief_centres", "version", "INTEGER NOT NULL DEFAULT 0"),
+    ("relief_centres", "updated_at", "DATETIME"),
+    ("relief_requests", "version", "INTEGER NOT NULL DEFAULT 0"),
+    ("relief_requests", "updated_at", "DATETIME"),
+)
+
+
+def migrate_schema(bind=None):
+    """
+    Add columns that create_all() doesn't add to existing tables
+    """
+    with (bind or engine).begin() as conn:
+        for table, column, ddl in _ADDED_COLUMNS:
+            existing = {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+            if column not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+                print(f"Migrated {table}: added column {column}")
+        for table in CHANGE_TRACKED_TABLES:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_version ON {table} (version)"))
+        # ALTER TABLE can't add a UNIQUE column, so the constraint is an index
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_relief_centres_external_id "
+            "ON relief_centres (external_id)"
+        ))
+
+
+def init_spatial_index(bind=None):
+    """
+    Create the R*Tree indexes and sync triggers, and backfill them
+    
+    Rows written while the triggers didn't exist yet (e.g. by a bulk load
+    straight into SQLite) are picked up here, so this is safe to run on
+    every start.
+    """
+    with (bind or engine).begin() as conn:
+        for table in SPATIAL_INDEXED_TABLES:
+            rtree = f"{table}_rtree"
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {rtree} "
+                "USING rtree(id, min_lat, max_lat, min_lng, max_lng)"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {rtree}_insert AFTER INSERT ON {table} BEGIN "
+                f"INSERT OR REPLACE INTO {rtree} VALUES "
+                "(new.id, new.latitude, new.latitude, new.longitude, new.longitude); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {rtree}_update AFTER UPDATE OF latitude, longitude ON {table} BEGIN "
+                f"DELETE FROM {rtree} WHERE id = old.id; "
+                f"INSERT OR REPLACE INTO {rtree} VALUES "
+                "(new.id, new.latitude, new.latitude, new.longitude, new.longitude); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {rtree}_delete AFTER DELETE ON {table} BEGIN "
+                f"DELETE FROM {rtree} WHERE id = old.id; END"
+            ))
+            indexed = conn.execute(text(f"SELECT count(*) FROM {rtree}")).scalar()
+            rows = conn.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+            if indexed != rows:
+                conn.execute(text(f"DELETE FROM {rtree} WHERE id NOT IN (SELECT id FROM {table})"))
+                conn.execute(text(
+                    f"INSERT INTO {rtree} SELECT id, latitude, latitude, longitude, longitude "
+                    f"FROM {table} WHERE id NOT IN (SELECT id FROM {rtree})"
+                ))
+
+
+# Tables whose rows carry a version from a per-table change sequence. Every
+# insert or update takes the next value, so "version > cursor" selects what
+# changed since a client last synced, and the current sequence value serves
+# as a cheap ETag for the whole table.
+CHANGE_TRACKED_TABLES = ("relief_centres", "relief_requests")
+
+
+def init_change_tracking(bind=None):
+    """
+    Create the change sequence and version triggers, and version old rows
+    
+    Rows written without the triggers (version 0, e.g. by a bulk load or
+    from before the migration) are given fresh versions, so clients pick
+    them up on their next sync.
     """
-    Base.metadata.create_all(bind=engine)
+    with (bind or engine).begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS change_sequence "
+            "(table_name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        ))
+        for table in CHANGE_TRACKED_TABLES:
+            conn.execute(text(
+                "INSERT OR IGNORE INTO change_sequence (table_name, value) VALUES (:table, 0)"
+            ), {"table": table})
+            next_version = (
+                f"UPDATE change_sequence SET value = value + 1 WHERE table_name = '{table}'; "
+                f"UPDATE {table} SET version = "
+                f"(SELECT value FROM change_sequence WHERE table_name = '{table}'), "
+                "updated_at = datetime('now') WHERE id = new.id; "
+            )
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_version_insert AFTER INSERT ON {table} "
+                f"BEGIN {next_version}END"
+            ))
+            # The WHEN clause skips the trigger's own version update
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_version_update AFTER UPDATE ON {table} "
+                f"WHEN new.version = old.version BEGIN {next_version}END"
+            ))
+            base = conn.execute(text(
+                "SELECT value FROM change_sequence WHERE table_name = :table"
+            ), {"table": table}).scalar()
+            conn.execute(text(
+                f"UPDATE {table} SET version = :base + id, "
+                "updated_at = coalesce(updated_at, datetime('now')) WHERE version = 0"
+            ), {"base": base})
+            conn.execute(text(
+                f"UPDATE change_sequence SET value = max(value, "
+                f"(SELECT coalesce(max(version), 0) FROM {table})) WHERE table_name = :table"
+            ), {"table": table})
 
@@ -1,18 +1,77 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from app.routers import route, relief_centre, weather
-from app.database import init_db
+from app.routers import route, relief_centre, weather, isochrone, closures, metrics, admin, tracking
+from app.database import init_db, SessionLocal
+from app.services.admission import AdmissionMiddleware, configure_threadpool
+from app.services.centre_index import get_centre_index, load_centre_index_snapshot, save_centre_index_snapshot
+from app.services.osrm_pool import osrm_pool
+from app.services.route_tracking import load_tracking_snapshot, save_tracking_snapshot
+from app.services.service_area_service import load_service_area_snapshot, request_service_area_sync
+from app.services.shared_cache import MemoryCache, get_cache
+from app.services.snapshots import SNAPSHOT_INTERVAL, StartupTimer
+from app.services.tracing import TracingMiddleware
+from app.services.weather_prefetcher import weather_prefetcher
+
+
+def save_snapshots():
+    """Persist in-memory indexes and caches so the next start is warm"""
+    try:
+        save_centre_index_snapshot()
+        cache = get_cache()
+        if isinstance(cache, MemoryCache):
+            cache.save_snapshot()
+        save_tracking_snapshot()
+    except Exception as e:
+        print(f"Warning: Failed to write snapshots: {e}")
+
+
+async def snapshot_periodically():
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        await asyncio.to_thread(save_snapshots)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
-    Lifespan context manager for startup events
+    Lifespan context manager for startup and shutdown events
     """
+    timer = StartupTimer()
+    # One thread per admission slot, so no endpoint class can starve another
+    configure_threadpool()
     # Initialize database on startup
-    init_db()
+    with timer.phase("init_db"):
+        init_db()
+    # Reuse indexes and caches from the last run instead of rebuilding them
+    with timer.phase("load_snapshots"):
+        load_centre_index_snapshot()
+        load_service_area_snapshot()
+        cache = get_cache()
+        if isinstance(cache, MemoryCache):
+            cache.load_snapshot()
+        load_tracking_snapshot()
+    # Refresh the centre index if centres changed while we were down, and
+    # bring the service-area grid up to date in the background
+    with timer.phase("centre_index"):
+        db = SessionLocal()
+        try:
+            request_service_area_sync(get_centre_index(db))
+        finally:
+            db.close()
+    # Keep weather for active regions fresh in the background
+    weather_prefetcher.start()
+    # Take failed OSRM backends out of rotation and back in once they recover
+    osrm_pool.start_health_checks()
+    snapshot_task = asyncio.create_task(snapshot_periodically()) if SNAPSHOT_INTERVAL > 0 else None
+    timer.finish()
     yield
+    if snapshot_task is not None:
+        snapshot_task.cancel()
+    await weather_prefetcher.stop()
+    await asyncio.to_thread(osrm_pool.stop_health_checks)
+    save_snapshots()
 
 
 app = FastAPI(
@@ -21,6 +80,14 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Per-endpoint-class concurrency pools with load shedding (inside CORS, so
+# 429/503 responses still carry CORS headers)
+app.add_middleware(AdmissionMiddleware)
+
+# Request spans -> Server-Timing header and optional OTLP file export (outside
+# admission control, so queueing counts towards "total")
+app.add_middleware(TracingMiddleware)
+
 # Add CORS middleware to allow frontend requests
 app.add_middleware(
     CORSMiddleware,
@@ -28,11 +95,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Sync-Cursor", "Retry-After", "X-Profile-Id", "Server-Timing"],
 )
 
 app.include_router(route.router)
+app.include_router(tracking.router)
 app.include_router(relief_centre.router)
 app.include_router(weather.router)
+app.include_router(isochrone.router)
+app.include_router(closures.router)
+app.include_router(metrics.router)
+app.include_router(admin.router)
 
 @app.get("/health")
 def health_check():
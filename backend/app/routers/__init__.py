@@ -1,5 +1,5 @@
 # Router modules
-from app.routers import route, relief_centre, weather
+from app.routers import route, relief_centre, weather, isochrone, closures, metrics, admin, tracking
 
-__all__ = ["route", "relief_centre", "weather"]
+__all__ = ["route", "relief_centre", "weather", "isochrone", "closures", "metrics", "admin", "tracking"]
 
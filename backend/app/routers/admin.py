@@ -0,0 +1,59 @@
+"""
+Admin endpoints for request profiles
+"""
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from app.services.profiling import (
+    PROFILE_TOKEN,
+    get_profile,
+    merged_folded,
+    recent_profiles,
+    token_matches
+)
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+
+def _authorize(token: Optional[str]) -> None:
+    if not PROFILE_TOKEN:
+        raise HTTPException(status_code=404, detail="Profiling is not configured (set PROFILE_TOKEN)")
+    if not token_matches(token):
+        raise HTTPException(status_code=403, detail="Invalid profile token")
+
+
+@router.get("/profiles")
+def list_profiles(x_profile_token: Optional[str] = Header(None)):
+    """
+    Recent request profiles, newest first
+    
+    Requires the X-Profile-Token header. Requests are profiled when they
+    send the same header, or when picked by PROFILE_SAMPLE_RATE.
+    """
+    _authorize(x_profile_token)
+    return {"profiles": [session.summary() for session in recent_profiles()]}
+
+
+@router.get("/profiles/folded", response_class=PlainTextResponse)
+def get_merged_profile(
+    path: Optional[str] = Query(None, description="Only profiles of this route, e.g. /relief-centres/nearest"),
+    x_profile_token: Optional[str] = Header(None)
+):
+    """
+    All stored profiles added up, as folded stacks (flamegraph.pl / speedscope input)
+    """
+    _authorize(x_profile_token)
+    return merged_folded(path)
+
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+def get_profile_folded(profile_id: int, x_profile_token: Optional[str] = Header(None)):
+    """
+    One profile as folded stacks: one "frame;frame;... count" line per
+    distinct stack, counts in samples of PROFILE_INTERVAL_MS
+    """
+    _authorize(x_profile_token)
+    session = get_profile(profile_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Profile not found (it may have been evicted)")
+    return session.folded()
@@ -0,0 +1,30 @@
+"""
+API endpoints for road closures
+"""
+from fastapi import APIRouter
+from typing import List
+from app.schemas.closures import RoadClosure, RoadClosuresResponse
+from app.services.road_closures import get_closures, set_closures
+from app.services.profiling import ProfiledRoute
+
+router = APIRouter(prefix="/closures", tags=["Road Closures"], route_class=ProfiledRoute)
+
+
+@router.get("/", response_model=RoadClosuresResponse)
+def list_road_closures():
+    """
+    Get the current road closures
+    """
+    version, closures = get_closures()
+    return RoadClosuresResponse(version=version, closures=closures)
+
+
+@router.put("/", response_model=RoadClosuresResponse)
+def replace_road_closures(closures: List[RoadClosure]):
+    """
+    Replace all road closures
+    
+    Cached isochrones are recomputed on next use.
+    """
+    version = set_closures([c.model_dump() for c in closures])
+    return RoadClosuresResponse(version=version, closures=closures)
@@ -0,0 +1,117 @@
+"""
+API endpoints for travel-time isochrones and coverage gaps
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from typing import Optional
+from app.database import get_db
+from app.schemas.isochrone import (
+    IsochroneResponse,
+    CoverageGapResponse,
+)
+from app.services.isochrone_service import (
+    get_isochrone_for_centre,
+    get_isochrone_for_all_centres,
+    get_coverage_gaps,
+    RegionTooLargeError
+)
+from app.services.profiling import ProfiledRoute
+
+router = APIRouter(prefix="/isochrones", tags=["Isochrones"], route_class=ProfiledRoute)
+
+
+@router.get("/", response_model=IsochroneResponse)
+def get_all_centres_isochrone(
+    max_minutes: float = Query(30, gt=0, le=180),
+    db: Session = Depends(get_db)
+):
+    """
+    Travel time to the nearest active relief centre over the whole region
+    
+    Query Parameters:
+    - max_minutes: Largest travel time to include
+    
+    Returns:
+    - cells: Adaptive travel-time raster (seconds)
+    - bands: GeoJSON polygons per travel-time band
+    - closures_approximate: Road closures were only applied to the cells
+      inside them, not to routes through them (no embedded road graph)
+    """
+    try:
+        return get_isochrone_for_all_centres(db, max_minutes)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Routing service error: {str(e)}"
+        )
+
+
+@router.get("/coverage-gaps", response_model=CoverageGapResponse)
+def get_coverage_gaps_endpoint(
+    threshold_minutes: float = Query(20, gt=0, le=180),
+    min_lat: Optional[float] = Query(None, ge=-90, le=90),
+    min_lng: Optional[float] = Query(None, ge=-180, le=180),
+    max_lat: Optional[float] = Query(None, ge=-90, le=90),
+    max_lng: Optional[float] = Query(None, ge=-180, le=180),
+    db: Session = Depends(get_db)
+):
+    """
+    Areas more than threshold_minutes away from every active relief centre
+    
+    Query Parameters:
+    - threshold_minutes: Travel time beyond which an area counts as a gap
+    - min_lat, min_lng, max_lat, max_lng: Optional region to analyse
+      (defaults to the area around all active centres); all four or none,
+      at most ISOCHRONE_MAX_CELLS grid cells
+    
+    closures_approximate in the response is set when road closures could
+    only be applied to the cells inside them (no embedded road graph), in
+    which case gaps caused by routes through them are missing.
+    """
+    bbox = (min_lat, min_lng, max_lat, max_lng)
+    if all(v is None for v in bbox):
+        bbox = None
+    elif any(v is None for v in bbox):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Give all of min_lat, min_lng, max_lat and max_lng, or none of them"
+        )
+    elif min_lat >= max_lat or min_lng >= max_lng:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="min_lat/min_lng must be smaller than max_lat/max_lng"
+        )
+    try:
+        return get_coverage_gaps(db, threshold_minutes, bbox)
+    except RegionTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Routing service error: {str(e)}"
+        )
+
+
+@router.get("/centres/{centre_id}", response_model=IsochroneResponse)
+def get_centre_isochrone_endpoint(
+    centre_id: int,
+    max_minutes: float = Query(30, gt=0, le=180),
+    db: Session = Depends(get_db)
+):
+    """
+    Travel time to a single relief centre
+    """
+    try:
+        return get_isochrone_for_centre(db, centre_id, max_minutes)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Routing service error: {str(e)}"
+        )
+
@@ -0,0 +1,16 @@
+"""
+Metrics endpoint (Prometheus text format)
+"""
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.services.metrics import render_prometheus
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Internal counters and gauges, e.g. upstream quota usage
+    """
+    return render_prometheus()
@@ -2,37 +2,151 @@
 API endpoints for relief centres
 """
 import json
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
-from typing import List
-from app.database import get_db, ReliefCentre, ReliefRequest, ReliefRequestStatus
+from typing import List, Optional
+from app.database import get_db, ReliefCentre, ReliefCentreStatus, ReliefRequest, ReliefRequestStatus
 from app.schemas.relief_centre import (
     ReliefCentreResponse,
     NearestReliefCentreRequest,
     NearestReliefCentreResponse,
+    RankedReliefCentre,
+    RankedReliefCentresResponse,
     ReliefRequestCreate,
     ReliefRequestResponse,
+    RequestClustersResponse,
+    RequestStatusTransition,
+    RequestStatusTransitionResponse,
 )
 from app.services.relief_centre_service import (
     get_all_active_relief_centres,
-    find_nearest_relief_centre
+    get_relief_centres_in_bbox,
+    get_relief_requests_in_bbox,
+    get_relief_centres_changed_since,
+    get_relief_requests_changed_since,
+    find_nearest_relief_centre,
+    quantize_origin,
+    rank_relief_centres
 )
+from app.services.change_tracking import (
+    SYNC_CURSOR_HEADER,
+    change_cursor,
+    etag_matches,
+    make_etag
+)
+from app.services.request_aggregation import aggregate_requests, invalidate_request_clusters
+from app.services.request_status import transition_requests
+from app.services.profiling import ProfiledRoute
+
+router = APIRouter(prefix="/relief-centres", tags=["Relief Centres"], route_class=ProfiledRoute)
+
+# Upper bound on rows returned by the viewport listings
+MAX_VIEWPORT_RESULTS = 50000
+# Upper bound on rows returned by one since= sync page
+MAX_SYNC_RESULTS = 50000
+# Upper bound on ranked alternatives (and on expanded routes) per request
+MAX_RANKED_CENTRES = 10
+
+
+def _request_response(req: ReliefRequest) -> ReliefRequestResponse:
+    supplies_list = json.loads(req.supplies) if isinstance(req.supplies, str) else req.supplies
+    return ReliefRequestResponse(
+        id=req.id,
+        relief_centre_id=req.relief_centre_id,
+        latitude=req.latitude,
+        longitude=req.longitude,
+        supplies=supplies_list,
+        status=req.status.value,
+        created_at=req.created_at.isoformat() if req.created_at else "",
+        version=req.version,
+    )
+
+
+def _not_modified(response: Response, if_none_match: Optional[str], etag: str, cursor: int) -> Optional[Response]:
+    """Set the caching headers; return a 304 response if the client's copy is current"""
+    headers = {"ETag": etag, SYNC_CURSOR_HEADER: str(cursor), "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+def _sync_cursor(rows: list, limit: int, cursor: int) -> int:
+    """Cursor for the next since= request: the last row's version if the page is full"""
+    return rows[-1].version if len(rows) >= limit else cursor
+
 
-router = APIRouter(prefix="/relief-centres", tags=["Relief Centres"])
+def _viewport(min_lat: float, min_lng: float, max_lat: float, max_lng: float):
+    if min_lat > max_lat or min_lng > max_lng:
+        raise HTTPException(status_code=400, detail="Invalid viewport bounds")
+    return min_lat, min_lng, max_lat, max_lng
 
 
 @router.get("/", response_model=List[ReliefCentreResponse])
-def get_relief_centres(db: Session = Depends(get_db)):
+def get_relief_centres(
+    response: Response,
+    since: Optional[int] = Query(None, ge=0),
+    limit: int = Query(5000, ge=1, le=MAX_SYNC_RESULTS),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
     """
     Get all active relief centres
     
     Returns a list of all relief centres with status='active'
+    
+    Query Parameters:
+    - since (optional): Sync cursor from a previous response's X-Sync-Cursor
+      header; only centres changed after it are returned, whatever their
+      status, ordered by version
+    - limit: Maximum number of centres per since= page; a full page's
+      cursor points at its last centre
+    
+    Responses carry an ETag; a request whose If-None-Match matches gets 304.
     """
-    centres = get_all_active_relief_centres(db)
+    cursor = change_cursor(db, "relief_centres")
+    if since is None:
+        etag = make_etag("relief_centres", cursor)
+        not_modified = _not_modified(response, if_none_match, etag, cursor)
+        if not_modified is not None:
+            return not_modified
+        return get_all_active_relief_centres(db)
+
+    etag = make_etag("relief_centres", cursor, f"since{since}", f"limit{limit}")
+    not_modified = _not_modified(response, if_none_match, etag, cursor)
+    if not_modified is not None:
+        return not_modified
+    centres = get_relief_centres_changed_since(db, since, cursor, limit)
+    response.headers[SYNC_CURSOR_HEADER] = str(_sync_cursor(centres, limit, cursor))
     return centres
 
 
+@router.get("/within", response_model=List[ReliefCentreResponse])
+def get_relief_centres_within(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lng: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lng: float = Query(..., ge=-180, le=180),
+    centre_status: Optional[ReliefCentreStatus] = Query(ReliefCentreStatus.ACTIVE, alias="status"),
+    limit: int = Query(5000, ge=1, le=MAX_VIEWPORT_RESULTS),
+    db: Session = Depends(get_db)
+):
+    """
+    Get relief centres inside a map viewport
+    
+    Query Parameters:
+    - min_lat, min_lng, max_lat, max_lng: Viewport bounds
+    - status: Centre status to include (default active)
+    - limit: Maximum number of centres
+    
+    Uses the R*Tree spatial index, so the cost depends on the number of
+    centres in view rather than the total.
+    """
+    bbox = _viewport(min_lat, min_lng, max_lat, max_lng)
+    return get_relief_centres_in_bbox(db, bbox, centre_status, limit)
+
+
 @router.post("/nearest", response_model=NearestReliefCentreResponse)
 def find_nearest_relief_centre_endpoint(
     request: NearestReliefCentreRequest,
@@ -95,6 +209,80 @@ def find_nearest_relief_centre_endpoint(
         )
 
 
+@router.get("/nearest", response_model=RankedReliefCentresResponse)
+def rank_relief_centres_endpoint(
+    response: Response,
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    k: int = Query(3, ge=1, le=MAX_RANKED_CENTRES),
+    expand: Optional[List[int]] = Query(None, max_length=MAX_RANKED_CENTRES),
+    min_capacity: Optional[int] = Query(None, ge=0),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Get the k best relief centres by road travel time, as alternatives
+    
+    For when the nearest centre is full or can't be reached: returns up to k
+    active centres ranked by ETA with their capacity and status.
+    
+    Query Parameters:
+    - latitude, longitude: User location, rounded to a ~110 m grid; ETAs are
+      measured from the rounded point returned as "origin"
+    - k: Number of centres (default 3)
+    - expand: Centre id to include the full route for (repeatable)
+    - min_capacity: Skip centres with a known capacity below this
+    
+    The ranking comes from one OSRM table call over the closest centres in
+    the spatial index and is cached per rounded origin until the centres
+    change. Responses carry an ETag; a request whose If-None-Match matches
+    gets 304.
+    
+    Errors:
+    - 404: No active relief centres found
+    - 503: OSRM service unavailable
+    """
+    lat, lng = quantize_origin(latitude, longitude)
+    expand_ids = sorted(set(expand or ()))
+    cursor = change_cursor(db, "relief_centres")
+    etag = make_etag(
+        "relief_centres", cursor, f"nearest{lat}_{lng}", f"k{k}",
+        f"cap{min_capacity}" if min_capacity is not None else None,
+        "expand" + ".".join(map(str, expand_ids)) if expand_ids else None
+    )
+    not_modified = _not_modified(response, if_none_match, etag, cursor)
+    if not_modified is not None:
+        return not_modified
+
+    try:
+        result = rank_relief_centres(db, lat, lng, k, expand_ids, min_capacity)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Routing service error: {str(e)}"
+        )
+
+    return RankedReliefCentresResponse(
+        origin=result["origin"],
+        centres=[
+            RankedReliefCentre(
+                relief_centre=ReliefCentreResponse.model_validate(entry["relief_centre"]),
+                route=entry["route"],
+                distance=entry["distance"],
+                duration=entry["duration"],
+                distance_formatted=entry["distance_formatted"],
+                duration_formatted=entry["duration_formatted"]
+            )
+            for entry in result["centres"]
+        ]
+    )
+
+
 @router.post("/requests", response_model=ReliefRequestResponse)
 def create_relief_request(
     body: ReliefRequestCreate,
@@ -117,48 +305,123 @@ def create_relief_request(
     db.add(req)
     db.commit()
     db.refresh(req)
-    supplies_list = json.loads(req.supplies) if isinstance(req.supplies, str) else req.supplies
-    return ReliefRequestResponse(
-        id=req.id,
-        relief_centre_id=req.relief_centre_id,
-        latitude=req.latitude,
-        longitude=req.longitude,
-        supplies=supplies_list,
-        status=req.status.value,
-        created_at=req.created_at.isoformat() if req.created_at else "",
-    )
+    invalidate_request_clusters()
+    return _request_response(req)
+
+
+@router.post("/requests/status", response_model=RequestStatusTransitionResponse)
+def transition_request_status(
+    transition: RequestStatusTransition,
+    db: Session = Depends(get_db)
+):
+    """
+    Move a batch of relief requests to a new status (e.g. after a delivery run)
+    
+    Input:
+    - ids: Requests to change (up to 1000)
+    - status: pending, in_progress or fulfilled
+    - relief_centre_id (optional): Only change requests of this centre
+    
+    Allowed transitions: pending -> in_progress/fulfilled,
+    in_progress -> pending/fulfilled; fulfilled is final.
+    
+    The batch is applied in one transaction. Each id gets an outcome:
+    updated, unchanged, not_found, wrong_centre, invalid_transition, or
+    conflict (changed by someone else meanwhile).
+    """
+    return transition_requests(db, transition.ids, transition.status, transition.relief_centre_id)
+
+
+@router.get("/requests", response_model=List[ReliefRequestResponse])
+def get_requests_within(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lng: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lng: float = Query(..., ge=-180, le=180),
+    request_status: Optional[List[ReliefRequestStatus]] = Query(None, alias="status"),
+    limit: int = Query(5000, ge=1, le=MAX_VIEWPORT_RESULTS),
+    db: Session = Depends(get_db)
+):
+    """
+    Get relief requests inside a map viewport, newest first
+    
+    Query Parameters:
+    - min_lat, min_lng, max_lat, max_lng: Viewport bounds
+    - status (optional, repeatable): Only requests in these statuses
+    - limit: Maximum number of requests
+    
+    Uses the R*Tree spatial index; for zoomed-out views use
+    /requests/clusters instead.
+    """
+    bbox = _viewport(min_lat, min_lng, max_lat, max_lng)
+    return [_request_response(req) for req in get_relief_requests_in_bbox(db, bbox, request_status, limit)]
+
+
+# Declared before /{centre_id}/requests so the static path is matched first
+@router.get("/requests/clusters", response_model=RequestClustersResponse)
+def get_request_clusters(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lng: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lng: float = Query(..., ge=-180, le=180),
+    zoom: int = Query(12, ge=0, le=20),
+    request_status: Optional[List[ReliefRequestStatus]] = Query(None, alias="status"),
+    db: Session = Depends(get_db)
+):
+    """
+    Relief requests in a map viewport, aggregated into grid clusters
+    
+    Query Parameters:
+    - min_lat, min_lng, max_lat, max_lng: Viewport bounds
+    - zoom: Map zoom level (0-20), sets the cluster cell size
+    - status (optional, repeatable): Only count requests in these statuses
+    
+    Returns:
+    - One cluster per occupied cell with its centroid, cell bounds, request
+      count, and counts by status and supply type
+    """
+    bbox = _viewport(min_lat, min_lng, max_lat, max_lng)
+    return aggregate_requests(db, bbox, zoom, request_status)
 
 
 @router.get("/{centre_id}/requests", response_model=List[ReliefRequestResponse])
 def get_requests_for_centre(
     centre_id: int,
+    response: Response,
+    since: Optional[int] = Query(None, ge=0),
+    limit: int = Query(5000, ge=1, le=MAX_SYNC_RESULTS),
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
     """
     List all requests for a relief centre (for volunteers working at that centre).
+    
+    With since=<cursor> only requests changed after the cursor are returned,
+    ordered by version (see GET /relief-centres/). Responses carry an ETag
+    and honour If-None-Match.
     """
     centre = db.query(ReliefCentre).filter(ReliefCentre.id == centre_id).first()
     if not centre:
         raise HTTPException(status_code=404, detail="Relief centre not found")
-    requests = (
-        db.query(ReliefRequest)
-        .filter(ReliefRequest.relief_centre_id == centre_id)
-        .order_by(desc(ReliefRequest.created_at))
-        .all()
-    )
-    result = []
-    for req in requests:
-        supplies_list = json.loads(req.supplies) if isinstance(req.supplies, str) else req.supplies
-        result.append(
-            ReliefRequestResponse(
-                id=req.id,
-                relief_centre_id=req.relief_centre_id,
-                latitude=req.latitude,
-                longitude=req.longitude,
-                supplies=supplies_list,
-                status=req.status.value,
-                created_at=req.created_at.isoformat() if req.created_at else "",
-            )
+    cursor = change_cursor(db, "relief_requests")
+    if since is None:
+        etag = make_etag("relief_requests", cursor, f"centre{centre_id}")
+        not_modified = _not_modified(response, if_none_match, etag, cursor)
+        if not_modified is not None:
+            return not_modified
+        requests = (
+            db.query(ReliefRequest)
+            .filter(ReliefRequest.relief_centre_id == centre_id)
+            .order_by(desc(ReliefRequest.created_at))
+            .all()
         )
-    return result
+        return [_request_response(req) for req in requests]
+
+    etag = make_etag("relief_requests", cursor, f"centre{centre_id}", f"since{since}", f"limit{limit}")
+    not_modified = _not_modified(response, if_none_match, etag, cursor)
+    if not_modified is not None:
+        return not_modified
+    requests = get_relief_requests_changed_since(db, since, cursor, centre_id, limit)
+    response.headers[SYNC_CURSOR_HEADER] = str(_sync_cursor(requests, limit, cursor))
+    return [_request_response(req) for req in requests]
 
@@ -1,14 +1,20 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
 from app.schemas.route import RouteRequest, RouteResponse
-from app.services.osrm_service import get_route
+from app.services.osrm_service import get_route_geometry, route_response_json
+from app.services.profiling import ProfiledRoute
 
-router = APIRouter(prefix="/route", tags=["Routing"])
+router = APIRouter(prefix="/route", tags=["Routing"], route_class=ProfiledRoute)
 
 @router.post("/", response_model=RouteResponse)
 def compute_route(request: RouteRequest):
-    return get_route(
+    # Rendered directly from the geometry arrays; the body matches RouteResponse
+    geometry, distance, duration = get_route_geometry(
         request.start_lat,
         request.start_lng,
         request.end_lat,
         request.end_lng
     )
+    return Response(
+        content=route_response_json(geometry, distance, duration),
+        media_type="application/json"
+    )
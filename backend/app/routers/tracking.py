@@ -0,0 +1,91 @@
+"""
+API endpoints for route tracking sessions
+"""
+from fastapi import APIRouter, HTTPException, Response, status
+from app.schemas.tracking import TrackingPosition, TrackingResponse, TrackingStart
+from app.services.route_tracking import (
+    TrackingSessionNotFound,
+    end_tracking,
+    get_tracking,
+    start_tracking,
+    update_position
+)
+from app.services.profiling import ProfiledRoute
+
+router = APIRouter(prefix="/route/sessions", tags=["Route Tracking"], route_class=ProfiledRoute)
+
+
+def _not_found() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Tracking session not found or expired"
+    )
+
+
+@router.post("/", response_model=TrackingResponse, status_code=status.HTTP_201_CREATED)
+def start_tracking_session(request: TrackingStart):
+    """
+    Start following a vehicle along a route
+    
+    Computes the route and returns it with a session_id. Send the vehicle's
+    positions to /route/sessions/{session_id}/positions; the route is only
+    recomputed when the vehicle leaves it or a road closure blocks the road
+    ahead.
+    
+    Errors:
+    - 503: Routing service unavailable
+    """
+    try:
+        return start_tracking(request.start_lat, request.start_lng, request.end_lat, request.end_lng)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Routing service error: {str(e)}"
+        )
+
+
+@router.post("/{session_id}/positions", response_model=TrackingResponse)
+def report_position(session_id: str, position: TrackingPosition):
+    """
+    Report the vehicle's current position
+    
+    Returns the remaining distance and ETA from the position matched onto
+    the route. "route" is only set when status is "rerouted"; the client
+    should then replace the displayed route.
+    
+    Errors:
+    - 404: Unknown or expired session
+    """
+    try:
+        return update_position(session_id, position.latitude, position.longitude)
+    except TrackingSessionNotFound:
+        raise _not_found()
+
+
+@router.get("/{session_id}", response_model=TrackingResponse)
+def get_tracking_session(session_id: str):
+    """
+    Get a session's state and active route (e.g. after reconnecting)
+    
+    Errors:
+    - 404: Unknown or expired session
+    """
+    try:
+        return get_tracking(session_id)
+    except TrackingSessionNotFound:
+        raise _not_found()
+
+
+@router.delete("/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+def end_tracking_session(session_id: str):
+    """
+    End a session
+    
+    Errors:
+    - 404: Unknown or expired session
+    """
+    try:
+        end_tracking(session_id)
+    except TrackingSessionNotFound:
+        raise _not_found()
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -2,10 +2,20 @@
 Weather API endpoints
 """
 from fastapi import APIRouter, HTTPException
-from app.schemas.weather import WeatherRequest, WeatherData, RouteWeatherRequest, RouteWeatherResponse
+from app.schemas.weather import (
+    WeatherRequest,
+    WeatherData,
+    RouteWeatherRequest,
+    RouteWeatherResponse,
+    RouteForecastRequest
+)
 from app.services.weather_service import get_weather_data, get_weather_along_route
+from app.services.osrm_service import get_route_geometry
+from app.services.route_geometry import RouteGeometry
+from app.services.upstream_scheduler import Priority
+from app.services.profiling import ProfiledRoute
 
-router = APIRouter(prefix="/weather", tags=["Weather"])
+router = APIRouter(prefix="/weather", tags=["Weather"], route_class=ProfiledRoute)
 
 
 @router.get("/", response_model=WeatherData)
@@ -21,7 +31,7 @@ def get_current_weather(latitude: float, longitude: float):
     - Current weather information including temperature, condition, rainfall, alerts
     """
     try:
-        weather = get_weather_data(latitude, longitude)
+        weather = get_weather_data(latitude, longitude, Priority.DASHBOARD)
         return WeatherData(**weather)
     except Exception as e:
         raise HTTPException(
@@ -43,7 +53,7 @@ def get_weather_by_coordinates(request: WeatherRequest):
     - Current weather information
     """
     try:
-        weather = get_weather_data(request.latitude, request.longitude)
+        weather = get_weather_data(request.latitude, request.longitude, Priority.DASHBOARD)
         return WeatherData(**weather)
     except Exception as e:
         raise HTTPException(
@@ -59,13 +69,67 @@ def get_route_weather(request: RouteWeatherRequest):
     
     Body:
     - coordinates: List of [lng, lat] coordinate pairs representing the route
+    - durations / duration (optional): Per-segment or total travel time in
+      seconds; when given, each sample reports the forecast for its ETA
+    - departure_time (optional): Unix time the trip starts, default now
     
     Returns:
     - Weather data for sampled points along the route
     - Summary statistics (average temperature, max rainfall, alerts)
     """
     try:
-        result = get_weather_along_route(request.coordinates)
+        geometry = RouteGeometry.from_coordinates(request.coordinates)
+        if request.durations is not None:
+            geometry = geometry.with_segment_durations(request.durations)
+        elif request.duration is not None:
+            geometry = geometry.with_total_duration(request.duration)
+        result = get_weather_along_route(
+            geometry,
+            priority=Priority.ROUTING_SAFETY,
+            departure_time=request.departure_time
+        )
+        return RouteWeatherResponse(**result)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to fetch route weather: {str(e)}"
+        )
+
+
+@router.post("/route/forecast", response_model=RouteWeatherResponse)
+def get_route_forecast(request: RouteForecastRequest):
+    """
+    Get forecast weather along the route between two points
+    
+    The route is computed with OSRM and each sample is assigned the forecast
+    for the time the vehicle reaches it, using OSRM's per-segment durations.
+    
+    Body:
+    - start_lat, start_lng, end_lat, end_lng: Route endpoints
+    - departure_time (optional): Unix time the trip starts, default now
+    
+    Returns:
+    - Forecast weather with ETA for sampled points along the route
+    - Summary statistics, including the overall safety status
+    """
+    try:
+        geometry, _, _ = get_route_geometry(
+            request.start_lat,
+            request.start_lng,
+            request.end_lat,
+            request.end_lng
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Routing service error: {str(e)}"
+        )
+    try:
+        result = get_weather_along_route(
+            geometry,
+            priority=Priority.ROUTING_SAFETY,
+            departure_time=request.departure_time
+        )
         return RouteWeatherResponse(**result)
     except Exception as e:
         raise HTTPException(
@@ -0,0 +1,19 @@
+"""
+Schemas for road closure endpoints
+"""
+from pydantic import BaseModel
+from typing import List, Optional
+
+
+class RoadClosure(BaseModel):
+    """A circular area that vehicles can't pass"""
+    latitude: float
+    longitude: float
+    radius_m: float
+    description: Optional[str] = None
+
+
+class RoadClosuresResponse(BaseModel):
+    """Current road closures and their version"""
+    version: int
+    closures: List[RoadClosure]
@@ -0,0 +1,37 @@
+"""
+Schemas for isochrone and coverage-gap endpoints
+"""
+from pydantic import BaseModel
+from typing import List, Optional, Dict, Any
+
+
+class IsochroneCell(BaseModel):
+    """A grid cell with the travel time from its centre point"""
+    latitude: float
+    longitude: float
+    size_deg: float  # Cell edge length in degrees
+    duration: Optional[float] = None  # Travel time in seconds, None if unreachable
+
+
+class IsochroneResponse(BaseModel):
+    """Travel-time raster and band polygons for one or all centres"""
+    centre_ids: List[int]
+    max_minutes: float
+    band_minutes: float
+    # True if road closures could only be applied to the cells inside them
+    # (no embedded road graph), so times of roads through them are too short
+    closures_approximate: bool = False
+    cells: List[IsochroneCell]
+    bands: Dict[str, Any]  # GeoJSON FeatureCollection, one MultiPolygon per band
+
+
+class CoverageGapResponse(BaseModel):
+    """Areas beyond the travel-time threshold from every active centre"""
+    threshold_minutes: float
+    gap_area_km2: float
+    # True if road closures could only be applied to the cells inside them
+    # (no embedded road graph), so gaps caused by them may be missing
+    closures_approximate: bool = False
+    cells: List[IsochroneCell]
+    geojson: Dict[str, Any]  # GeoJSON Feature (MultiPolygon) of all gap cells
+
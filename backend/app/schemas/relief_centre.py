@@ -1,9 +1,10 @@
 """
 Schemas for relief centre API endpoints
 """
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any, List
-from app.database import ReliefCentreStatus
+from app.database import ReliefCentreStatus, ReliefRequestStatus
+from app.schemas.route import Point
 
 
 class ReliefCentreBase(BaseModel):
@@ -23,6 +24,7 @@ class ReliefCentreCreate(ReliefCentreBase):
 class ReliefCentreResponse(ReliefCentreBase):
     """Schema for relief centre response"""
     id: int
+    version: Optional[int] = None  # Change sequence value (see since= listings)
     
     class Config:
         from_attributes = True
@@ -44,6 +46,22 @@ class NearestReliefCentreResponse(BaseModel):
     duration_formatted: str
 
 
+class RankedReliefCentre(BaseModel):
+    """One of the ranked alternatives, with the route only if expanded"""
+    relief_centre: ReliefCentreResponse
+    distance: float  # Distance in meters
+    duration: float  # Duration in seconds
+    distance_formatted: str
+    duration_formatted: str
+    route: Optional[Dict[str, Any]] = None  # Route geometry and summary, for expanded centres
+
+
+class RankedReliefCentresResponse(BaseModel):
+    """Response schema for the best relief centres by ETA"""
+    origin: Point  # Quantized origin the ETAs are measured from
+    centres: List[RankedReliefCentre]  # Fastest first
+
+
 # Relief request schemas (for volunteers to see requests at their centre)
 class ReliefRequestCreate(BaseModel):
     """Schema for creating a relief request (when user confirms on Need Help page)"""
@@ -62,4 +80,42 @@ class ReliefRequestResponse(BaseModel):
     supplies: List[str]
     status: str
     created_at: str
+    version: Optional[int] = None  # Change sequence value (see since= listings)
+
+
+class RequestStatusTransition(BaseModel):
+    """Schema for moving a batch of relief requests to a new status"""
+    ids: List[int] = Field(..., min_length=1, max_length=1000)
+    status: ReliefRequestStatus
+    relief_centre_id: Optional[int] = None  # Only change requests of this centre
+
+
+class RequestTransitionResult(BaseModel):
+    """Outcome for one request of a status transition"""
+    id: int
+    outcome: str  # updated, unchanged, not_found, wrong_centre, invalid_transition, conflict
+    previous_status: Optional[str] = None
+
+
+class RequestStatusTransitionResponse(BaseModel):
+    """Result of a batch status transition"""
+    status: str
+    updated: int
+    results: List[RequestTransitionResult]
+
+
+class RequestCluster(BaseModel):
+    """Relief requests in one grid cell of the map view"""
+    latitude: float  # Centroid of the requests
+    longitude: float
+    count: int
+    bounds: List[float]  # [min_lat, min_lng, max_lat, max_lng] of the cell
+    by_status: Dict[str, int]
+    by_supply: Dict[str, int]
+
 
+class RequestClustersResponse(BaseModel):
+    """Aggregated relief requests for a viewport"""
+    cell_size: float  # Cell size in degrees
+    total: int
+    clusters: List[RequestCluster]
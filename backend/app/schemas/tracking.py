@@ -0,0 +1,45 @@
+"""
+Schemas for route tracking session endpoints
+"""
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
+
+
+class TrackingStart(BaseModel):
+    """Start a tracking session with a route from start to end"""
+    start_lat: float = Field(..., ge=-90, le=90)
+    start_lng: float = Field(..., ge=-180, le=180)
+    end_lat: float = Field(..., ge=-90, le=90)
+    end_lng: float = Field(..., ge=-180, le=180)
+
+
+class TrackingPosition(BaseModel):
+    """Current position of the tracked vehicle"""
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+
+
+class TrackingHazard(BaseModel):
+    """A road closure on the remaining route"""
+    latitude: float
+    longitude: float
+    radius_m: float
+    description: Optional[str] = None
+    distance_ahead: float  # Meters along the route from the vehicle
+
+
+class TrackingResponse(BaseModel):
+    """State of a tracking session after a position update"""
+    session_id: str
+    status: str  # on_route, off_route, rerouted or arrived
+    reroute_reason: Optional[str] = None  # off_route or hazard, when rerouted
+    route_version: int  # Increases with every re-route
+    distance_from_route: float  # Meters between the position and the route
+    progress: float  # Meters along the active route
+    remaining_distance: float  # Meters
+    remaining_duration: float  # Seconds
+    remaining_distance_formatted: str
+    remaining_duration_formatted: str
+    hazards: List[TrackingHazard]
+    route: Optional[Dict[str, Any]] = None  # Active route, when new (or on GET)
+    reroutes: int
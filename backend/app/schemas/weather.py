@@ -35,6 +35,20 @@ class WeatherRequest(BaseModel):
 class RouteWeatherRequest(BaseModel):
     """Request schema for route weather endpoint"""
     coordinates: List[List[float]]  # List of [lng, lat] pairs
+    # Optional travel times enabling forecast mode: per-segment seconds
+    # (OSRM duration annotations) or the route's total duration
+    durations: Optional[List[float]] = None
+    duration: Optional[float] = None
+    departure_time: Optional[int] = None  # Unix time, default now
+
+
+class RouteForecastRequest(BaseModel):
+    """Request schema for forecast weather along a computed route"""
+    start_lat: float
+    start_lng: float
+    end_lat: float
+    end_lng: float
+    departure_time: Optional[int] = None  # Unix time, default now
 
 
 class RouteWeatherResponse(BaseModel):
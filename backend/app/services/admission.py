@@ -0,0 +1,278 @@
+"""
+Admission control with a separate concurrency pool per endpoint class
+
+All endpoints are sync handlers sharing one threadpool, so a burst of slow
+weather or isochrone calls used to be able to occupy every thread and starve
+emergency routing. AdmissionMiddleware classifies each request into a pool
+before it reaches the app:
+
+- A pool runs at most `concurrency` requests at once and queues at most
+  `max_queue` more, each for at most `queue_timeout` seconds.
+- A full queue is rejected at once with 429, a queue wait that times out
+  with 503; both carry Retry-After, estimated from the pool's recent
+  service time.
+- While a high-priority pool (routing, request intake) has a backlog,
+  low-priority pools run at half their concurrency and don't queue,
+  shedding load (503) until routing catches up.
+
+The threadpool is sized to the sum of the pool limits (see
+configure_threadpool), so each class is guaranteed its threads. Health,
+metrics and docs are never queued.
+
+Pools are configured as ADMISSION_<POOL>=concurrency,max_queue,queue_timeout
+(e.g. ADMISSION_WEATHER=4,8,1); ADMISSION_ENABLED=0 turns it off.
+"""
+import asyncio
+import json
+import math
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from anyio import to_thread
+
+from app.services import metrics
+from app.services.tracing import span
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") != "0"
+
+# name -> (concurrency, max queue, queue timeout in seconds, high priority)
+DEFAULT_POOLS: Dict[str, Tuple[int, int, float, bool]] = {
+    "routing": (16, 64, 10.0, True),
+    "intake": (8, 64, 10.0, True),
+    "listings": (8, 32, 2.0, False),
+    "weather": (8, 16, 2.0, False),
+    "planning": (4, 8, 2.0, False),
+}
+
+# (method or None for any, path prefix, pool), first match wins; unmatched
+# paths (health, metrics, docs) bypass admission control
+ENDPOINT_CLASSES: List[Tuple[Optional[str], str, str]] = [
+    (None, "/route", "routing"),
+    (None, "/relief-centres/nearest", "routing"),
+    ("POST", "/relief-centres/requests", "intake"),
+    (None, "/relief-centres", "listings"),
+    (None, "/closures", "listings"),
+    (None, "/weather", "weather"),
+    (None, "/isochrones", "planning"),
+]
+
+# Weight of the latest request in the pool's average service time
+_SERVICE_TIME_ALPHA = 0.2
+
+metrics.describe("admission_requests_total", "counter", "Requests by endpoint pool and admission outcome")
+metrics.describe("admission_pool_active", "gauge", "Requests currently running in each endpoint pool")
+metrics.describe("admission_pool_queued", "gauge", "Requests waiting for a slot in each endpoint pool")
+metrics.describe("admission_pool_limit", "gauge", "Concurrency limit of each endpoint pool")
+metrics.describe("admission_queue_seconds_total", "counter", "Time admitted requests spent queued per pool")
+
+
+class Rejected(Exception):
+    """A request was not admitted"""
+
+    def __init__(self, status_code: int, outcome: str, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.outcome = outcome  # rejected, shed or timeout (metrics label)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class EndpointPool:
+    """Concurrency limit with a bounded FIFO queue (used from the event loop only)"""
+
+    def __init__(self, name: str, concurrency: int, max_queue: int, queue_timeout: float, high_priority: bool):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.high_priority = high_priority
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.service_time = 0.1  # Moving average of request duration (seconds)
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free for a new arrival"""
+        backlog = self.queued + 1
+        return max(1, math.ceil(backlog * self.service_time / self.concurrency))
+
+    async def acquire(self, brownout: bool) -> float:
+        """
+        Take a slot, queueing if needed
+
+        Args:
+            brownout: High-priority pools are backlogged (only affects
+                low-priority pools)
+
+        Returns:
+            Seconds spent queued
+
+        Raises:
+            Rejected: If the queue is full, the pool is shedding, or the
+                queue wait timed out
+        """
+        limit = self.concurrency
+        if brownout and not self.high_priority:
+            limit = max(1, limit // 2)
+        if self.active < limit and not self._waiters:
+            self.active += 1
+            return 0.0
+        if brownout and not self.high_priority:
+            raise Rejected(503, "shed", f"{self.name} requests are being shed", self.retry_after())
+        if len(self._waiters) >= self.max_queue:
+            raise Rejected(429, "rejected", f"Too many {self.name} requests", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                waiter.cancel()
+                self._discard(waiter)
+                raise Rejected(503, "timeout", f"{self.name} queue wait timed out", self.retry_after())
+        except asyncio.CancelledError:
+            # Client went away: give back a slot handed to us, or leave the queue
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                waiter.cancel()
+                self._discard(waiter)
+            raise
+        return time.monotonic() - started
+
+    def _discard(self, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self, duration: Optional[float] = None) -> None:
+        """Free a slot, handing it straight to the next queued request"""
+        if duration is not None:
+            self.service_time += _SERVICE_TIME_ALPHA * (duration - self.service_time)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot passes to the waiter; active stays the same
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+def _parse_pool(name: str, default: Tuple[int, int, float, bool]) -> EndpointPool:
+    concurrency, max_queue, queue_timeout, high_priority = default
+    value = os.getenv(f"ADMISSION_{name.upper()}", "")
+    if value:
+        try:
+            parts = value.split(",")
+            concurrency, max_queue, queue_timeout = (
+                int(parts[0]),
+                int(parts[1]) if len(parts) > 1 else max_queue,
+                float(parts[2]) if len(parts) > 2 else queue_timeout,
+            )
+        except ValueError:
+            print(f"Warning: Ignoring invalid ADMISSION_{name.upper()}={value!r}")
+    return EndpointPool(name, concurrency, max_queue, queue_timeout, high_priority)
+
+
+class AdmissionController:
+    """The set of endpoint pools and the request classifier"""
+
+    def __init__(self, pools: Dict[str, EndpointPool], classes: List[Tuple[Optional[str], str, str]]):
+        self.pools = pools
+        self.classes = classes
+        self._high_priority = [pool for pool in pools.values() if pool.high_priority]
+        metrics.register_callback("admission_pool_active", self._gauge(lambda pool: pool.active))
+        metrics.register_callback("admission_pool_queued", self._gauge(lambda pool: pool.queued))
+        metrics.register_callback("admission_pool_limit", self._gauge(lambda pool: pool.concurrency))
+
+    def _gauge(self, value):
+        return lambda: {metrics.labels(pool=name): value(pool) for name, pool in self.pools.items()}
+
+    @property
+    def total_concurrency(self) -> int:
+        return sum(pool.concurrency for pool in self.pools.values())
+
+    def classify(self, method: str, path: str) -> Optional[EndpointPool]:
+        for class_method, prefix, pool in self.classes:
+            if (class_method is None or class_method == method) and path.startswith(prefix):
+                return self.pools.get(pool)
+        return None
+
+    def brownout(self) -> bool:
+        """Whether a high-priority pool has requests waiting"""
+        return any(pool.queued for pool in self._high_priority)
+
+
+def build_admission_controller() -> AdmissionController:
+    pools = {name: _parse_pool(name, default) for name, default in DEFAULT_POOLS.items()}
+    return AdmissionController(pools, ENDPOINT_CLASSES)
+
+
+admission_controller = build_admission_controller()
+
+
+def configure_threadpool(controller: AdmissionController = admission_controller, spare: int = 8) -> None:
+    """
+    Size the threadpool that runs sync endpoints to the pools' total
+
+    Must be called from the event loop (e.g. in the app lifespan). The spare
+    threads serve unclassified endpoints and sync dependencies.
+    """
+    limiter = to_thread.current_default_thread_limiter()
+    limiter.total_tokens = max(limiter.total_tokens, controller.total_concurrency + spare)
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying the endpoint pools to HTTP requests"""
+
+    def __init__(self, app, controller: AdmissionController = admission_controller):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSION_ENABLED or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        pool = self.controller.classify(scope["method"], scope["path"])
+        if pool is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            with span("admission.queue", pool=pool.name):
+                waited = await pool.acquire(self.controller.brownout())
+        except Rejected as e:
+            metrics.inc("admission_requests_total", pool=pool.name, outcome=e.outcome)
+            await self._reject(send, e)
+            return
+
+        metrics.inc("admission_requests_total", pool=pool.name, outcome="admitted" if not waited else "queued")
+        if waited:
+            metrics.inc("admission_queue_seconds_total", waited, pool=pool.name)
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            pool.release(time.monotonic() - started)
+
+    @staticmethod
+    async def _reject(send, error: Rejected) -> None:
+        body = json.dumps({"detail": error.reason}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": error.status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(error.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
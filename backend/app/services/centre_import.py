@@ -0,0 +1,338 @@
+"""
+Streaming bulk import of relief centres from CSV or GeoJSON
+
+Centre lists from district officials arrive as spreadsheets (CSV) or GIS
+exports (GeoJSON FeatureCollection, or newline-delimited GeoJSON). Rows are
+read one at a time, validated, and written in batches, each batch in its own
+transaction:
+
+- Rows with an external_id are upserted: new ids are inserted, known ids
+  are updated only if a field actually changed (so unchanged rows keep
+  their version and delta-sync clients don't re-download them).
+- Rows without an external_id are always inserted.
+- Invalid rows are skipped and reported with their row number.
+
+The R*Tree and version columns are kept up to date by triggers. Afterwards
+rebuild_derived_indexes() refreshes the planner statistics and the
+nearest-centre index snapshot.
+
+CSV columns (header names are case-insensitive):
+    external_id (or id, code), name, latitude (or lat), longitude (or lng,
+    lon), capacity, status (active/inactive, default active)
+GeoJSON: Point features; properties as above, the feature id is used when
+there is no external_id property.
+"""
+import csv
+import json
+import math
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import insert, text, update
+from sqlalchemy.orm import Session
+
+from app.database import ReliefCentre, ReliefCentreStatus, init_spatial_index
+from app.services.centre_index import get_centre_index, save_centre_index_snapshot
+
+IMPORT_BATCH_SIZE = 1000
+# Errors kept in the report; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+_READ_CHUNK = 1 << 16
+
+_FIELD_ALIASES = {
+    "external_id": ("external_id", "id", "code"),
+    "name": ("name",),
+    "latitude": ("latitude", "lat"),
+    "longitude": ("longitude", "lng", "lon"),
+    "capacity": ("capacity",),
+    "status": ("status",),
+}
+_UPDATABLE = ("name", "latitude", "longitude", "capacity", "status")
+
+# (row number, raw fields) as produced by the readers
+RawRow = Tuple[int, Dict[str, Any]]
+
+
+class CentreImportError(ValueError):
+    """A row that can't be imported"""
+
+
+@dataclass
+class ImportReport:
+    """Outcome of an import"""
+    rows: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    duplicates: int = 0  # Repeated external ids (the last row wins)
+    invalid: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    def error(self, row_number: int, message: str) -> None:
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"row {row_number}: {message}")
+
+
+def _pick(raw: Dict[str, Any], name: str) -> Any:
+    for alias in _FIELD_ALIASES[name]:
+        value = raw.get(alias)
+        if value is not None and value != "":
+            return value
+    return None
+
+
+def read_csv_centres(path: str) -> Iterator[RawRow]:
+    """Yield (row number, fields) from a CSV file with a header row"""
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        for number, row in enumerate(reader, start=2):
+            yield number, {(key or "").strip().lower(): value for key, value in row.items()}
+
+
+def _feature_fields(feature: Dict[str, Any]) -> Dict[str, Any]:
+    fields = {key.lower(): value for key, value in (feature.get("properties") or {}).items()}
+    if feature.get("id") is not None and _pick(fields, "external_id") is None:
+        fields["external_id"] = feature["id"]
+    geometry = feature.get("geometry") or {}
+    if geometry.get("type") == "Point":
+        coordinates = geometry.get("coordinates") or []
+        if len(coordinates) >= 2:
+            fields["longitude"], fields["latitude"] = coordinates[0], coordinates[1]
+    else:
+        fields["_geometry_type"] = geometry.get("type")
+    return fields
+
+
+def read_geojson_centres(path: str) -> Iterator[RawRow]:
+    """
+    Yield (feature number, fields) from GeoJSON without loading the whole file
+
+    Handles a FeatureCollection (features are decoded one by one from the
+    "features" array) and newline-delimited GeoJSON (one feature per line).
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8-sig") as f:
+        buffer = f.read(_READ_CHUNK)
+        start = buffer.lstrip()[:1]
+        if start != "{":
+            raise CentreImportError("Not a GeoJSON file")
+        key = buffer.find('"features"')
+        while key < 0 and len(buffer) < 16 * _READ_CHUNK:
+            chunk = f.read(_READ_CHUNK)
+            if not chunk:
+                break
+            buffer += chunk
+            key = buffer.find('"features"')
+        if key < 0:
+            # Newline-delimited features
+            f.seek(0)
+            for number, line in enumerate(f, start=1):
+                if line.strip():
+                    yield number, _feature_fields(json.loads(line))
+            return
+
+        pos = buffer.index("[", key) + 1
+        number = 0
+        eof = False
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer):
+                if eof:
+                    raise CentreImportError("Unterminated features array")
+                chunk = f.read(_READ_CHUNK)
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                feature, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # Feature continues past the buffer: read more and retry
+                chunk = f.read(_READ_CHUNK)
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            number += 1
+            yield number, _feature_fields(feature)
+            pos = end
+
+
+def read_centres(path: str) -> Iterator[RawRow]:
+    """Reader for a file by extension (.csv, .geojson/.json/.geojsonl/.ndjson)"""
+    lower = path.lower()
+    if lower.endswith(".csv"):
+        return read_csv_centres(path)
+    if lower.endswith((".geojson", ".json", ".geojsonl", ".geojsons", ".ndjson")):
+        return read_geojson_centres(path)
+    raise CentreImportError(f"Unsupported file type: {path}")
+
+
+def validate_centre(
+    raw: Dict[str, Any],
+    bbox: Optional[Tuple[float, float, float, float]] = None
+) -> Dict[str, Any]:
+    """
+    Normalise one row into ReliefCentre column values
+
+    Args:
+        raw: Fields as read from the file
+        bbox: Optional (min_lat, min_lng, max_lat, max_lng) the centre must lie in
+
+    Raises:
+        CentreImportError: If the row is invalid
+    """
+    if raw.get("_geometry_type"):
+        raise CentreImportError(f"geometry must be a Point, got {raw['_geometry_type']}")
+    name = _pick(raw, "name")
+    if name is None or not str(name).strip():
+        raise CentreImportError("missing name")
+    try:
+        lat = float(_pick(raw, "latitude"))
+        lng = float(_pick(raw, "longitude"))
+    except (TypeError, ValueError):
+        raise CentreImportError("missing or non-numeric coordinates")
+    if not (math.isfinite(lat) and math.isfinite(lng)):
+        raise CentreImportError("non-finite coordinates")
+    if not -90 <= lat <= 90 or not -180 <= lng <= 180:
+        hint = " (latitude and longitude swapped?)" if -90 <= lng <= 90 and -180 <= lat <= 180 else ""
+        raise CentreImportError(f"coordinates out of range: {lat}, {lng}{hint}")
+    if lat == 0 and lng == 0:
+        raise CentreImportError("coordinates are 0, 0 (missing location?)")
+    if bbox is not None and not (bbox[0] <= lat <= bbox[2] and bbox[1] <= lng <= bbox[3]):
+        swapped = bbox[0] <= lng <= bbox[2] and bbox[1] <= lat <= bbox[3]
+        hint = " (latitude and longitude swapped?)" if swapped else ""
+        raise CentreImportError(f"coordinates outside the import region: {lat}, {lng}{hint}")
+
+    capacity = _pick(raw, "capacity")
+    if capacity is not None:
+        try:
+            capacity = int(float(capacity))
+        except (TypeError, ValueError):
+            raise CentreImportError(f"invalid capacity: {capacity!r}")
+        if capacity < 0:
+            raise CentreImportError(f"negative capacity: {capacity}")
+
+    status = _pick(raw, "status")
+    try:
+        status = ReliefCentreStatus(str(status).strip().lower()) if status is not None else ReliefCentreStatus.ACTIVE
+    except ValueError:
+        raise CentreImportError(f"invalid status: {status!r}")
+
+    external_id = _pick(raw, "external_id")
+    if external_id is not None:
+        external_id = str(external_id).strip()
+        if len(external_id) > 64:
+            raise CentreImportError("external_id longer than 64 characters")
+
+    return {
+        "external_id": external_id or None,
+        "name": str(name).strip()[:255],
+        "latitude": lat,
+        "longitude": lng,
+        "capacity": capacity,
+        "status": status,
+    }
+
+
+def _write_batch(db: Session, batch: List[Dict[str, Any]], report: ImportReport) -> None:
+    # Later rows win when an external id repeats within the batch
+    keyed: Dict[str, Dict[str, Any]] = {}
+    inserts = []
+    for row in batch:
+        if row["external_id"] is None:
+            inserts.append(row)
+        else:
+            if row["external_id"] in keyed:
+                report.duplicates += 1
+            keyed[row["external_id"]] = row
+
+    existing = {}
+    if keyed:
+        existing = {
+            c.external_id: c for c in db.query(
+                ReliefCentre.id, ReliefCentre.external_id, *(getattr(ReliefCentre, f) for f in _UPDATABLE)
+            ).filter(ReliefCentre.external_id.in_(list(keyed)))
+        }
+    updates = []
+    for external_id, row in keyed.items():
+        current = existing.get(external_id)
+        if current is None:
+            inserts.append(row)
+        elif any(getattr(current, f) != row[f] for f in _UPDATABLE):
+            updates.append({"id": current.id, **{f: row[f] for f in _UPDATABLE}})
+        else:
+            report.unchanged += 1
+
+    if inserts:
+        db.execute(insert(ReliefCentre), inserts)
+    if updates:
+        db.execute(update(ReliefCentre), updates)
+    db.commit()
+    report.inserted += len(inserts)
+    report.updated += len(updates)
+
+
+def import_centres(
+    db: Session,
+    rows: Iterator[RawRow],
+    batch_size: int = IMPORT_BATCH_SIZE,
+    bbox: Optional[Tuple[float, float, float, float]] = None,
+    dry_run: bool = False
+) -> ImportReport:
+    """
+    Validate and upsert relief centres in batched transactions
+
+    A failure part-way leaves the earlier batches committed; since rows are
+    matched by external_id, re-running the import is safe.
+
+    Args:
+        db: Database session
+        rows: (row number, fields) from one of the readers
+        batch_size: Rows per transaction
+        bbox: Optional region every centre must lie in
+        dry_run: Only validate, write nothing
+
+    Returns:
+        ImportReport with counts and the first MAX_REPORTED_ERRORS errors
+    """
+    report = ImportReport()
+    batch: List[Dict[str, Any]] = []
+    try:
+        for number, raw in rows:
+            report.rows += 1
+            try:
+                batch.append(validate_centre(raw, bbox))
+            except CentreImportError as e:
+                report.error(number, str(e))
+                continue
+            if len(batch) >= batch_size:
+                if not dry_run:
+                    _write_batch(db, batch, report)
+                batch = []
+        if batch and not dry_run:
+            _write_batch(db, batch, report)
+    except Exception:
+        db.rollback()
+        raise
+    return report
+
+
+def rebuild_derived_indexes(db: Session) -> None:
+    """
+    Refresh what's derived from the centres table after a bulk import
+
+    Re-checks the R*Tree (rows written with triggers disabled are
+    backfilled), updates the planner statistics and rebuilds the
+    nearest-centre index snapshot. The travel-time service area grid is
+    updated by the server in the background once it sees the new centres.
+    """
+    init_spatial_index()
+    db.execute(text("ANALYZE"))
+    db.commit()
+    get_centre_index(db)
+    save_centre_index_snapshot()
@@ -0,0 +1,217 @@
+"""
+Spatial index of active relief centres
+
+Centres are bucketed into a regular lat/lng grid and stored as flat arrays
+sorted by cell, so the index can be snapshotted to disk and memory-mapped on
+the next start. Nearest-candidate queries search rings of cells around the
+query point instead of computing a distance to every centre.
+
+The index is tagged with the relief_centres change cursor it was checked at
+and with a fingerprint of the active centres computed in SQL (count and
+coordinate sums). While the cursor hasn't moved the index is current after a
+single primary-key read; only when it has is the fingerprint recomputed, and
+the index is rebuilt only if that changed too (an edit to, say, a centre's
+capacity doesn't touch the index).
+"""
+import math
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.database import ReliefCentre, ReliefCentreStatus
+from app.services.change_tracking import change_cursor
+from app.services.snapshots import read_snapshot, write_snapshot
+
+# Grid cell size in degrees (~5 km)
+CENTRE_INDEX_CELL_DEG = 0.05
+# Give up on ring search beyond this many rings and scan everything
+_MAX_RINGS = 40
+_SNAPSHOT_NAME = "centre_index"
+
+
+def active_centres_fingerprint(db: Session) -> str:
+    """Cheap summary of the active centres that changes whenever any of them does"""
+    count, max_id, lat_sum, lng_sum, weighted = db.query(
+        func.count(ReliefCentre.id),
+        func.max(ReliefCentre.id),
+        func.total(ReliefCentre.latitude),
+        func.total(ReliefCentre.longitude),
+        func.total(ReliefCentre.id * (ReliefCentre.latitude + ReliefCentre.longitude)),
+    ).filter(ReliefCentre.status == ReliefCentreStatus.ACTIVE).one()
+    return f"{count}:{max_id}:{lat_sum:.6f}:{lng_sum:.6f}:{weighted:.6f}"
+
+
+def _haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = (
+        math.sin(dlat / 2) ** 2 +
+        math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
+        math.sin(dlon / 2) ** 2
+    )
+    return 6371 * 2 * math.asin(math.sqrt(a))
+
+
+class CentreIndex:
+    """Grid-bucketed, array-backed index of centre ids and coordinates"""
+
+    def __init__(self, fingerprint: str, cell_deg: float, arrays: Dict[str, Sequence], cursor: int = -1):
+        self.fingerprint = fingerprint
+        # relief_centres change cursor at which the fingerprint was last confirmed
+        self.cursor = cursor
+        self.cell_deg = cell_deg
+        self.columns = int(math.ceil(360 / cell_deg))
+        self.cell_keys = arrays["cell_keys"]
+        self.cell_offsets = arrays["cell_offsets"]
+        self.ids = arrays["ids"]
+        self.lats = arrays["lats"]
+        self.lngs = arrays["lngs"]
+        self._coordinates: Optional[Dict[int, Tuple[float, float]]] = None
+
+    @classmethod
+    def build(
+        cls,
+        fingerprint: str,
+        centres: List[Tuple[int, float, float]],
+        cell_deg: float = CENTRE_INDEX_CELL_DEG,
+        cursor: int = -1
+    ):
+        """Build from (id, lat, lng) tuples"""
+        columns = int(math.ceil(360 / cell_deg))
+
+        def key(lat, lng):
+            return int((lat + 90) // cell_deg) * columns + int((lng + 180) // cell_deg)
+
+        ordered = sorted(centres, key=lambda c: key(c[1], c[2]))
+        cell_keys = array("q")
+        cell_offsets = array("I")
+        for i, (_, lat, lng) in enumerate(ordered):
+            k = key(lat, lng)
+            if not cell_keys or cell_keys[-1] != k:
+                cell_keys.append(k)
+                cell_offsets.append(i)
+        cell_offsets.append(len(ordered))
+        return cls(fingerprint, cell_deg, {
+            "cell_keys": cell_keys,
+            "cell_offsets": cell_offsets,
+            "ids": array("i", (c[0] for c in ordered)),
+            "lats": array("d", (c[1] for c in ordered)),
+            "lngs": array("d", (c[2] for c in ordered)),
+        }, cursor)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def coordinates(self) -> Dict[int, Tuple[float, float]]:
+        """centre id -> (lat, lng) for every indexed centre"""
+        if self._coordinates is None:
+            self._coordinates = {
+                self.ids[i]: (self.lats[i], self.lngs[i]) for i in range(len(self.ids))
+            }
+        return self._coordinates
+
+    def _cell_range(self, key: int) -> range:
+        i = bisect_left(self.cell_keys, key)
+        if i == len(self.cell_keys) or self.cell_keys[i] != key:
+            return range(0)
+        return range(self.cell_offsets[i], self.cell_offsets[i + 1])
+
+    def nearest(self, lat: float, lng: float, k: int) -> List[Tuple[int, float]]:
+        """
+        The k centres closest to a point by straight-line distance
+
+        Returns:
+            (centre id, distance in km) pairs, closest first
+        """
+        if not len(self.ids) or k <= 0:
+            return []
+        row = int((lat + 90) // self.cell_deg)
+        col = int((lng + 180) // self.cell_deg)
+        found: List[int] = []
+        enough_at = None
+        for ring in range(_MAX_RINGS + 1):
+            # One extra ring after reaching k, since closer centres may sit in
+            # a neighbouring cell of the next ring
+            if enough_at is not None and ring > enough_at + 1:
+                break
+            for dr in range(-ring, ring + 1):
+                for dc in range(-ring, ring + 1):
+                    if max(abs(dr), abs(dc)) == ring:
+                        found.extend(self._cell_range((row + dr) * self.columns + (col + dc)))
+            if enough_at is None and len(found) >= k:
+                enough_at = ring
+        if len(found) < k:
+            found = range(len(self.ids))
+        ranked = sorted(
+            (_haversine_km(lat, lng, self.lats[i], self.lngs[i]), self.ids[i]) for i in found
+        )
+        return [(centre_id, distance) for distance, centre_id in ranked[:k]]
+
+    def save(self) -> None:
+        meta = {"fingerprint": self.fingerprint, "cell_deg": self.cell_deg, "cursor": self.cursor}
+        write_snapshot(_SNAPSHOT_NAME, meta, {
+            "cell_keys": array("q", self.cell_keys),
+            "cell_offsets": array("I", self.cell_offsets),
+            "ids": array("i", self.ids),
+            "lats": array("d", self.lats),
+            "lngs": array("d", self.lngs),
+        })
+
+    @classmethod
+    def load(cls) -> Optional["CentreIndex"]:
+        snapshot = read_snapshot(_SNAPSHOT_NAME)
+        if snapshot is None:
+            return None
+        meta, arrays = snapshot
+        try:
+            return cls(meta["fingerprint"], meta["cell_deg"], arrays, meta.get("cursor", -1))
+        except KeyError:
+            return None
+
+
+_index: Optional[CentreIndex] = None
+_index_lock = threading.Lock()
+
+
+def load_centre_index_snapshot() -> bool:
+    """Load the last snapshot (at startup); returns True if one was found"""
+    global _index
+    loaded = CentreIndex.load()
+    if loaded is not None:
+        with _index_lock:
+            _index = loaded
+    return loaded is not None
+
+
+def save_centre_index_snapshot() -> None:
+    with _index_lock:
+        index = _index
+    if index is not None:
+        index.save()
+
+
+def get_centre_index(db: Session, fingerprint: Optional[str] = None) -> CentreIndex:
+    """The index of active centres, rebuilt if the centres changed since it was built"""
+    global _index
+    with _index_lock:
+        index = _index
+    cursor = change_cursor(db, "relief_centres")
+    if fingerprint is None:
+        if index is not None and index.cursor == cursor:
+            return index
+        fingerprint = active_centres_fingerprint(db)
+    if index is not None and index.fingerprint == fingerprint:
+        # Something changed that the index doesn't depend on
+        index.cursor = cursor
+        return index
+    rows = db.query(ReliefCentre.id, ReliefCentre.latitude, ReliefCentre.longitude).filter(
+        ReliefCentre.status == ReliefCentreStatus.ACTIVE
+    ).all()
+    index = CentreIndex.build(fingerprint, [tuple(r) for r in rows], cursor=cursor)
+    with _index_lock:
+        _index = index
+    return index
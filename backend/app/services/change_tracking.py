@@ -0,0 +1,54 @@
+"""
+Change tracking helpers for delta sync and conditional GET
+
+Rows of the tracked tables carry a version taken from a per-table change
+sequence on every insert or update (triggers set up in init_change_tracking).
+Listings use the current sequence value as their ETag, so an unchanged table
+answers If-None-Match with 304 after a single primary-key lookup, and as the
+sync cursor: a client passes the last cursor back as since= and receives only
+rows whose version is greater.
+"""
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Response header carrying the cursor for the next since= request
+SYNC_CURSOR_HEADER = "X-Sync-Cursor"
+
+
+def change_cursor(db: Session, table: str) -> int:
+    """Current value of a table's change sequence (0 before any change)"""
+    value = db.execute(
+        text("SELECT value FROM change_sequence WHERE table_name = :table"),
+        {"table": table}
+    ).scalar()
+    return value or 0
+
+
+def make_etag(table: str, cursor: int, *parts) -> str:
+    """
+    Strong ETag for a listing of table at cursor
+
+    Args:
+        table: Tracked table the listing reads
+        cursor: Its change sequence value
+        parts: Anything else the listing depends on (filters, paging)
+    """
+    suffix = "".join(f"-{part}" for part in parts if part is not None)
+    return f'"{table}-{cursor}{suffix}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header value matches etag (weak comparison)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
@@ -0,0 +1,512 @@
+"""
+Travel-time isochrones and coverage gaps for relief centres
+
+Travel times are sampled with the OSRM table service on a quadtree-style
+adaptive grid: a coarse grid around each centre is evaluated first, then only
+cells whose travel-time band differs from a neighbour (i.e. cells an isochrone
+line passes through) are split into four and evaluated again. The grid is
+aligned globally, so results of different centres can be merged cell by cell.
+
+OSRM doesn't know about road closures. Cells inside a closure are treated as
+unreachable, and the OSRM travel times of the other cells are corrected with
+the embedded road graph (the extra time the closed roads add there). Without
+an embedded graph only the first part applies, and the results are flagged
+with closures_approximate.
+
+Results are cached per centre and reused until the centre moves, changes
+status, or the road closures are updated.
+"""
+import math
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.database import ReliefCentre
+from app.services.osrm_service import get_table, get_embedded_graph
+from app.services.relief_centre_service import (
+    get_all_active_relief_centres,
+    calculate_haversine_distance
+)
+from app.services.road_closures import get_closures
+from app.services.road_graph import RoadGraph
+from app.services.shared_cache import KeyLocks
+
+# Size of the coarsest grid cells in degrees (~2 km)
+ISOCHRONE_CELL_DEG = float(os.getenv("ISOCHRONE_CELL_DEG", "0.02"))
+# Number of times a boundary cell may be split in four
+ISOCHRONE_REFINE_LEVELS = int(os.getenv("ISOCHRONE_REFINE_LEVELS", "2"))
+# Width of the travel-time bands the isochrone lines are drawn at
+ISOCHRONE_BAND_MINUTES = float(os.getenv("ISOCHRONE_BAND_MINUTES", "10"))
+# Upper bound on average road speed, used to size the area sampled per centre
+ISOCHRONE_MAX_SPEED_MS = float(os.getenv("ISOCHRONE_MAX_SPEED_MS", "25"))
+# Largest coverage-gap region, in coarsest grid cells (~200,000 km2 by default)
+ISOCHRONE_MAX_CELLS = int(os.getenv("ISOCHRONE_MAX_CELLS", "50000"))
+
+_METERS_PER_DEG = 111_195.0
+# Cells further than one coarse cell from any graph node get no closure correction
+_SNAP_MAX_M = ISOCHRONE_CELL_DEG * _METERS_PER_DEG
+
+# Cell key: (level, row, col) where the cell size at a level is ISOCHRONE_CELL_DEG / 2**level
+CellKey = Tuple[int, int, int]
+BBox = Tuple[float, float, float, float]  # min_lat, min_lng, max_lat, max_lng
+
+
+def cell_size(level: int) -> float:
+    return ISOCHRONE_CELL_DEG / (2 ** level)
+
+
+def cell_at(lat: float, lng: float, level: int) -> CellKey:
+    size = cell_size(level)
+    return level, int((lat + 90) // size), int((lng + 180) // size)
+
+
+def cell_centre(key: CellKey) -> Tuple[float, float]:
+    level, row, col = key
+    size = cell_size(level)
+    return -90 + (row + 0.5) * size, -180 + (col + 0.5) * size
+
+
+def cell_children(key: CellKey) -> List[CellKey]:
+    level, row, col = key
+    return [(level + 1, 2 * row + dr, 2 * col + dc) for dr in (0, 1) for dc in (0, 1)]
+
+
+def cell_polygon(key: CellKey) -> List[List[float]]:
+    """Closed GeoJSON ring ([lng, lat]) of a cell"""
+    level, row, col = key
+    size = cell_size(level)
+    south, west = -90 + row * size, -180 + col * size
+    north, east = south + size, west + size
+    return [[west, south], [east, south], [east, north], [west, north], [west, south]]
+
+
+def base_cell_count(bbox: BBox) -> int:
+    """Number of level-0 cells base_cells() would return, without listing them"""
+    _, row0, col0 = cell_at(bbox[0], bbox[1], 0)
+    _, row1, col1 = cell_at(bbox[2], bbox[3], 0)
+    return max(0, row1 - row0 + 1) * max(0, col1 - col0 + 1)
+
+
+def base_cells(bbox: BBox) -> List[CellKey]:
+    """Level-0 cells covering a bounding box"""
+    _, row0, col0 = cell_at(bbox[0], bbox[1], 0)
+    _, row1, col1 = cell_at(bbox[2], bbox[3], 0)
+    return [(0, r, c) for r in range(row0, row1 + 1) for c in range(col0, col1 + 1)]
+
+
+class RegionTooLargeError(ValueError):
+    """A region with more grid cells than ISOCHRONE_MAX_CELLS"""
+
+
+@dataclass
+class CentreIsochrone:
+    """Adaptive travel-time grid towards one relief centre"""
+    centre_id: int
+    fingerprint: Tuple[float, float, str]
+    closures_version: int
+    max_minutes: float
+    bbox: BBox
+    # Closures nearby that couldn't be routed around (no embedded road graph),
+    # so only the cells inside them were excluded
+    closures_approximate: bool = False
+    # Unsplit cells -> travel time in seconds (None = unreachable or closed)
+    leaves: Dict[CellKey, Optional[float]] = field(default_factory=dict)
+    # Cells that were refined into children
+    split: Set[CellKey] = field(default_factory=set)
+
+    def lookup(self, lat: float, lng: float) -> Optional[float]:
+        """Travel time from a point to the centre, None if unknown or unreachable"""
+        if not (self.bbox[0] <= lat <= self.bbox[2] and self.bbox[1] <= lng <= self.bbox[3]):
+            return None
+        key = cell_at(lat, lng, 0)
+        while key in self.split:
+            key = cell_at(lat, lng, key[0] + 1)
+        return self.leaves.get(key)
+
+
+def _band(duration: Optional[float], max_seconds: float, band_seconds: float) -> Optional[int]:
+    if duration is None or duration > max_seconds:
+        return None
+    return int(duration // band_seconds)
+
+
+def _in_closure(lat: float, lng: float, closures: List[Dict[str, Any]]) -> bool:
+    for closure in closures:
+        distance_m = calculate_haversine_distance(
+            lat, lng, closure["latitude"], closure["longitude"]
+        ) * 1000
+        if distance_m <= closure.get("radius_m", 0):
+            return True
+    return False
+
+
+def _closures_near(bbox: BBox, closures: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Closures overlapping a bounding box"""
+    nearby = []
+    for closure in closures:
+        pad = closure.get("radius_m", 0) / _METERS_PER_DEG
+        pad_lng = pad / max(0.01, math.cos(math.radians(closure["latitude"])))
+        if (bbox[0] - pad <= closure["latitude"] <= bbox[2] + pad
+                and bbox[1] - pad_lng <= closure["longitude"] <= bbox[3] + pad_lng):
+            nearby.append(closure)
+    return nearby
+
+
+class _ClosureDelays:
+    """
+    Extra travel time the road closures add on the way to one centre
+
+    Two searches over the embedded road graph, towards the centre with and
+    without the closed roads; the difference per node is added to the OSRM
+    travel time of the cells snapping to it.
+    """
+
+    def __init__(
+        self,
+        graph: RoadGraph,
+        lat: float,
+        lng: float,
+        closures: List[Dict[str, Any]],
+        max_seconds: float
+    ):
+        self.graph = graph
+        self.open: Dict[int, float] = {}
+        self.closed: Dict[int, float] = {}
+        target = graph.nearest_node(lat, lng)
+        blocked = graph.edges_in_areas(closures) if target is not None else None
+        if blocked:
+            self.open = graph.travel_times_to(target, None, max_seconds)
+            self.closed = graph.travel_times_to(target, blocked, max_seconds)
+
+    def apply(self, lat: float, lng: float, duration: Optional[float]) -> Optional[float]:
+        """
+        Travel time from a point corrected for the closures
+
+        Returns:
+            Seconds, or None if the closures cut the point off (or push it
+            beyond the search radius, i.e. past max_seconds)
+        """
+        if duration is None or not self.open:
+            return duration
+        node = self.graph.nearest_node(lat, lng)
+        open_time = self.open.get(node)
+        if open_time is None:
+            # Off the graph or beyond the search radius: nothing to correct with
+            return duration
+        node_lat, node_lng = self.graph.node_coordinate(node)
+        if calculate_haversine_distance(lat, lng, node_lat, node_lng) * 1000 > _SNAP_MAX_M:
+            # The nearest road known to the graph is somewhere else entirely
+            return duration
+        closed_time = self.closed.get(node)
+        if closed_time is None:
+            return None
+        if closed_time > open_time:
+            duration += closed_time - open_time
+        return duration
+
+
+def _centre_fingerprint(centre: ReliefCentre) -> Tuple[float, float, str]:
+    status = centre.status.value if hasattr(centre.status, "value") else str(centre.status)
+    return centre.latitude, centre.longitude, status
+
+
+def compute_centre_isochrone(centre: ReliefCentre, max_minutes: float) -> CentreIsochrone:
+    """
+    Sample travel times towards a centre out to max_minutes
+
+    Raises:
+        Exception: If the OSRM table service fails
+    """
+    closures_version, closures = get_closures()
+    max_seconds = max_minutes * 60
+    band_seconds = ISOCHRONE_BAND_MINUTES * 60
+
+    radius_deg = max_seconds * ISOCHRONE_MAX_SPEED_MS / _METERS_PER_DEG
+    lng_radius_deg = radius_deg / max(0.01, math.cos(math.radians(centre.latitude)))
+    bbox = (
+        centre.latitude - radius_deg, centre.longitude - lng_radius_deg,
+        centre.latitude + radius_deg, centre.longitude + lng_radius_deg,
+    )
+    result = CentreIsochrone(
+        centre_id=centre.id,
+        fingerprint=_centre_fingerprint(centre),
+        closures_version=closures_version,
+        max_minutes=max_minutes,
+        bbox=bbox,
+    )
+
+    delays = None
+    nearby = _closures_near(bbox, closures)
+    if nearby:
+        graph = get_embedded_graph()
+        if graph is None:
+            result.closures_approximate = True
+        else:
+            delays = _ClosureDelays(graph, centre.latitude, centre.longitude, nearby, max_seconds)
+
+    pending = base_cells(bbox)
+    for level in range(ISOCHRONE_REFINE_LEVELS + 1):
+        points = [cell_centre(key) for key in pending]
+        open_idx = [i for i, (lat, lng) in enumerate(points) if not _in_closure(lat, lng, closures)]
+        durations, _ = get_table(
+            [points[i] for i in open_idx],
+            [(centre.latitude, centre.longitude)]
+        )
+        for key in pending:
+            result.leaves[key] = None
+        for i, row in zip(open_idx, durations):
+            duration = row[0]
+            if delays is not None:
+                duration = delays.apply(*points[i], duration)
+            result.leaves[pending[i]] = duration
+
+        if level == ISOCHRONE_REFINE_LEVELS:
+            break
+
+        # Split cells sitting on a band boundary
+        size = cell_size(level)
+        to_split = []
+        for key in pending:
+            lat, lng = cell_centre(key)
+            band = _band(result.leaves[key], max_seconds, band_seconds)
+            for dlat, dlng in ((size, 0), (-size, 0), (0, size), (0, -size)):
+                neighbour = result.lookup(lat + dlat, lng + dlng)
+                if _band(neighbour, max_seconds, band_seconds) != band:
+                    to_split.append(key)
+                    break
+        pending = []
+        for key in to_split:
+            del result.leaves[key]
+            result.split.add(key)
+            pending.extend(cell_children(key))
+        if not pending:
+            break
+
+    return result
+
+
+_cache: Dict[int, CentreIsochrone] = {}
+_cache_lock = threading.Lock()
+# Per-centre computation locks, dropped once nobody waits on them
+_compute_locks = KeyLocks()
+
+
+def _is_fresh(cached: Optional[CentreIsochrone], centre: ReliefCentre, max_minutes: float, closures_version: int) -> bool:
+    return (
+        cached is not None
+        and cached.fingerprint == _centre_fingerprint(centre)
+        and cached.closures_version == closures_version
+        and cached.max_minutes >= max_minutes
+    )
+
+
+def get_centre_isochrone(centre: ReliefCentre, max_minutes: float) -> CentreIsochrone:
+    """Cached isochrone for a centre, recomputed only when its inputs changed"""
+    closures_version, _ = get_closures()
+    with _cache_lock:
+        cached = _cache.get(centre.id)
+        if _is_fresh(cached, centre, max_minutes, closures_version):
+            return cached
+
+    # One computation per centre at a time; concurrent callers wait and reuse it
+    _compute_locks.acquire(centre.id)
+    try:
+        with _cache_lock:
+            cached = _cache.get(centre.id)
+        if _is_fresh(cached, centre, max_minutes, closures_version):
+            return cached
+        result = compute_centre_isochrone(centre, max_minutes)
+        with _cache_lock:
+            _cache[centre.id] = result
+        return result
+    finally:
+        _compute_locks.release(centre.id)
+
+
+def _merged_leaves(
+    isochrones: List[CentreIsochrone],
+    bbox: BBox
+) -> Iterable[Tuple[CellKey, Optional[float]]]:
+    """
+    Overlay several centres' grids: yields (cell, shortest travel time) for
+    the finest cells any centre refined to
+    """
+    split: Set[CellKey] = set()
+    for iso in isochrones:
+        split |= iso.split
+
+    stack = base_cells(bbox)
+    while stack:
+        key = stack.pop()
+        if key in split:
+            stack.extend(cell_children(key))
+            continue
+        lat, lng = cell_centre(key)
+        best = None
+        for iso in isochrones:
+            duration = iso.lookup(lat, lng)
+            if duration is not None and (best is None or duration < best):
+                best = duration
+        yield key, best
+
+
+def _cell_area_km2(key: CellKey) -> float:
+    lat, _ = cell_centre(key)
+    side_km = cell_size(key[0]) * _METERS_PER_DEG / 1000
+    return side_km * side_km * math.cos(math.radians(lat))
+
+
+def _cells_response(cells: List[Tuple[CellKey, Optional[float]]]) -> List[Dict[str, Any]]:
+    out = []
+    for key, duration in cells:
+        lat, lng = cell_centre(key)
+        out.append({
+            "latitude": round(lat, 6),
+            "longitude": round(lng, 6),
+            "size_deg": cell_size(key[0]),
+            "duration": round(duration, 1) if duration is not None else None,
+        })
+    return out
+
+
+def _band_features(cells: List[Tuple[CellKey, Optional[float]]], max_minutes: float) -> Dict[str, Any]:
+    """GeoJSON FeatureCollection with one MultiPolygon per travel-time band"""
+    band_seconds = ISOCHRONE_BAND_MINUTES * 60
+    bands: Dict[int, List[List[List[List[float]]]]] = {}
+    for key, duration in cells:
+        band = _band(duration, max_minutes * 60, band_seconds)
+        if band is not None:
+            bands.setdefault(band, []).append([cell_polygon(key)])
+    features = []
+    for band in sorted(bands):
+        features.append({
+            "type": "Feature",
+            "properties": {
+                "min_minutes": band * ISOCHRONE_BAND_MINUTES,
+                "max_minutes": min(max_minutes, (band + 1) * ISOCHRONE_BAND_MINUTES),
+            },
+            "geometry": {"type": "MultiPolygon", "coordinates": bands[band]},
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+
+def _union_bbox(boxes: List[BBox]) -> BBox:
+    return (
+        min(b[0] for b in boxes), min(b[1] for b in boxes),
+        max(b[2] for b in boxes), max(b[3] for b in boxes),
+    )
+
+
+def _active_isochrones(db: Session, max_minutes: float) -> List[CentreIsochrone]:
+    centres = get_all_active_relief_centres(db)
+    if not centres:
+        raise ValueError("No active relief centres found")
+    active_ids = {c.id for c in centres}
+    with _cache_lock:
+        for stale_id in [cid for cid in _cache if cid not in active_ids]:
+            del _cache[stale_id]
+    return [get_centre_isochrone(centre, max_minutes) for centre in centres]
+
+
+def get_isochrone_for_centre(db: Session, centre_id: int, max_minutes: float) -> Dict[str, Any]:
+    """
+    Isochrone of a single centre
+
+    Raises:
+        ValueError: If the centre doesn't exist
+        Exception: If OSRM fails
+    """
+    centre = db.query(ReliefCentre).filter(ReliefCentre.id == centre_id).first()
+    if not centre:
+        raise ValueError("Relief centre not found")
+    iso = get_centre_isochrone(centre, max_minutes)
+    cells = [
+        (key, duration) for key, duration in iso.leaves.items()
+        if duration is not None and duration <= max_minutes * 60
+    ]
+    return {
+        "centre_ids": [centre.id],
+        "max_minutes": max_minutes,
+        "band_minutes": ISOCHRONE_BAND_MINUTES,
+        "closures_approximate": iso.closures_approximate,
+        "cells": _cells_response(cells),
+        "bands": _band_features(cells, max_minutes),
+    }
+
+
+def get_isochrone_for_all_centres(db: Session, max_minutes: float) -> Dict[str, Any]:
+    """
+    Combined isochrone: travel time to the nearest active centre
+
+    Raises:
+        ValueError: If there are no active centres
+        Exception: If OSRM fails
+    """
+    isochrones = _active_isochrones(db, max_minutes)
+    bbox = _union_bbox([iso.bbox for iso in isochrones])
+    cells = [
+        (key, duration) for key, duration in _merged_leaves(isochrones, bbox)
+        if duration is not None and duration <= max_minutes * 60
+    ]
+    return {
+        "centre_ids": [iso.centre_id for iso in isochrones],
+        "max_minutes": max_minutes,
+        "band_minutes": ISOCHRONE_BAND_MINUTES,
+        "closures_approximate": any(iso.closures_approximate for iso in isochrones),
+        "cells": _cells_response(cells),
+        "bands": _band_features(cells, max_minutes),
+    }
+
+
+def _check_region(bbox: BBox) -> None:
+    cells = base_cell_count(bbox)
+    if cells > ISOCHRONE_MAX_CELLS:
+        raise RegionTooLargeError(
+            f"Region covers {cells} grid cells, more than the limit of "
+            f"{ISOCHRONE_MAX_CELLS}; pass a smaller min_lat/min_lng/max_lat/max_lng"
+        )
+
+
+def get_coverage_gaps(
+    db: Session,
+    threshold_minutes: float,
+    bbox: Optional[BBox] = None
+) -> Dict[str, Any]:
+    """
+    Areas more than threshold_minutes away from every active centre
+
+    Args:
+        bbox: Region to analyse; defaults to the area around all active centres
+
+    Raises:
+        RegionTooLargeError: If the region spans more than ISOCHRONE_MAX_CELLS cells
+        ValueError: If there are no active centres
+        Exception: If OSRM fails
+    """
+    if bbox is not None:
+        _check_region(bbox)
+    isochrones = _active_isochrones(db, threshold_minutes)
+    region = bbox or _union_bbox([iso.bbox for iso in isochrones])
+    _check_region(region)
+    threshold_seconds = threshold_minutes * 60
+    gaps = [
+        (key, duration) for key, duration in _merged_leaves(isochrones, region)
+        if duration is None or duration > threshold_seconds
+    ]
+    return {
+        "threshold_minutes": threshold_minutes,
+        "gap_area_km2": round(sum(_cell_area_km2(key) for key, _ in gaps), 2),
+        "closures_approximate": any(iso.closures_approximate for iso in isochrones),
+        "cells": _cells_response(gaps),
+        "geojson": {
+            "type": "Feature",
+            "properties": {"threshold_minutes": threshold_minutes},
+            "geometry": {
+                "type": "MultiPolygon",
+                "coordinates": [[cell_polygon(key)] for key, _ in gaps],
+            },
+        },
+    }
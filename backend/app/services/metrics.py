@@ -0,0 +1,82 @@
+"""
+Minimal in-process metrics registry exposed in Prometheus text format
+
+Counters and gauges are keyed by name plus a set of labels. Gauges whose value
+lives elsewhere (queue depths, pool occupancy) can be registered as callbacks
+that are evaluated when /metrics is scraped.
+"""
+import threading
+from typing import Callable, Dict, List, Tuple
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+_values: Dict[str, Dict[LabelSet, float]] = {}
+_meta: Dict[str, Tuple[str, str]] = {}  # name -> (type, help)
+_callbacks: List[Tuple[str, Callable[[], Dict[LabelSet, float]]]] = []
+_lock = threading.Lock()
+
+
+def labels(**kwargs) -> LabelSet:
+    """Canonical label set for use as a metric key"""
+    return tuple(sorted((k, str(v)) for k, v in kwargs.items()))
+
+
+def describe(name: str, metric_type: str, help_text: str) -> None:
+    """Register the type ("counter" or "gauge") and help text of a metric"""
+    _meta[name] = (metric_type, help_text)
+
+
+def inc(name: str, value: float = 1.0, **label_values) -> None:
+    """Increment a counter"""
+    key = labels(**label_values)
+    with _lock:
+        series = _values.setdefault(name, {})
+        series[key] = series.get(key, 0.0) + value
+
+
+def set_gauge(name: str, value: float, **label_values) -> None:
+    """Set a gauge to an absolute value"""
+    key = labels(**label_values)
+    with _lock:
+        _values.setdefault(name, {})[key] = value
+
+
+def register_callback(name: str, callback: Callable[[], Dict[LabelSet, float]]) -> None:
+    """Register a function returning {label set: value} for a gauge, evaluated on scrape"""
+    _callbacks.append((name, callback))
+
+
+def get_value(name: str, **label_values) -> float:
+    """Current value of a counter or gauge series (0 if never set)"""
+    with _lock:
+        return _values.get(name, {}).get(labels(**label_values), 0.0)
+
+
+def _format_labels(label_set: LabelSet) -> str:
+    if not label_set:
+        return ""
+    inner = ",".join(
+        '{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in label_set
+    )
+    return "{" + inner + "}"
+
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    with _lock:
+        snapshot = {name: dict(series) for name, series in _values.items()}
+    for name, callback in _callbacks:
+        try:
+            snapshot.setdefault(name, {}).update(callback())
+        except Exception as e:
+            print(f"Warning: Metrics callback for {name} failed: {e}")
+
+    lines = []
+    for name in sorted(snapshot):
+        metric_type, help_text = _meta.get(name, ("untyped", ""))
+        if help_text:
+            lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for label_set, value in sorted(snapshot[name].items()):
+            lines.append(f"{name}{_format_labels(label_set)} {value:g}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,282 @@
+"""
+Pool of OSRM backends: replicas for throughput, regional extracts for coverage
+
+OSRM_BACKENDS lists the backends, separated by whitespace, each as
+    url[|min_lat,min_lng,max_lat,max_lng][|weight]
+e.g.
+    OSRM_BACKENDS="http://osrm-tn-1:5000|8,76,13.6,80.4|2 http://osrm-tn-2:5000|8,76,13.6,80.4 http://osrm-india:5000"
+A backend without a bounding box covers everything; without OSRM_BACKENDS
+the pool is the single backend OSRM_BASE_URL.
+
+For each request:
+- Only backends whose box contains every coordinate of the request are
+  considered, and of those the most specific region (smallest box), so a
+  regional extract is preferred over a country-wide fallback.
+- Among those replicas the one with the fewest outstanding requests per
+  unit of weight is used.
+- A backend failing OSRM_UNHEALTHY_AFTER times in a row (connection error,
+  timeout or 502/503/504) is taken out of rotation. A background probe
+  every OSRM_HEALTH_INTERVAL seconds puts it back once it answers; without
+  the probe running, one request is let through per interval to test it.
+- Connection failures and 502/503/504 are retried once on another replica.
+
+NoOSRMBackend is a requests ConnectionError, so callers falling back to the
+embedded road graph when OSRM is unreachable also do so when no backend
+covers the coordinates or all of them are down.
+"""
+import os
+import random
+import threading
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import requests
+from dotenv import load_dotenv
+
+from app.services import metrics
+
+load_dotenv()
+
+# Single backend used when OSRM_BACKENDS is not set
+# Default: http://localhost:4000
+OSRM_BASE_URL = os.getenv("OSRM_BASE_URL", "http://localhost:4000")
+OSRM_BACKENDS = os.getenv("OSRM_BACKENDS", "")
+# Consecutive failures before a backend is taken out of rotation
+OSRM_UNHEALTHY_AFTER = int(os.getenv("OSRM_UNHEALTHY_AFTER", "3"))
+# Seconds between health probes (0 disables the probe thread)
+OSRM_HEALTH_INTERVAL = float(os.getenv("OSRM_HEALTH_INTERVAL", "10"))
+OSRM_HEALTH_TIMEOUT = float(os.getenv("OSRM_HEALTH_TIMEOUT", "2"))
+# Attempts per request on different replicas
+OSRM_MAX_ATTEMPTS = int(os.getenv("OSRM_MAX_ATTEMPTS", "2"))
+
+# Upstream statuses meaning "this replica can't serve right now"
+_RETRYABLE_STATUSES = {502, 503, 504}
+
+BBox = Tuple[float, float, float, float]
+LatLng = Tuple[float, float]
+
+metrics.describe("osrm_backend_requests_total", "counter", "OSRM requests by backend and outcome")
+metrics.describe("osrm_backend_outstanding", "gauge", "OSRM requests in flight per backend")
+metrics.describe("osrm_backend_healthy", "gauge", "Whether each OSRM backend is in rotation (1) or not (0)")
+
+
+class NoOSRMBackend(requests.exceptions.ConnectionError):
+    """No healthy OSRM backend covers the requested coordinates"""
+
+
+class OSRMBackend:
+    """One osrm-routed server and its coverage"""
+
+    def __init__(self, url: str, bbox: Optional[BBox] = None, weight: float = 1.0):
+        self.url = url.rstrip("/")
+        self.bbox = bbox
+        self.weight = max(0.01, weight)
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        # While unhealthy: when the next trial request may be sent (monotonic)
+        self.retry_at = 0.0
+
+    @property
+    def area(self) -> float:
+        if self.bbox is None:
+            return float("inf")
+        min_lat, min_lng, max_lat, max_lng = self.bbox
+        return (max_lat - min_lat) * (max_lng - min_lng)
+
+    def covers(self, points: Sequence[LatLng]) -> bool:
+        if self.bbox is None:
+            return True
+        min_lat, min_lng, max_lat, max_lng = self.bbox
+        return all(min_lat <= lat <= max_lat and min_lng <= lng <= max_lng for lat, lng in points)
+
+    def probe_point(self) -> LatLng:
+        if self.bbox is None:
+            return 0.0, 0.0
+        min_lat, min_lng, max_lat, max_lng = self.bbox
+        return (min_lat + max_lat) / 2, (min_lng + max_lng) / 2
+
+
+def parse_backends(value: str) -> List[OSRMBackend]:
+    """
+    Parse an OSRM_BACKENDS value (see module docstring)
+
+    Raises:
+        ValueError: If an entry is malformed
+    """
+    backends = []
+    for entry in value.split():
+        url, _, rest = entry.partition("|")
+        bbox_part, _, weight_part = rest.partition("|")
+        bbox = None
+        if bbox_part:
+            min_lat, min_lng, max_lat, max_lng = (float(v) for v in bbox_part.split(","))
+            if min_lat > max_lat or min_lng > max_lng:
+                raise ValueError(f"Empty bounding box in OSRM backend {entry!r}")
+            bbox = (min_lat, min_lng, max_lat, max_lng)
+        backends.append(OSRMBackend(url, bbox, float(weight_part) if weight_part else 1.0))
+    return backends
+
+
+class OSRMPool:
+    """Backend selection, failure tracking and health probes"""
+
+    def __init__(
+        self,
+        backends: List[OSRMBackend],
+        unhealthy_after: int = OSRM_UNHEALTHY_AFTER,
+        retry_interval: float = OSRM_HEALTH_INTERVAL
+    ):
+        self.backends = backends
+        self.unhealthy_after = max(1, unhealthy_after)
+        self.retry_interval = retry_interval if retry_interval > 0 else 10.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        metrics.register_callback("osrm_backend_outstanding", self._gauge(lambda b: b.outstanding))
+        metrics.register_callback("osrm_backend_healthy", self._gauge(lambda b: int(b.healthy)))
+
+    def _gauge(self, value):
+        return lambda: {metrics.labels(backend=b.url): value(b) for b in self.backends}
+
+    def covers(self, points: Sequence[LatLng]) -> bool:
+        """Whether any backend, healthy or not, covers all points"""
+        return any(b.covers(points) for b in self.backends)
+
+    def _acquire(self, points: Sequence[LatLng], exclude: List[OSRMBackend]) -> OSRMBackend:
+        now = time.monotonic()
+        with self._lock:
+            covering = [b for b in self.backends if b not in exclude and b.covers(points)]
+            available = [b for b in covering if b.healthy or now >= b.retry_at]
+            if not available:
+                if covering or exclude:
+                    raise NoOSRMBackend("All OSRM backends covering the request are unavailable")
+                raise NoOSRMBackend("No OSRM backend covers the requested coordinates")
+            smallest = min(b.area for b in available)
+            backend = min(
+                (b for b in available if b.area == smallest),
+                key=lambda b: ((b.outstanding + 1) / b.weight, random.random())
+            )
+            if not backend.healthy:
+                # Let one trial request through per interval
+                backend.retry_at = now + self.retry_interval
+            backend.outstanding += 1
+            return backend
+
+    def _record(self, backend: OSRMBackend, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                if not backend.healthy:
+                    print(f"OSRM backend {backend.url} is healthy again")
+                backend.failures = 0
+                backend.healthy = True
+                return
+            backend.failures += 1
+            if backend.healthy and backend.failures >= self.unhealthy_after:
+                backend.healthy = False
+                backend.retry_at = time.monotonic() + self.retry_interval
+                print(f"Warning: OSRM backend {backend.url} taken out of rotation after {backend.failures} failures")
+
+    def _release(self, backend: OSRMBackend, ok: Optional[bool], outcome: str) -> None:
+        with self._lock:
+            backend.outstanding -= 1
+        if ok is not None:
+            self._record(backend, ok)
+        metrics.inc("osrm_backend_requests_total", backend=backend.url, outcome=outcome)
+
+    def get(self, path: str, points: Sequence[LatLng], timeout: float) -> requests.Response:
+        """
+        GET an OSRM API path from a backend covering all points
+
+        Args:
+            path: Path and query, e.g. "/route/v1/driving/..."
+            points: (lat, lng) coordinates in the request
+            timeout: Request timeout in seconds
+
+        Returns:
+            The backend's response (the last one if every attempt got a
+            retryable status)
+
+        Raises:
+            NoOSRMBackend: If no available backend covers the points
+            requests.exceptions.RequestException: If the request failed
+        """
+        tried: List[OSRMBackend] = []
+        last_error: Optional[Exception] = None
+        last_response: Optional[requests.Response] = None
+        for _ in range(max(1, OSRM_MAX_ATTEMPTS)):
+            try:
+                backend = self._acquire(points, tried)
+            except NoOSRMBackend:
+                if not tried:
+                    raise
+                break
+            tried.append(backend)
+            try:
+                response = requests.get(backend.url + path, timeout=timeout)
+            except requests.exceptions.ConnectionError as e:
+                self._release(backend, False, "connection_error")
+                last_error, last_response = e, None
+                continue
+            except requests.exceptions.Timeout:
+                # Not retried: another replica would likely be just as slow
+                self._release(backend, False, "timeout")
+                raise
+            except Exception:
+                self._release(backend, None, "error")
+                raise
+            if response.status_code in _RETRYABLE_STATUSES:
+                self._release(backend, False, "unavailable")
+                last_error, last_response = None, response
+                continue
+            self._release(backend, True, "ok")
+            return response
+
+        if last_response is not None:
+            return last_response
+        raise last_error
+
+    def check_health(self) -> None:
+        """Probe every backend once; any answer below 500 counts as healthy"""
+        for backend in self.backends:
+            lat, lng = backend.probe_point()
+            try:
+                response = requests.get(
+                    f"{backend.url}/route/v1/driving/{lng},{lat};{lng},{lat}?overview=false",
+                    timeout=OSRM_HEALTH_TIMEOUT
+                )
+                ok = response.status_code < 500
+            except requests.exceptions.RequestException:
+                ok = False
+            self._record(backend, ok)
+
+    def _run(self) -> None:
+        while not self._stop.wait(OSRM_HEALTH_INTERVAL):
+            self.check_health()
+
+    def start_health_checks(self) -> None:
+        """Start probing backends in the background (no-op if OSRM_HEALTH_INTERVAL <= 0)"""
+        if OSRM_HEALTH_INTERVAL <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="osrm-health", daemon=True)
+        self._thread.start()
+
+    def stop_health_checks(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=OSRM_HEALTH_TIMEOUT + 1)
+            self._thread = None
+
+
+def build_osrm_pool() -> OSRMPool:
+    backends = []
+    if OSRM_BACKENDS:
+        try:
+            backends = parse_backends(OSRM_BACKENDS)
+        except ValueError as e:
+            print(f"Warning: Ignoring invalid OSRM_BACKENDS ({e}), using OSRM_BASE_URL")
+    return OSRMPool(backends or [OSRMBackend(OSRM_BASE_URL)])
+
+
+osrm_pool = build_osrm_pool()
@@ -1,13 +1,29 @@
 import requests
 import os
-from typing import Dict, Any
+import json
+from typing import Dict, Any, List, Optional, Tuple
 from dotenv import load_dotenv
+from app.services.osrm_pool import osrm_pool
+from app.services.road_graph import RoadGraph, load_road_graph
+from app.services.route_geometry import RouteGeometry
+from app.services.shared_cache import get_cache
+from app.services.tracing import span, traced
 
 load_dotenv()
 
-# OSRM base URL from environment variables
-# Default: http://localhost:4000
-OSRM_BASE_URL = os.getenv("OSRM_BASE_URL", "http://localhost:4000")
+# OSRM backends (OSRM_BASE_URL or OSRM_BACKENDS) are configured in osrm_pool
+OSRM_TIMEOUT = float(os.getenv("OSRM_TIMEOUT", "10"))
+# Maximum coordinates per /table request (osrm-routed --max-table-size)
+OSRM_TABLE_MAX_SIZE = int(os.getenv("OSRM_TABLE_MAX_SIZE", "100"))
+
+# Routes are cached (shared across workers) for this long, keyed by
+# coordinates rounded to ROUTE_CACHE_PRECISION decimals (5 = ~1 m)
+ROUTE_CACHE_TTL = float(os.getenv("ROUTE_CACHE_TTL", "600"))
+ROUTE_CACHE_PRECISION = int(os.getenv("ROUTE_CACHE_PRECISION", "5"))
+
+# Embedded road graph used when OSRM is unreachable (built by build_road_graph.py)
+# Set EMBEDDED_GRAPH_PATH to an empty string to disable the fallback
+EMBEDDED_GRAPH_PATH = os.getenv("EMBEDDED_GRAPH_PATH", "osrm/map.graph")
 
 def format_distance(distance_meters: float) -> str:
     """Format distance in a human-readable format"""
@@ -32,54 +48,40 @@ def format_duration(duration_seconds: float) -> str:
         return f"{hours}h"
 
 
-def get_route(start_lat: float, start_lng: float, end_lat: float, end_lng: float) -> Dict[str, Any]:
-    """
-    Get route from OSRM and return structured response for frontend
-    
-    Returns a structured response with:
-    - Summary with formatted distance/duration
-    - Start and end points
-    - GeoJSON geometry for mapping libraries
-    - Raw coordinates array for direct use
-    """
-    url = (
-        f"{OSRM_BASE_URL}/route/v1/driving/"
-        f"{start_lng},{start_lat};{end_lng},{end_lat}"
-        "?overview=full&geometries=geojson"
-    )
+def _route_summary(distance: float, duration: float) -> Dict[str, Any]:
+    return {
+        "distance": distance,
+        "duration": duration,
+        "distance_km": round(distance / 1000, 2),
+        "duration_min": round(duration / 60, 1),
+        "distance_formatted": format_distance(distance),
+        "duration_formatted": format_duration(duration)
+    }
 
-    response = requests.get(url)
-    response.raise_for_status()
 
-    data = response.json()
-    route = data["routes"][0]
-    
-    # Extract geometry coordinates
-    coordinates = route["geometry"]["coordinates"]
-    distance = route["distance"]
-    duration = route["duration"]
+@traced("route.build")
+def build_route_response(geometry: RouteGeometry, distance: float, duration: float) -> Dict[str, Any]:
+    """
+    Build the structured route response from route geometry and totals
     
+    Shared by the OSRM client and the embedded fallback engine so both
+    return exactly the same shape.
+    """
     # Get start and end points
-    start_coord = coordinates[0]
-    end_coord = coordinates[-1]
+    start_lng, start_lat = geometry.start()
+    end_lng, end_lat = geometry.end()
+    coordinates = geometry.to_coordinates()
     
     # Build structured response
     return {
-        "summary": {
-            "distance": distance,
-            "duration": duration,
-            "distance_km": round(distance / 1000, 2),
-            "duration_min": round(duration / 60, 1),
-            "distance_formatted": format_distance(distance),
-            "duration_formatted": format_duration(duration)
-        },
+        "summary": _route_summary(distance, duration),
         "start": {
-            "lat": start_coord[1],
-            "lng": start_coord[0]
+            "lat": start_lat,
+            "lng": start_lng
         },
         "end": {
-            "lat": end_coord[1],
-            "lng": end_coord[0]
+            "lat": end_lat,
+            "lng": end_lng
         },
         "geometry": {
             "type": "LineString",
@@ -87,3 +89,266 @@ def get_route(start_lat: float, start_lng: float, end_lat: float, end_lng: float
         },
         "coordinates": coordinates  # Keep raw format for direct use
     }
+
+
+@traced("route.encode")
+def route_response_json(geometry: RouteGeometry, distance: float, duration: float) -> str:
+    """
+    The same document as build_route_response, rendered straight to JSON
+    
+    Coordinates are written from the geometry arrays without building the
+    nested lists first.
+    """
+    start_lng, start_lat = geometry.start()
+    end_lng, end_lat = geometry.end()
+    coordinates = geometry.coordinates_json()
+    head = json.dumps({
+        "summary": _route_summary(distance, duration),
+        "start": {"lat": start_lat, "lng": start_lng},
+        "end": {"lat": end_lat, "lng": end_lng},
+    })
+    return (
+        f'{head[:-1]}, "geometry": {{"type": "LineString", "coordinates": {coordinates}}}, '
+        f'"coordinates": {coordinates}}}'
+    )
+
+
+def get_embedded_graph() -> Optional[RoadGraph]:
+    """The embedded road graph, or None if it's disabled or hasn't been built"""
+    return load_road_graph(EMBEDDED_GRAPH_PATH) if EMBEDDED_GRAPH_PATH else None
+
+
+def get_embedded_route_geometry(
+    start_lat: float,
+    start_lng: float,
+    end_lat: float,
+    end_lng: float,
+    avoid: Optional[List[Dict[str, Any]]] = None
+) -> Tuple[RouteGeometry, float, float]:
+    """
+    Compute a route with the embedded road graph instead of OSRM
+    
+    Args:
+        avoid: Circular areas (latitude, longitude, radius_m) to route around
+    
+    Returns:
+        (geometry with ETAs, distance in meters, duration in seconds)
+    
+    Raises:
+        FileNotFoundError: If no embedded graph is available
+        ValueError: If the coordinates can't be routed in the graph
+    """
+    graph = get_embedded_graph()
+    if graph is None:
+        raise FileNotFoundError("Embedded road graph not available")
+    coordinates, distance, duration = graph.route(start_lat, start_lng, end_lat, end_lng, avoid or ())
+    geometry = RouteGeometry.from_coordinates(coordinates).with_total_duration(duration)
+    return geometry, distance, duration
+
+
+@traced("route")
+def get_route_geometry(
+    start_lat: float, start_lng: float, end_lat: float, end_lng: float
+) -> Tuple[RouteGeometry, float, float]:
+    """
+    Get a route from OSRM as compact geometry plus totals
+    
+    OSRM responses are cached in the shared cache in packed form, so
+    identical requests from any worker cost one upstream call. Requests go
+    to a backend of the OSRM pool covering both points; if none can be
+    reached or it answers with a server error, falls back to the embedded
+    road graph when one has been built; otherwise the original request
+    error is raised.
+    
+    The geometry carries per-vertex ETAs built from OSRM's per-segment
+    duration annotations.
+    
+    Returns:
+        (geometry, distance in meters, duration in seconds)
+    """
+    p = ROUTE_CACHE_PRECISION
+    key = (
+        f"route:v3:{round(start_lat, p)},{round(start_lng, p)};"
+        f"{round(end_lat, p)},{round(end_lng, p)}"
+    )
+
+    def fetch_route():
+        path = (
+            f"/route/v1/driving/{start_lng},{start_lat};{end_lng},{end_lat}"
+            "?overview=full&geometries=geojson&annotations=duration"
+        )
+        with span("osrm.route"):
+            response = osrm_pool.get(path, [(start_lat, start_lng), (end_lat, end_lng)], OSRM_TIMEOUT)
+            response.raise_for_status()
+            data = response.json()
+        route = data["routes"][0]
+        
+        geometry = RouteGeometry.from_coordinates(route["geometry"]["coordinates"])
+        segment_durations = [
+            duration
+            for leg in route.get("legs", [])
+            for duration in leg.get("annotation", {}).get("duration", [])
+        ]
+        if segment_durations:
+            geometry = geometry.with_segment_durations(segment_durations)
+        else:
+            geometry = geometry.with_total_duration(route["duration"])
+        return {
+            "distance": route["distance"],
+            "duration": route["duration"],
+            "geometry": geometry.to_cache()
+        }
+
+    try:
+        cached = get_cache().get_or_compute(key, fetch_route, ROUTE_CACHE_TTL)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.HTTPError) as e:
+        if isinstance(e, requests.exceptions.HTTPError) and (e.response is None or e.response.status_code < 500):
+            # A client error (e.g. no route between the points) isn't an outage
+            raise
+        try:
+            route = get_embedded_route_geometry(start_lat, start_lng, end_lat, end_lng)
+        except FileNotFoundError:
+            raise e
+        print(f"Warning: OSRM unavailable ({e}), served route from embedded graph")
+        return route
+    return RouteGeometry.from_cache(cached["geometry"]), cached["distance"], cached["duration"]
+
+
+def get_route_geometry_avoiding(
+    start_lat: float,
+    start_lng: float,
+    end_lat: float,
+    end_lng: float,
+    closures: List[Dict[str, Any]]
+) -> Tuple[RouteGeometry, float, float]:
+    """
+    Get a route that doesn't pass through any of the road closures
+    
+    OSRM doesn't know about the closures, so its route (see
+    get_route_geometry) is only used if it happens to miss all of them;
+    otherwise the embedded road graph is searched with the closed roads
+    removed.
+    
+    Args:
+        closures: Dicts with latitude, longitude and radius_m
+    
+    Returns:
+        (geometry, distance in meters, duration in seconds)
+    
+    Raises:
+        ValueError: If no route avoiding the closures could be found
+    """
+    route = get_route_geometry(start_lat, start_lng, end_lat, end_lng)
+    if not closures or not route[0].hazards_along(closures):
+        return route
+    try:
+        with span("route.avoid_closures"):
+            route = get_embedded_route_geometry(start_lat, start_lng, end_lat, end_lng, closures)
+    except FileNotFoundError:
+        raise ValueError("No embedded road graph to route around the closures")
+    if route[0].hazards_along(closures):
+        raise ValueError("No route avoiding the road closures")
+    return route
+
+
+def get_route(start_lat: float, start_lng: float, end_lat: float, end_lng: float) -> Dict[str, Any]:
+    """
+    Get route from OSRM and return structured response for frontend
+    
+    Returns a structured response with:
+    - Summary with formatted distance/duration
+    - Start and end points
+    - GeoJSON geometry for mapping libraries
+    - Raw coordinates array for direct use
+    
+    See get_route_geometry for caching and the embedded fallback.
+    """
+    return build_route_response(*get_route_geometry(start_lat, start_lng, end_lat, end_lng))
+
+
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield i, items[i:i + size]
+
+
+def _fill_table(
+    durations: List[List[Optional[float]]],
+    distances: List[List[Optional[float]]],
+    sources: List[Tuple[float, float]],
+    src_start: int,
+    destinations: List[Tuple[float, float]],
+    dst_start: int
+) -> None:
+    """
+    Fill one block of the matrices with a single table call
+
+    A block no backend covers (e.g. sources in one regional extract and
+    destinations in another) is split in half until the parts are covered;
+    single pairs that still aren't keep None, as if OSRM found no route.
+    """
+    points = sources + destinations
+    if not osrm_pool.covers(points):
+        if len(sources) == 1 and len(destinations) == 1:
+            return
+        if len(sources) >= len(destinations):
+            half = len(sources) // 2
+            _fill_table(durations, distances, sources[:half], src_start, destinations, dst_start)
+            _fill_table(durations, distances, sources[half:], src_start + half, destinations, dst_start)
+        else:
+            half = len(destinations) // 2
+            _fill_table(durations, distances, sources, src_start, destinations[:half], dst_start)
+            _fill_table(durations, distances, sources, src_start, destinations[half:], dst_start + half)
+        return
+
+    coords = ";".join(f"{lng},{lat}" for lat, lng in points)
+    src_idx = ";".join(str(i) for i in range(len(sources)))
+    dst_idx = ";".join(str(len(sources) + i) for i in range(len(destinations)))
+    path = (
+        f"/table/v1/driving/{coords}"
+        f"?sources={src_idx}&destinations={dst_idx}&annotations=duration,distance"
+    )
+    with span("osrm.table", sources=len(sources), destinations=len(destinations)):
+        response = osrm_pool.get(path, points, OSRM_TIMEOUT)
+        response.raise_for_status()
+        data = response.json()
+    for i, row in enumerate(data.get("durations") or []):
+        durations[src_start + i][dst_start:dst_start + len(row)] = row
+    for i, row in enumerate(data.get("distances") or []):
+        distances[src_start + i][dst_start:dst_start + len(row)] = row
+
+
+def get_table(
+    sources: List[Tuple[float, float]],
+    destinations: List[Tuple[float, float]]
+) -> Tuple[List[List[Optional[float]]], List[List[Optional[float]]]]:
+    """
+    Get travel time/distance matrices from the OSRM table service
+    
+    Requests are split so no single call exceeds OSRM_TABLE_MAX_SIZE
+    coordinates (osrm-routed's --max-table-size, 100 by default); each
+    chunk goes to an OSRM pool backend covering its coordinates. Chunks no
+    single backend covers are split further, and pairs that no backend
+    covers at all are left as None.
+    
+    Args:
+        sources: (lat, lng) origins
+        destinations: (lat, lng) targets
+    
+    Returns:
+        (durations in seconds, distances in meters), each indexed
+        [source][destination]; None where OSRM found no route
+    """
+    durations = [[None] * len(destinations) for _ in sources]
+    distances = [[None] * len(destinations) for _ in sources]
+    if not sources or not destinations:
+        return durations, distances
+
+    half = max(1, OSRM_TABLE_MAX_SIZE // 2)
+    dst_size = len(destinations) if len(destinations) <= half else half
+    src_size = max(1, OSRM_TABLE_MAX_SIZE - dst_size)
+
+    for dst_start, dst_chunk in _chunks(destinations, dst_size):
+        for src_start, src_chunk in _chunks(sources, src_size):
+            _fill_table(durations, distances, src_chunk, src_start, dst_chunk, dst_start)
+
+    return durations, distances
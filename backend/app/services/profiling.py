@@ -0,0 +1,280 @@
+"""
+On-demand stack-sampling profiles of individual requests
+
+A request is profiled when it carries the X-Profile-Token header matching
+PROFILE_TOKEN, or when it is picked by PROFILE_SAMPLE_RATE (fraction of
+requests, default 0). While a profiled handler runs, a sampler thread reads
+its stack every PROFILE_INTERVAL_MS via sys._current_frames() and counts
+each distinct stack. The result is kept in the folded format used by
+flamegraph.pl and speedscope ("frame;frame;frame count" per line), together
+with wall and CPU time, and stored in a ring buffer of the last
+PROFILE_BUFFER_SIZE profiles (see /admin/profiles). The response carries the
+profile's id in X-Profile-Id.
+
+Routes opt in by using ProfiledRoute as their router's route_class. For
+requests that aren't profiled the cost is one header lookup and, with
+sampling enabled, one random number; with neither a token nor a sample rate
+configured the route handler is not wrapped at all.
+"""
+import functools
+import hmac
+import inspect
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.services.tracing import TracedRoute
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "50"))
+
+PROFILE_TOKEN_HEADER = "x-profile-token"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+# Frames deeper than this are cut off (keeps runaway recursion bounded)
+_MAX_STACK_DEPTH = 200
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def profiling_enabled() -> bool:
+    return bool(PROFILE_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+
+def token_matches(value: Optional[str]) -> bool:
+    """Whether a presented token matches PROFILE_TOKEN (never when unset)"""
+    return bool(PROFILE_TOKEN) and value is not None and hmac.compare_digest(value, PROFILE_TOKEN)
+
+
+class ProfileSession:
+    """Samples collected for one request"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, method: str, path: str, trigger: str):
+        self.id = next(self._ids)
+        self.method = method
+        self.path = path
+        self.trigger = trigger  # "header" or "sampled"
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.wall_ms = 0.0
+        self.cpu_ms = 0.0
+        self.status_code: Optional[int] = None
+        self.stacks: Counter = Counter()
+        self.samples = 0
+
+    def add(self, stack: str) -> None:
+        self.stacks[stack] += 1
+        self.samples += 1
+
+    def finish(self, status_code: int) -> None:
+        self.status_code = status_code
+        self.wall_ms = (time.perf_counter() - self._started) * 1000
+
+    def folded(self) -> str:
+        """Flamegraph folded stacks, most frequent first"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "trigger": self.trigger,
+            "started_at": self.started_at,
+            "status_code": self.status_code,
+            "wall_ms": round(self.wall_ms, 2),
+            "cpu_ms": round(self.cpu_ms, 2),
+            "samples": self.samples,
+            "interval_ms": PROFILE_INTERVAL_MS,
+        }
+
+
+_labels: Dict[Any, str] = {}
+
+
+def _frame_label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        if "site-packages" + os.sep in filename:
+            filename = filename.split("site-packages" + os.sep, 1)[1]
+        elif filename.startswith(_BACKEND_DIR):
+            filename = os.path.relpath(filename, _BACKEND_DIR)
+        # ';' separates frames in the folded format
+        label = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+        _labels[code] = label
+    return label
+
+
+def _fold(frame, stop_code) -> str:
+    names: List[str] = []
+    while frame is not None and frame.f_code is not stop_code and len(names) < _MAX_STACK_DEPTH:
+        names.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names) or "(idle)"
+
+
+class _Sampler:
+    """One background thread sampling the stacks of all attached threads"""
+
+    def __init__(self):
+        self._attached: Dict[int, Tuple[ProfileSession, Any]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def attach(self, thread_id: int, session: ProfileSession, stop_code) -> None:
+        with self._lock:
+            self._attached[thread_id] = (session, stop_code)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+
+    def detach(self, thread_id: int) -> None:
+        with self._lock:
+            self._attached.pop(thread_id, None)
+
+    def _run(self) -> None:
+        interval = PROFILE_INTERVAL_MS / 1000.0
+        while True:
+            with self._lock:
+                if not self._attached:
+                    self._thread = None
+                    return
+                attached = list(self._attached.items())
+            frames = sys._current_frames()
+            for thread_id, (session, stop_code) in attached:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    session.add(_fold(frame, stop_code))
+            del frames
+            time.sleep(interval)
+
+
+_sampler = _Sampler()
+_current_session: ContextVar[Optional[ProfileSession]] = ContextVar("profile_session", default=None)
+
+_profiles: Deque[ProfileSession] = deque(maxlen=PROFILE_BUFFER_SIZE)
+_profiles_lock = threading.Lock()
+
+
+def recent_profiles() -> List[ProfileSession]:
+    """Stored profiles, newest first"""
+    with _profiles_lock:
+        return list(reversed(_profiles))
+
+
+def get_profile(profile_id: int) -> Optional[ProfileSession]:
+    with _profiles_lock:
+        for session in _profiles:
+            if session.id == profile_id:
+                return session
+    return None
+
+
+def merged_folded(path: Optional[str] = None) -> str:
+    """Folded stacks of all stored profiles (optionally for one path) added up"""
+    total: Counter = Counter()
+    for session in recent_profiles():
+        if path is None or session.path == path:
+            total.update(session.stacks)
+    return "".join(f"{stack} {count}\n" for stack, count in total.most_common())
+
+
+def _instrument(endpoint: Callable) -> Callable:
+    """Wrap an endpoint so the thread running it is sampled when profiling"""
+    if getattr(endpoint, "_profiled", False):
+        # include_router() builds the route again from the wrapped endpoint
+        return endpoint
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            session = _current_session.get()
+            if session is None:
+                return await endpoint(*args, **kwargs)
+            thread_id = threading.get_ident()
+            _sampler.attach(thread_id, session, async_wrapper.__code__)
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                _sampler.detach(thread_id)
+        async_wrapper._profiled = True
+        return async_wrapper
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        session = _current_session.get()
+        if session is None:
+            return endpoint(*args, **kwargs)
+        thread_id = threading.get_ident()
+        cpu_started = time.thread_time()
+        _sampler.attach(thread_id, session, wrapper.__code__)
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            _sampler.detach(thread_id)
+            session.cpu_ms = (time.thread_time() - cpu_started) * 1000
+    wrapper._profiled = True
+    return wrapper
+
+
+def _trigger(request: Request) -> Optional[str]:
+    token = request.headers.get(PROFILE_TOKEN_HEADER)
+    if token is not None and token_matches(token):
+        return "header"
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+
+class ProfiledRoute(TracedRoute):
+    """TracedRoute whose requests can be profiled on demand (see module docstring)"""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if profiling_enabled():
+            endpoint = _instrument(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        if not profiling_enabled():
+            return handler
+
+        async def profiled_handler(request: Request) -> Response:
+            trigger = _trigger(request)
+            if trigger is None:
+                return await handler(request)
+            session = ProfileSession(request.method, self.path_format, trigger)
+            context_token = _current_session.set(session)
+            try:
+                response = await handler(request)
+            except Exception as e:
+                session.finish(getattr(e, "status_code", 500))
+                _store(session)
+                raise
+            finally:
+                _current_session.reset(context_token)
+            session.finish(response.status_code)
+            _store(session)
+            response.headers[PROFILE_ID_HEADER] = str(session.id)
+            return response
+
+        return profiled_handler
+
+
+def _store(session: ProfileSession) -> None:
+    with _profiles_lock:
+        _profiles.append(session)
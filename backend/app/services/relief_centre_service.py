@@ -1,13 +1,46 @@
 """
 Service for finding nearest relief centre using OSRM routing
 """
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
+from sqlalchemy import desc
 from sqlalchemy.orm import Session
-from app.database import ReliefCentre, ReliefCentreStatus
-from app.services.osrm_service import get_route
+from app.database import (
+    ReliefCentre,
+    ReliefCentreStatus,
+    ReliefRequest,
+    ReliefRequestStatus,
+    relief_centres_rtree,
+    relief_requests_rtree
+)
+from app.services.osrm_service import (
+    build_route_response,
+    format_distance,
+    format_duration,
+    get_route,
+    get_route_geometry,
+    get_table
+)
+from app.services.service_area_service import lookup_service_area
+from app.services.centre_index import get_centre_index
+from app.services.change_tracking import change_cursor
+from app.services.shared_cache import get_cache
+from app.services.tracing import span, traced
 import math
+import os
+import requests
 
+# Ranked alternatives: origins are rounded to this many decimals (3 = ~110 m)
+# so nearby users share one cached ranking
+NEAREST_ORIGIN_PRECISION = int(os.getenv("NEAREST_ORIGIN_PRECISION", "3"))
+# Straight-line candidates taken from the centre index into the ETA matrix
+NEAREST_CANDIDATES = int(os.getenv("NEAREST_CANDIDATES", "20"))
+# How long a ranking is cached (seconds); centre changes invalidate it sooner
+NEAREST_CACHE_TTL = float(os.getenv("NEAREST_CACHE_TTL", "300"))
+# Centres find_nearest_relief_centre tries to fetch a route to, fastest first
+_ROUTE_ATTEMPTS = 5
 
+
+@traced("db.active_centres")
 def get_all_active_relief_centres(db: Session) -> List[ReliefCentre]:
     """
     Get all active relief centres from database
@@ -23,6 +56,140 @@ def get_all_active_relief_centres(db: Session) -> List[ReliefCentre]:
     ).all()
 
 
+def _bbox_filters(rtree, model, bbox: Tuple[float, float, float, float]) -> list:
+    min_lat, min_lng, max_lat, max_lng = bbox
+    return [
+        # Answered by the R*Tree index...
+        rtree.c.min_lat >= min_lat,
+        rtree.c.max_lat <= max_lat,
+        rtree.c.min_lng >= min_lng,
+        rtree.c.max_lng <= max_lng,
+        # ...and re-checked exactly, since R*Tree bounds are 32-bit floats
+        model.latitude.between(min_lat, max_lat),
+        model.longitude.between(min_lng, max_lng),
+    ]
+
+
+def get_relief_centres_in_bbox(
+    db: Session,
+    bbox: Tuple[float, float, float, float],
+    status: Optional[ReliefCentreStatus] = ReliefCentreStatus.ACTIVE,
+    limit: Optional[int] = None
+) -> List[ReliefCentre]:
+    """
+    Get relief centres inside a bounding box, using the R*Tree index
+    
+    Args:
+        db: Database session
+        bbox: (min_lat, min_lng, max_lat, max_lng)
+        status: Only centres with this status (None for all)
+        limit: Maximum number of centres to return
+    
+    Returns:
+        List of relief centres, ordered by id
+    """
+    query = db.query(ReliefCentre).join(
+        relief_centres_rtree, relief_centres_rtree.c.id == ReliefCentre.id
+    ).filter(*_bbox_filters(relief_centres_rtree, ReliefCentre, bbox))
+    if status is not None:
+        query = query.filter(ReliefCentre.status == status)
+    query = query.order_by(ReliefCentre.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def get_relief_requests_in_bbox(
+    db: Session,
+    bbox: Tuple[float, float, float, float],
+    statuses: Optional[List[ReliefRequestStatus]] = None,
+    limit: Optional[int] = None
+) -> List[ReliefRequest]:
+    """
+    Get relief requests inside a bounding box, using the R*Tree index
+    
+    Args:
+        db: Database session
+        bbox: (min_lat, min_lng, max_lat, max_lng)
+        statuses: Only requests in these statuses (default all)
+        limit: Maximum number of requests to return
+    
+    Returns:
+        List of relief requests, newest first
+    """
+    query = db.query(ReliefRequest).join(
+        relief_requests_rtree, relief_requests_rtree.c.id == ReliefRequest.id
+    ).filter(*_bbox_filters(relief_requests_rtree, ReliefRequest, bbox))
+    if statuses:
+        query = query.filter(ReliefRequest.status.in_(statuses))
+    query = query.order_by(desc(ReliefRequest.created_at))
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def get_relief_centres_changed_since(
+    db: Session,
+    since: int,
+    up_to: int,
+    limit: Optional[int] = None
+) -> List[ReliefCentre]:
+    """
+    Get relief centres inserted or updated after a sync cursor
+    
+    Centres of every status are returned, so clients also learn about
+    centres that were deactivated.
+    
+    Args:
+        db: Database session
+        since: Cursor from the client's previous sync
+        up_to: Current cursor; later changes are left for the next sync
+        limit: Maximum number of centres to return
+    
+    Returns:
+        List of relief centres, ordered by version
+    """
+    query = db.query(ReliefCentre).filter(
+        ReliefCentre.version > since,
+        ReliefCentre.version <= up_to
+    ).order_by(ReliefCentre.version)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def get_relief_requests_changed_since(
+    db: Session,
+    since: int,
+    up_to: int,
+    centre_id: Optional[int] = None,
+    limit: Optional[int] = None
+) -> List[ReliefRequest]:
+    """
+    Get relief requests inserted or updated after a sync cursor
+    
+    Args:
+        db: Database session
+        since: Cursor from the client's previous sync
+        up_to: Current cursor; later changes are left for the next sync
+        centre_id: Only requests for this relief centre
+        limit: Maximum number of requests to return
+    
+    Returns:
+        List of relief requests, ordered by version
+    """
+    query = db.query(ReliefRequest).filter(
+        ReliefRequest.version > since,
+        ReliefRequest.version <= up_to
+    )
+    if centre_id is not None:
+        query = query.filter(ReliefRequest.relief_centre_id == centre_id)
+    query = query.order_by(ReliefRequest.version)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
 def calculate_haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """
     Calculate approximate distance between two points using Haversine formula
@@ -59,10 +226,13 @@ def find_nearest_relief_centre(
     Find the nearest relief centre to user location using OSRM routing
     
     Logic:
-    1. Get all active relief centres
-    2. Use Haversine formula to get approximate distances (for filtering)
-    3. Use OSRM route API to get accurate travel distance/time for top candidates
-    4. Select the nearest based on travel distance
+    1. Get the spatial index of active relief centres (rebuilt only when the
+       centres changed)
+    2. Look up the nearest centre in the precomputed service-area grid and,
+       on a hit, only fetch that route from OSRM
+    3. Otherwise rank the closest centres by OSRM travel time with one table
+       call (the ranking shared with rank_relief_centres)
+    4. Fetch the route to the fastest centre, trying the next ones if that fails
     
     Args:
         db: Database session
@@ -76,68 +246,165 @@ def find_nearest_relief_centre(
         ValueError: If no active relief centres found
         Exception: If OSRM routing fails
     """
-    # Get all active relief centres
-    centres = get_all_active_relief_centres(db)
+    with span("centre_index"):
+        index = get_centre_index(db)
     
-    if not centres:
+    if not len(index):
         raise ValueError("No active relief centres found")
     
-    # Calculate approximate distances using Haversine (for initial filtering)
-    # This helps us prioritize which centres to check with OSRM
-    centre_distances = []
-    for centre in centres:
-        approx_distance_km = calculate_haversine_distance(
-            user_lat, user_lng,
-            centre.latitude, centre.longitude
-        )
-        centre_distances.append({
-            "centre": centre,
-            "approx_distance_km": approx_distance_km
-        })
-    
-    # Sort by approximate distance and check top 5 with OSRM
-    # This balances accuracy with API call efficiency
-    centre_distances.sort(key=lambda x: x["approx_distance_km"])
-    top_candidates = centre_distances[:min(5, len(centre_distances))]
+    # Fast path: the service-area grid already knows the nearest centre by ETA
+    with span("service_area.lookup") as lookup:
+        hit = lookup_service_area(index, user_lat, user_lng)
+        lookup.set("hit", hit is not None)
+    if hit is not None:
+        centre = db.query(ReliefCentre).filter(ReliefCentre.id == hit[0]).first()
+        if centre is not None:
+            try:
+                route = get_route(user_lat, user_lng, centre.latitude, centre.longitude)
+                return _nearest_result(centre, route)
+            except Exception as e:
+                print(f"Warning: Failed to get route to {centre.name}: {e}")
     
-    # Use OSRM to get accurate travel distance/time for top candidates
-    nearest_centre = None
-    min_distance = float('inf')
-    best_route = None
+    # Rank by ETA like the grid does; the ranking is measured from the
+    # quantized origin, the route itself from the exact position
+    try:
+        candidate_ids = [entry[0] for entry in _ranked_candidates(db, *quantize_origin(user_lat, user_lng))]
+    except requests.exceptions.RequestException as e:
+        # No OSRM table service: straight-line order is all there is, and
+        # get_route can still answer from the embedded road graph
+        print(f"Warning: Failed to rank relief centres by ETA: {e}")
+        with span("centre_index.nearest"):
+            candidate_ids = [cid for cid, _ in index.nearest(user_lat, user_lng, _ROUTE_ATTEMPTS)]
+    candidate_ids = candidate_ids[:_ROUTE_ATTEMPTS]
+    centres_by_id = {
+        centre.id: centre
+        for centre in db.query(ReliefCentre).filter(ReliefCentre.id.in_(candidate_ids)).all()
+    }
     
-    for candidate in top_candidates:
-        centre = candidate["centre"]
-        
+    for centre_id in candidate_ids:
+        centre = centres_by_id.get(centre_id)
+        if centre is None:
+            continue
         try:
-            # Get route from user to this relief centre using OSRM
-            route = get_route(
-                user_lat, user_lng,
-                centre.latitude, centre.longitude
-            )
-            
-            route_distance = route["summary"]["distance"]
-            
-            # Track the nearest centre based on actual travel distance
-            if route_distance < min_distance:
-                min_distance = route_distance
-                nearest_centre = centre
-                best_route = route
-        
+            route = get_route(user_lat, user_lng, centre.latitude, centre.longitude)
+            return _nearest_result(centre, route)
         except Exception as e:
-            # If OSRM fails for this centre, skip it and try next
+            # If OSRM fails for this centre, try the next fastest
             print(f"Warning: Failed to get route to {centre.name}: {e}")
-            continue
-    
-    if not nearest_centre:
-        raise Exception("Failed to find route to any relief centre. OSRM may be unavailable.")
     
-    # Return nearest centre with route information
+    raise Exception("Failed to find route to any relief centre. OSRM may be unavailable.")
+
+
+def _nearest_result(centre: ReliefCentre, route: Dict[str, Any]) -> Dict[str, Any]:
     return {
-        "relief_centre": nearest_centre,
-        "route": best_route,
-        "distance": best_route["summary"]["distance"],
-        "duration": best_route["summary"]["duration"],
-        "distance_formatted": best_route["summary"]["distance_formatted"],
-        "duration_formatted": best_route["summary"]["duration_formatted"]
+        "relief_centre": centre,
+        "route": route,
+        "distance": route["summary"]["distance"],
+        "duration": route["summary"]["duration"],
+        "distance_formatted": route["summary"]["distance_formatted"],
+        "duration_formatted": route["summary"]["duration_formatted"]
     }
 
+
+def quantize_origin(lat: float, lng: float) -> Tuple[float, float]:
+    """Round an origin to the grid rankings are cached on"""
+    return round(lat, NEAREST_ORIGIN_PRECISION), round(lng, NEAREST_ORIGIN_PRECISION)
+
+
+def _ranked_candidates(db: Session, lat: float, lng: float) -> List[List[float]]:
+    """
+    [centre id, duration, distance] for the centres reachable from a
+    (quantized) origin, fastest first, cached per origin and centre version
+    """
+    index = get_centre_index(db)
+    if not len(index):
+        raise ValueError("No active relief centres found")
+    key = f"nearest:v1:{lat},{lng}:{change_cursor(db, 'relief_centres')}"
+
+    def compute():
+        with span("centre_index.nearest"):
+            candidate_ids = [cid for cid, _ in index.nearest(lat, lng, NEAREST_CANDIDATES)]
+        coordinates = index.coordinates()
+        durations, distances = get_table([(lat, lng)], [coordinates[cid] for cid in candidate_ids])
+        ranked = [
+            [cid, duration, distance]
+            for cid, duration, distance in zip(candidate_ids, durations[0], distances[0])
+            if duration is not None and distance is not None
+        ]
+        ranked.sort(key=lambda entry: entry[1])
+        return ranked
+
+    return get_cache().get_or_compute(key, compute, NEAREST_CACHE_TTL)
+
+
+def rank_relief_centres(
+    db: Session,
+    user_lat: float,
+    user_lng: float,
+    k: int,
+    expand: Optional[List[int]] = None,
+    min_capacity: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    The k best active relief centres by road ETA, as alternatives to the nearest
+    
+    The origin is quantized (see quantize_origin) and all ETAs are measured
+    from the quantized point, so the result is the same for every user in
+    the cell. Candidates are the NEAREST_CANDIDATES closest centres in the
+    spatial index, timed with a single OSRM table call; centres OSRM can't
+    reach are left out. Capacity and status are read fresh on every call.
+    
+    Args:
+        db: Database session
+        user_lat: User latitude
+        user_lng: User longitude
+        k: Number of centres to return
+        expand: Centre ids to include the full route for
+        min_capacity: Skip centres whose known capacity is below this
+            (centres without a capacity are kept)
+    
+    Returns:
+        Dictionary with the quantized "origin" and "centres": one entry per
+        ranked centre with relief_centre, distance, duration, their formatted
+        forms and "route" (None unless expanded)
+    
+    Raises:
+        ValueError: If no active relief centres found
+        requests.exceptions.RequestException: If the OSRM table call fails
+    """
+    lat, lng = quantize_origin(user_lat, user_lng)
+    ranked = _ranked_candidates(db, lat, lng)
+    centres = {
+        centre.id: centre
+        for centre in db.query(ReliefCentre).filter(
+            ReliefCentre.id.in_([entry[0] for entry in ranked]),
+            ReliefCentre.status == ReliefCentreStatus.ACTIVE
+        )
+    }
+    expand_ids = set(expand or ())
+
+    results = []
+    for centre_id, duration, distance in ranked:
+        centre = centres.get(centre_id)
+        if centre is None:
+            continue
+        if min_capacity is not None and centre.capacity is not None and centre.capacity < min_capacity:
+            continue
+        route = None
+        if centre_id in expand_ids:
+            try:
+                route = build_route_response(*get_route_geometry(lat, lng, centre.latitude, centre.longitude))
+            except Exception as e:
+                print(f"Warning: Failed to get route to {centre.name}: {e}")
+        results.append({
+            "relief_centre": centre,
+            "route": route,
+            "distance": distance,
+            "duration": duration,
+            "distance_formatted": format_distance(distance),
+            "duration_formatted": format_duration(duration),
+        })
+        if len(results) == k:
+            break
+
+    return {"origin": {"lat": lat, "lng": lng}, "centres": results}
@@ -0,0 +1,187 @@
+"""
+Server-side clustering of relief requests for map views
+
+Requests inside a viewport are binned into a grid whose cell size follows the
+map zoom level, entirely in SQL: one GROUP BY over (cell, status) for counts
+and centroids, and one over (cell, supply type) using SQLite's json_each on
+the stored supplies array. Rows are located through the relief_requests
+R*Tree index, and the client receives one cluster per occupied cell instead
+of every request row.
+
+Cells are aligned to a global grid, so panning reuses the same cells, and
+results are cached in the shared cache under a version that is bumped
+whenever a request is created.
+"""
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Integer, cast, func, true
+from sqlalchemy.orm import Session
+
+from app.database import ReliefRequest, ReliefRequestStatus, relief_requests_rtree
+from app.services.shared_cache import get_cache
+
+# Grid cells per 256 px map tile; 8 gives ~32 px clusters on screen
+CLUSTER_CELLS_PER_TILE = int(os.getenv("CLUSTER_CELLS_PER_TILE", "8"))
+# Cells are coarsened until a viewport spans at most this many
+CLUSTER_MAX_CELLS = int(os.getenv("CLUSTER_MAX_CELLS", "2048"))
+# How long an aggregation stays cached when no requests are created (seconds)
+CLUSTER_CACHE_TTL = float(os.getenv("CLUSTER_CACHE_TTL", "60"))
+
+_VERSION_KEY = "request_clusters:version"
+
+
+def cluster_cell_size(zoom: int) -> float:
+    """Cell size in degrees for a web map zoom level"""
+    return 360.0 / (2 ** zoom * CLUSTER_CELLS_PER_TILE)
+
+
+def invalidate_request_clusters() -> None:
+    """Drop cached aggregations in every worker (call after requests change)"""
+    # A timestamp rather than a counter, so concurrent bumps need no read
+    get_cache().set(_VERSION_KEY, time.time_ns(), ttl=365 * 24 * 3600)
+
+
+def _clusters_version() -> int:
+    entry = get_cache().get(_VERSION_KEY)
+    return entry[0] if entry is not None else 0
+
+
+def _viewport_cells(
+    bbox: Tuple[float, float, float, float], zoom: int
+) -> Tuple[float, int, int, int, int]:
+    """Cell size and the (row, col) range covering bbox, coarsened to CLUSTER_MAX_CELLS"""
+    min_lat, min_lng, max_lat, max_lng = bbox
+    cell = cluster_cell_size(zoom)
+    while True:
+        row_min, row_max = int((min_lat + 90) // cell), int((max_lat + 90) // cell)
+        col_min, col_max = int((min_lng + 180) // cell), int((max_lng + 180) // cell)
+        if (row_max - row_min + 1) * (col_max - col_min + 1) <= CLUSTER_MAX_CELLS:
+            return cell, row_min, row_max, col_min, col_max
+        cell *= 2
+
+
+def aggregate_requests(
+    db: Session,
+    bbox: Tuple[float, float, float, float],
+    zoom: int,
+    statuses: Optional[List[ReliefRequestStatus]] = None
+) -> Dict[str, Any]:
+    """
+    Cluster the relief requests inside a viewport
+
+    Args:
+        db: Database session
+        bbox: (min_lat, min_lng, max_lat, max_lng)
+        zoom: Map zoom level (0-20), selects the cell size
+        statuses: Only count requests in these statuses (default all)
+
+    Returns:
+        Dictionary with cell_size, total and clusters; each cluster has its
+        centroid, cell bounds, count, and counts by status and supply type
+    """
+    cell, row_min, row_max, col_min, col_max = _viewport_cells(bbox, zoom)
+    status_names = sorted(s.name for s in statuses) if statuses else []
+    key = (
+        f"request_clusters:{_clusters_version()}:{cell!r}:"
+        f"{row_min}:{row_max}:{col_min}:{col_max}:{','.join(status_names)}"
+    )
+    return get_cache().get_or_compute(
+        key,
+        lambda: _compute_clusters(db, cell, row_min, row_max, col_min, col_max, statuses),
+        CLUSTER_CACHE_TTL
+    )
+
+
+def _compute_clusters(
+    db: Session,
+    cell: float,
+    row_min: int,
+    row_max: int,
+    col_min: int,
+    col_max: int,
+    statuses: Optional[List[ReliefRequestStatus]]
+) -> Dict[str, Any]:
+    row = cast((ReliefRequest.latitude + 90) / cell, Integer).label("row")
+    col = cast((ReliefRequest.longitude + 180) / cell, Integer).label("col")
+    # Whole cells, so edge clusters are complete rather than clipped
+    min_lat, max_lat = row_min * cell - 90, (row_max + 1) * cell - 90
+    min_lng, max_lng = col_min * cell - 180, (col_max + 1) * cell - 180
+    rtree = relief_requests_rtree
+    filters = [
+        # Candidate rows come from the R*Tree index (32-bit bounds, so it is
+        # widened slightly and the exact test below decides)
+        rtree.c.id == ReliefRequest.id,
+        rtree.c.min_lat >= min_lat - 1e-4,
+        rtree.c.max_lat <= max_lat + 1e-4,
+        rtree.c.min_lng >= min_lng - 1e-4,
+        rtree.c.max_lng <= max_lng + 1e-4,
+        ReliefRequest.latitude >= min_lat,
+        ReliefRequest.latitude < max_lat,
+        ReliefRequest.longitude >= min_lng,
+        ReliefRequest.longitude < max_lng,
+    ]
+    if statuses:
+        filters.append(ReliefRequest.status.in_(statuses))
+
+    clusters: Dict[Tuple[int, int], Dict[str, Any]] = {}
+    status_rows = (
+        db.query(
+            row, col, ReliefRequest.status,
+            func.count(ReliefRequest.id),
+            func.total(ReliefRequest.latitude),
+            func.total(ReliefRequest.longitude),
+        )
+        .select_from(ReliefRequest)
+        .join(rtree, true())
+        .filter(*filters)
+        .group_by(row, col, ReliefRequest.status)
+        .all()
+    )
+    for r, c, request_status, count, lat_sum, lng_sum in status_rows:
+        cluster = clusters.get((r, c))
+        if cluster is None:
+            cluster = clusters[(r, c)] = {
+                "count": 0, "lat_sum": 0.0, "lng_sum": 0.0, "by_status": {}, "by_supply": {}
+            }
+        cluster["count"] += count
+        cluster["lat_sum"] += lat_sum
+        cluster["lng_sum"] += lng_sum
+        cluster["by_status"][request_status.value] = count
+
+    supply = func.json_each(ReliefRequest.supplies).table_valued("value")
+    supply_rows = (
+        db.query(row, col, supply.c.value, func.count())
+        .select_from(ReliefRequest)
+        .join(rtree, true())
+        .join(supply, true())
+        .filter(*filters)
+        .group_by(row, col, supply.c.value)
+        .all()
+    )
+    for r, c, supply_type, count in supply_rows:
+        cluster = clusters.get((r, c))
+        if cluster is not None:
+            cluster["by_supply"][supply_type] = count
+
+    result = []
+    for (r, c), cluster in clusters.items():
+        count = cluster["count"]
+        result.append({
+            "latitude": round(cluster["lat_sum"] / count, 6),
+            "longitude": round(cluster["lng_sum"] / count, 6),
+            "count": count,
+            "bounds": [
+                r * cell - 90, c * cell - 180,
+                (r + 1) * cell - 90, (c + 1) * cell - 180
+            ],
+            "by_status": cluster["by_status"],
+            "by_supply": cluster["by_supply"],
+        })
+    result.sort(key=lambda cluster: -cluster["count"])
+    return {
+        "cell_size": cell,
+        "total": sum(cluster["count"] for cluster in result),
+        "clusters": result,
+    }
@@ -0,0 +1,122 @@
+"""
+Batched status transitions for relief requests
+
+A volunteer closing a delivery run marks dozens of requests at once. The
+whole batch is classified with one SELECT and applied with one set-based
+UPDATE in one transaction; the UPDATE re-checks the source status, so a
+request changed by someone else in between is reported as a conflict rather
+than overwritten. Caches derived from requests are invalidated once per
+batch, not once per row.
+"""
+from typing import Any, Dict, FrozenSet, List, Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.database import ReliefRequest, ReliefRequestStatus
+from app.services import metrics
+from app.services.request_aggregation import invalidate_request_clusters
+
+# Upper bound on the number of requests in one transition
+MAX_TRANSITION_BATCH = 1000
+
+# Allowed transitions: target status -> statuses it may be reached from.
+# Fulfilled is final; an in-progress request can be handed back as pending.
+ALLOWED_STATUS_TRANSITIONS: Dict[ReliefRequestStatus, FrozenSet[ReliefRequestStatus]] = {
+    ReliefRequestStatus.PENDING: frozenset({ReliefRequestStatus.IN_PROGRESS}),
+    ReliefRequestStatus.IN_PROGRESS: frozenset({ReliefRequestStatus.PENDING}),
+    ReliefRequestStatus.FULFILLED: frozenset({ReliefRequestStatus.PENDING, ReliefRequestStatus.IN_PROGRESS}),
+}
+
+# Per-id outcomes
+UPDATED = "updated"
+UNCHANGED = "unchanged"  # Already in the target status
+NOT_FOUND = "not_found"
+WRONG_CENTRE = "wrong_centre"  # Belongs to a different relief centre
+INVALID_TRANSITION = "invalid_transition"
+CONFLICT = "conflict"  # Changed concurrently before the update
+
+metrics.describe("request_status_transitions_total", "counter", "Relief request status changes by target status")
+
+
+def transition_requests(
+    db: Session,
+    request_ids: List[int],
+    target: ReliefRequestStatus,
+    relief_centre_id: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Move a batch of relief requests to a new status
+
+    Args:
+        db: Database session
+        request_ids: Requests to transition (duplicates are ignored)
+        target: New status
+        relief_centre_id: If given, only requests of this centre may change
+
+    Returns:
+        Dictionary with the target status, the number updated and one
+        result per id: {"id", "outcome", "previous_status"}
+
+    Raises:
+        ValueError: If the batch is larger than MAX_TRANSITION_BATCH
+    """
+    ids = list(dict.fromkeys(request_ids))
+    if len(ids) > MAX_TRANSITION_BATCH:
+        raise ValueError(f"At most {MAX_TRANSITION_BATCH} requests per transition")
+    sources = ALLOWED_STATUS_TRANSITIONS[target]
+
+    current = {
+        row.id: row for row in db.query(
+            ReliefRequest.id, ReliefRequest.status, ReliefRequest.relief_centre_id
+        ).filter(ReliefRequest.id.in_(ids))
+    }
+    outcomes: Dict[int, str] = {}
+    eligible = []
+    for request_id in ids:
+        row = current.get(request_id)
+        if row is None:
+            outcomes[request_id] = NOT_FOUND
+        elif relief_centre_id is not None and row.relief_centre_id != relief_centre_id:
+            outcomes[request_id] = WRONG_CENTRE
+        elif row.status == target:
+            outcomes[request_id] = UNCHANGED
+        elif row.status not in sources:
+            outcomes[request_id] = INVALID_TRANSITION
+        else:
+            eligible.append(request_id)
+
+    updated = set()
+    if eligible:
+        try:
+            result = db.execute(
+                update(ReliefRequest)
+                .where(ReliefRequest.id.in_(eligible), ReliefRequest.status.in_(sources))
+                .values(status=target)
+                .returning(ReliefRequest.id)
+                .execution_options(synchronize_session=False)
+            )
+            updated = {row[0] for row in result}
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        for request_id in eligible:
+            outcomes[request_id] = UPDATED if request_id in updated else CONFLICT
+
+    if updated:
+        invalidate_request_clusters()
+        metrics.inc("request_status_transitions_total", len(updated), status=target.value)
+
+    return {
+        "status": target.value,
+        "updated": len(updated),
+        "results": [
+            {
+                "id": request_id,
+                "outcome": outcomes[request_id],
+                "previous_status": current[request_id].status.value if request_id in current else None,
+            }
+            for request_id in ids
+        ],
+    }
@@ -0,0 +1,90 @@
+"""
+Registry of reported road closures
+
+Closures are circular areas (e.g. a flooded underpass or a collapsed bridge)
+that vehicles can't pass. Derived data such as isochrones depends on them, so
+every update bumps a version number that caches compare against.
+
+The closures live in the road_closures table and their version in
+change_sequence, so an update through any uvicorn worker is seen by all of
+them (and survives restarts). Each process keeps the last list it read and
+only reloads it when the version has moved, so a lookup is normally a single
+primary-key read.
+"""
+import threading
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import text
+
+from app.database import engine
+
+_SEQUENCE_NAME = "road_closures"
+_COLUMNS = ("latitude", "longitude", "radius_m", "description")
+
+# Last list read by this process: (version, closures)
+_loaded: Tuple[int, List[Dict[str, Any]]] = (0, [])
+_lock = threading.Lock()
+
+
+def _read_version(conn) -> int:
+    value = conn.execute(
+        text("SELECT value FROM change_sequence WHERE table_name = :name"),
+        {"name": _SEQUENCE_NAME}
+    ).scalar()
+    return value or 0
+
+
+def get_closures() -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Get the current closures
+
+    Returns:
+        (version, list of closures with latitude, longitude, radius_m, description)
+    """
+    global _loaded
+    with engine.connect() as conn:
+        version = _read_version(conn)
+        with _lock:
+            if _loaded[0] == version:
+                return version, list(_loaded[1])
+        # One statement, so the version read matches the rows
+        rows = conn.execute(text(
+            "SELECT s.value, " + ", ".join(f"c.{c}" for c in _COLUMNS) + " FROM "
+            "(SELECT coalesce(max(value), 0) AS value FROM change_sequence WHERE table_name = :name) s "
+            "LEFT JOIN road_closures c ON 1 ORDER BY c.id"
+        ), {"name": _SEQUENCE_NAME}).all()
+    version = rows[0][0]
+    closures = [dict(zip(_COLUMNS, row[1:])) for row in rows if row[1] is not None]
+    with _lock:
+        _loaded = (version, closures)
+    return version, list(closures)
+
+
+def get_closures_version() -> int:
+    """Version number that changes whenever the closures are updated"""
+    with engine.connect() as conn:
+        return _read_version(conn)
+
+
+def set_closures(closures: List[Dict[str, Any]]) -> int:
+    """
+    Replace all closures
+
+    Returns:
+        The new version number
+    """
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM road_closures"))
+        if closures:
+            conn.execute(
+                text(
+                    f"INSERT INTO road_closures ({', '.join(_COLUMNS)}) "
+                    f"VALUES ({', '.join(':' + c for c in _COLUMNS)})"
+                ),
+                [{c: closure.get(c) for c in _COLUMNS} for closure in closures]
+            )
+        conn.execute(text(
+            "INSERT INTO change_sequence (table_name, value) VALUES (:name, 1) "
+            "ON CONFLICT(table_name) DO UPDATE SET value = value + 1"
+        ), {"name": _SEQUENCE_NAME})
+        return _read_version(conn)
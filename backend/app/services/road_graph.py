@@ -0,0 +1,512 @@
+"""
+Embedded road graph used as a routing fallback when OSRM is unavailable
+
+The graph is built offline from the same OSM extract OSRM uses (see
+build_road_graph.py) and stored as a single binary file of flat arrays that is
+memory-mapped at load time, so opening even a large graph costs almost nothing
+and the pages are shared between worker processes.
+
+Only junctions are graph nodes; the shape points of the road between two
+junctions are stored per edge and only touched when the final geometry is
+assembled. Queries run a bidirectional A* over travel time, optionally
+skipping the edges that pass through circular areas such as road closures.
+
+File layout (native little-endian, every array aligned to 8 bytes):
+    header   magic(8s) node_count(I) edge_count(I) shape_count(I) cell_count(I)
+             max_speed_ms(d) cell_size_deg(d)
+    nodes    lat(i32 * 1e7)[n] lng(i32 * 1e7)[n]
+    edges    source(u32)[m] target(u32)[m] duration_s(f32)[m] distance_m(f32)[m]
+             shape_offset(u32)[m + 1]
+    shapes   lat(i32 * 1e7)[k] lng(i32 * 1e7)[k]
+    forward  offset(u32)[n + 1] edge(u32)[m]     outgoing edges per node
+    reverse  offset(u32)[n + 1] edge(u32)[m]     incoming edges per node
+    grid     key(i64)[c] offset(u32)[c + 1] node(u32)[n]
+"""
+import heapq
+import math
+import mmap
+import struct
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+GRAPH_MAGIC = b"RGRAPH01"
+_HEADER = struct.Struct("<8sIIIIdd")
+COORD_SCALE = 1e7
+DEFAULT_CELL_SIZE_DEG = 0.01
+
+# Scales the straight-line travel time estimate so it stays a lower bound even
+# with the equirectangular approximation used below
+_HEURISTIC_SLACK = 0.98
+_METERS_PER_DEG = 111_195.0
+# Junctions up to this far outside an area are checked for edges crossing it
+_AREA_EDGE_MARGIN_M = 2000.0
+
+
+def _grid_key(lat: float, lng: float, cell_size: float) -> int:
+    columns = int(math.ceil(360 / cell_size))
+    row = int((lat + 90) // cell_size)
+    col = int((lng + 180) // cell_size)
+    return row * columns + col
+
+
+def _aligned(blob: bytearray) -> None:
+    blob.extend(b"\0" * (-len(blob) % 8))
+
+
+def write_graph(
+    path: str,
+    node_coords: Sequence[Tuple[float, float]],
+    edges: Sequence[Tuple[int, int, float, float, Sequence[Tuple[float, float]]]],
+    cell_size: float = DEFAULT_CELL_SIZE_DEG,
+) -> None:
+    """
+    Serialize a road graph to `path`
+
+    Args:
+        node_coords: (lat, lng) per junction node
+        edges: (source, target, duration_s, distance_m, interior shape points)
+            per directed edge
+        cell_size: grid cell size (degrees) of the nearest-node index
+    """
+    n = len(node_coords)
+    m = len(edges)
+
+    node_lat = array("i", (round(lat * COORD_SCALE) for lat, _ in node_coords))
+    node_lng = array("i", (round(lng * COORD_SCALE) for _, lng in node_coords))
+
+    source = array("I")
+    target = array("I")
+    duration = array("f")
+    distance = array("f")
+    shape_offset = array("I", [0])
+    shape_lat = array("i")
+    shape_lng = array("i")
+    for u, v, dur, dist, shape in edges:
+        source.append(u)
+        target.append(v)
+        duration.append(dur)
+        distance.append(dist)
+        for lat, lng in shape:
+            shape_lat.append(round(lat * COORD_SCALE))
+            shape_lng.append(round(lng * COORD_SCALE))
+        shape_offset.append(len(shape_lat))
+
+    def adjacency(key_of):
+        counts = [0] * (n + 1)
+        for e in range(m):
+            counts[key_of(e) + 1] += 1
+        for i in range(n):
+            counts[i + 1] += counts[i]
+        offsets = array("I", counts)
+        slots = list(counts[:-1])
+        edge_ids = array("I", bytes(4 * m))
+        for e in range(m):
+            node = key_of(e)
+            edge_ids[slots[node]] = e
+            slots[node] += 1
+        return offsets, edge_ids
+
+    fwd_offset, fwd_edge = adjacency(lambda e: source[e])
+    rev_offset, rev_edge = adjacency(lambda e: target[e])
+
+    cells: Dict[int, List[int]] = {}
+    for i, (lat, lng) in enumerate(node_coords):
+        cells.setdefault(_grid_key(lat, lng, cell_size), []).append(i)
+    cell_keys = array("q", sorted(cells))
+    cell_offset = array("I", [0])
+    cell_nodes = array("I")
+    for key in cell_keys:
+        cell_nodes.extend(cells[key])
+        cell_offset.append(len(cell_nodes))
+
+    max_speed = max((dist / dur for _, _, dur, dist, _ in edges if dur > 0), default=1.0)
+
+    blob = bytearray(_HEADER.pack(
+        GRAPH_MAGIC, n, m, len(shape_lat), len(cell_keys), max_speed, cell_size
+    ))
+    for arr in (
+        node_lat, node_lng,
+        source, target, duration, distance, shape_offset,
+        shape_lat, shape_lng,
+        fwd_offset, fwd_edge, rev_offset, rev_edge,
+        cell_keys, cell_offset, cell_nodes,
+    ):
+        _aligned(blob)
+        blob.extend(arr.tobytes())
+
+    with open(path, "wb") as f:
+        f.write(blob)
+
+
+class RoadGraph:
+    """Read-only view over a memory-mapped road graph file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+
+        magic, n, m, k, c, max_speed, cell_size = _HEADER.unpack_from(view, 0)
+        if magic != GRAPH_MAGIC:
+            raise ValueError(f"{path} is not a road graph file")
+        self.node_count = n
+        self.edge_count = m
+        self.max_speed = max_speed
+        self.cell_size = cell_size
+
+        offset = _HEADER.size
+
+        def take(fmt: str, count: int) -> memoryview:
+            nonlocal offset
+            offset += -offset % 8
+            size = struct.calcsize(fmt) * count
+            part = view[offset:offset + size].cast(fmt)
+            offset += size
+            return part
+
+        self.node_lat = take("i", n)
+        self.node_lng = take("i", n)
+        self.edge_source = take("I", m)
+        self.edge_target = take("I", m)
+        self.edge_duration = take("f", m)
+        self.edge_distance = take("f", m)
+        self.shape_offset = take("I", m + 1)
+        self.shape_lat = take("i", k)
+        self.shape_lng = take("i", k)
+        self.fwd_offset = take("I", n + 1)
+        self.fwd_edge = take("I", m)
+        self.rev_offset = take("I", n + 1)
+        self.rev_edge = take("I", m)
+        self.cell_keys = take("q", c)
+        self.cell_offset = take("I", c + 1)
+        self.cell_nodes = take("I", n)
+
+    def node_coordinate(self, node: int) -> Tuple[float, float]:
+        """(lat, lng) of a node"""
+        return self.node_lat[node] / COORD_SCALE, self.node_lng[node] / COORD_SCALE
+
+    def nearest_node(self, lat: float, lng: float, max_rings: int = 5) -> Optional[int]:
+        """
+        Snap a coordinate to the closest graph node
+
+        Searches grid cells in growing rings around the query point and stops
+        one ring after the first hit, since a closer node may sit just across
+        a cell boundary.
+        """
+        columns = int(math.ceil(360 / self.cell_size))
+        row = int((lat + 90) // self.cell_size)
+        col = int((lng + 180) // self.cell_size)
+        cos_lat = math.cos(math.radians(lat))
+        best = None
+        best_d = float("inf")
+        found_at = None
+        for ring in range(max_rings + 1):
+            if found_at is not None and ring > found_at + 1:
+                break
+            for dr in range(-ring, ring + 1):
+                for dc in range(-ring, ring + 1):
+                    if max(abs(dr), abs(dc)) != ring:
+                        continue
+                    key = (row + dr) * columns + (col + dc)
+                    i = bisect_left(self.cell_keys, key)
+                    if i == len(self.cell_keys) or self.cell_keys[i] != key:
+                        continue
+                    for j in range(self.cell_offset[i], self.cell_offset[i + 1]):
+                        node = self.cell_nodes[j]
+                        dlat = self.node_lat[node] / COORD_SCALE - lat
+                        dlng = (self.node_lng[node] / COORD_SCALE - lng) * cos_lat
+                        d = dlat * dlat + dlng * dlng
+                        if d < best_d:
+                            best_d = d
+                            best = node
+            if best is not None and found_at is None:
+                found_at = ring
+        return best
+
+    def _edge_points(self, e: int) -> List[Tuple[float, float]]:
+        """(lat, lng) of an edge's source, shape points and target"""
+        points = [self.node_coordinate(self.edge_source[e])]
+        for j in range(self.shape_offset[e], self.shape_offset[e + 1]):
+            points.append((self.shape_lat[j] / COORD_SCALE, self.shape_lng[j] / COORD_SCALE))
+        points.append(self.node_coordinate(self.edge_target[e]))
+        return points
+
+    def edges_in_areas(self, areas: Iterable[Dict[str, Any]]) -> Set[int]:
+        """
+        Edges passing through any of the circular areas
+
+        Only edges with an end within _AREA_EDGE_MARGIN_M of an area are
+        checked, so a longer edge crossing one without a junction nearby is
+        missed; callers should verify the final route.
+
+        Args:
+            areas: Dicts with latitude, longitude and radius_m
+        """
+        columns = int(math.ceil(360 / self.cell_size))
+        blocked: Set[int] = set()
+        for area in areas:
+            lat, lng, radius = area["latitude"], area["longitude"], area.get("radius_m", 0)
+            cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+            pad_lat = (radius + _AREA_EDGE_MARGIN_M) / _METERS_PER_DEG
+            pad_lng = pad_lat / cos_lat
+
+            def inside(points: List[Tuple[float, float]]) -> bool:
+                # Closest approach of each segment to the area centre, in a
+                # local equirectangular projection (meters)
+                xy = [
+                    ((p_lng - lng) * cos_lat * _METERS_PER_DEG, (p_lat - lat) * _METERS_PER_DEG)
+                    for p_lat, p_lng in points
+                ]
+                for (x1, y1), (x2, y2) in zip(xy, xy[1:]):
+                    dx, dy = x2 - x1, y2 - y1
+                    length2 = dx * dx + dy * dy
+                    t = 0.0 if length2 == 0 else max(0.0, min(1.0, -(x1 * dx + y1 * dy) / length2))
+                    px, py = x1 + t * dx, y1 + t * dy
+                    if px * px + py * py <= radius * radius:
+                        return True
+                return False
+
+            row_range = range(int((lat - pad_lat + 90) // self.cell_size), int((lat + pad_lat + 90) // self.cell_size) + 1)
+            col_range = range(int((lng - pad_lng + 180) // self.cell_size), int((lng + pad_lng + 180) // self.cell_size) + 1)
+            for row in row_range:
+                for col in col_range:
+                    key = row * columns + col
+                    i = bisect_left(self.cell_keys, key)
+                    if i == len(self.cell_keys) or self.cell_keys[i] != key:
+                        continue
+                    for j in range(self.cell_offset[i], self.cell_offset[i + 1]):
+                        node = self.cell_nodes[j]
+                        incident = [self.fwd_edge[k] for k in range(self.fwd_offset[node], self.fwd_offset[node + 1])]
+                        incident += [self.rev_edge[k] for k in range(self.rev_offset[node], self.rev_offset[node + 1])]
+                        for e in incident:
+                            if e not in blocked and inside(self._edge_points(e)):
+                                blocked.add(e)
+        return blocked
+
+    def shortest_path(self, source: int, target: int, blocked: Optional[Set[int]] = None) -> Optional[List[int]]:
+        """
+        Fastest path from source to target as a list of edge ids
+
+        Bidirectional A* with the average potential
+        p(v) = (h_target(v) - h_source(v)) / 2, which keeps reduced costs
+        non-negative in both directions so the search can stop as soon as
+        top_forward + top_reverse >= best path found.
+
+        Args:
+            source, target: Node ids
+            blocked: Edge ids that may not be used
+
+        Returns:
+            Edge ids in travel order, [] if source == target, None if unreachable
+        """
+        if source == target:
+            return []
+        blocked = blocked or frozenset()
+
+        # Straight-line travel time lower bounds use an equirectangular
+        # approximation with the longitude scale of the higher endpoint
+        # latitude (plus a margin), which never overestimates nearby distances
+        node_lat, node_lng = self.node_lat, self.node_lng
+        s_lat, s_lng = node_lat[source], node_lng[source]
+        t_lat, t_lng = node_lat[target], node_lng[target]
+        max_abs_lat = max(abs(s_lat), abs(t_lat)) / COORD_SCALE
+        lng_scale = math.cos(math.radians(min(89.0, max_abs_lat + 1.0)))
+        to_seconds = _METERS_PER_DEG / COORD_SCALE * _HEURISTIC_SLACK / self.max_speed
+        sqrt = math.sqrt
+        potentials: Dict[int, float] = {}
+
+        def potential(v: int) -> float:
+            p = potentials.get(v)
+            if p is None:
+                lat, lng = node_lat[v], node_lng[v]
+                dt_lat, dt_lng = lat - t_lat, (lng - t_lng) * lng_scale
+                ds_lat, ds_lng = lat - s_lat, (lng - s_lng) * lng_scale
+                p = 0.5 * to_seconds * (
+                    sqrt(dt_lat * dt_lat + dt_lng * dt_lng) - sqrt(ds_lat * ds_lat + ds_lng * ds_lng)
+                )
+                potentials[v] = p
+            return p
+
+        inf = float("inf")
+        dist_f = {source: 0.0}
+        dist_r = {target: 0.0}
+        parent_f: Dict[int, int] = {}
+        parent_r: Dict[int, int] = {}
+        heap_f = [(potential(source), source)]
+        heap_r = [(-potential(target), target)]
+        best = inf
+        meeting = -1
+
+        fwd_offset, fwd_edge = self.fwd_offset, self.fwd_edge
+        rev_offset, rev_edge = self.rev_offset, self.rev_edge
+        edge_source, edge_target, edge_duration = self.edge_source, self.edge_target, self.edge_duration
+
+        while heap_f and heap_r:
+            if heap_f[0][0] + heap_r[0][0] >= best:
+                break
+            if heap_f[0][0] <= heap_r[0][0]:
+                key, u = heapq.heappop(heap_f)
+                du = dist_f[u]
+                if key > du + potential(u):
+                    continue
+                for j in range(fwd_offset[u], fwd_offset[u + 1]):
+                    e = fwd_edge[j]
+                    if e in blocked:
+                        continue
+                    v = edge_target[e]
+                    nd = du + edge_duration[e]
+                    if nd < dist_f.get(v, inf):
+                        dist_f[v] = nd
+                        parent_f[v] = e
+                        heapq.heappush(heap_f, (nd + potential(v), v))
+                        other = dist_r.get(v)
+                        if other is not None and nd + other < best:
+                            best = nd + other
+                            meeting = v
+            else:
+                key, u = heapq.heappop(heap_r)
+                du = dist_r[u]
+                if key > du - potential(u):
+                    continue
+                for j in range(rev_offset[u], rev_offset[u + 1]):
+                    e = rev_edge[j]
+                    if e in blocked:
+                        continue
+                    v = edge_source[e]
+                    nd = du + edge_duration[e]
+                    if nd < dist_r.get(v, inf):
+                        dist_r[v] = nd
+                        parent_r[v] = e
+                        heapq.heappush(heap_r, (nd - potential(v), v))
+                        other = dist_f.get(v)
+                        if other is not None and nd + other < best:
+                            best = nd + other
+                            meeting = v
+
+        if meeting < 0:
+            return None
+
+        path = []
+        node = meeting
+        while node != source:
+            e = parent_f[node]
+            path.append(e)
+            node = edge_source[e]
+        path.reverse()
+        node = meeting
+        while node != target:
+            e = parent_r[node]
+            path.append(e)
+            node = edge_target[e]
+        return path
+
+    def travel_times_to(
+        self,
+        target: int,
+        blocked: Optional[Set[int]] = None,
+        max_seconds: float = float("inf")
+    ) -> Dict[int, float]:
+        """
+        Fastest travel time from every node within max_seconds to target
+
+        Plain Dijkstra over the reverse edges, for one-to-many questions such
+        as isochrones where a per-pair search would repeat most of the work.
+
+        Args:
+            target: Node id
+            blocked: Edge ids that may not be used
+            max_seconds: Search radius; nodes further away are left out
+
+        Returns:
+            Node id -> travel time in seconds
+        """
+        blocked = blocked or frozenset()
+        rev_offset, rev_edge = self.rev_offset, self.rev_edge
+        edge_source, edge_duration = self.edge_source, self.edge_duration
+        dist = {target: 0.0}
+        done: Dict[int, float] = {}
+        heap = [(0.0, target)]
+        while heap:
+            du, u = heapq.heappop(heap)
+            if u in done:
+                continue
+            done[u] = du
+            for j in range(rev_offset[u], rev_offset[u + 1]):
+                e = rev_edge[j]
+                if e in blocked:
+                    continue
+                v = edge_source[e]
+                nd = du + edge_duration[e]
+                if nd <= max_seconds and nd < dist.get(v, float("inf")):
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        return done
+
+    def path_geometry(self, path: Sequence[int], start_node: int) -> List[List[float]]:
+        """[lng, lat] coordinates of a path, including each edge's shape points"""
+        lat, lng = self.node_coordinate(start_node)
+        coordinates = [[lng, lat]]
+        for e in path:
+            for j in range(self.shape_offset[e], self.shape_offset[e + 1]):
+                coordinates.append([self.shape_lng[j] / COORD_SCALE, self.shape_lat[j] / COORD_SCALE])
+            lat, lng = self.node_coordinate(self.edge_target[e])
+            coordinates.append([lng, lat])
+        return coordinates
+
+    def route(
+        self,
+        start_lat: float,
+        start_lng: float,
+        end_lat: float,
+        end_lng: float,
+        avoid: Iterable[Dict[str, Any]] = ()
+    ) -> Tuple[List[List[float]], float, float]:
+        """
+        Route between two coordinates
+
+        Args:
+            avoid: Circular areas (latitude, longitude, radius_m) the route
+                may not pass through, e.g. road closures
+
+        Returns:
+            (coordinates as [lng, lat] pairs, distance in meters, duration in seconds)
+
+        Raises:
+            ValueError: If a coordinate can't be snapped or no path exists
+        """
+        source = self.nearest_node(start_lat, start_lng)
+        target = self.nearest_node(end_lat, end_lng)
+        if source is None or target is None:
+            raise ValueError("Coordinate is outside the embedded road graph")
+        blocked = self.edges_in_areas(avoid) if avoid else None
+        path = self.shortest_path(source, target, blocked)
+        if path is None:
+            raise ValueError("No route found in the embedded road graph")
+
+        coordinates = self.path_geometry(path, source)
+        if len(coordinates) == 1:
+            coordinates.append(list(coordinates[0]))
+        distance = sum(self.edge_distance[e] for e in path)
+        duration = sum(self.edge_duration[e] for e in path)
+        return coordinates, distance, duration
+
+
+_graph: Optional[RoadGraph] = None
+_graph_lock = threading.Lock()
+
+
+def load_road_graph(path: str) -> Optional[RoadGraph]:
+    """Load (once) and return the road graph at `path`, or None if it doesn't exist"""
+    global _graph
+    if _graph is not None and _graph.path == path:
+        return _graph
+    with _graph_lock:
+        if _graph is None or _graph.path != path:
+            try:
+                _graph = RoadGraph(path)
+            except FileNotFoundError:
+                return None
+    return _graph
@@ -0,0 +1,326 @@
+"""
+Compact in-memory representation of route geometry
+
+Routes used to travel through the services as lists of [lng, lat] lists.
+RouteGeometry keeps the same vertices in three contiguous array('d') columns
+(longitude, latitude and cumulative distance from the start), so sampling,
+simplification and hazard checks work on flat arrays and the geometry is
+only expanded to nested lists where an API response needs them. An optional
+fourth column holds the expected travel time from the start to each vertex
+(from OSRM's per-segment durations), so the ETA at any point is a lookup.
+
+Memory per cached route (CPython 3.x, 64-bit):
+    list of [lng, lat] lists   ~125 bytes per vertex (outer slot 8, inner
+                               list 72, two float objects 2 x 24)
+    RouteGeometry              24 bytes per vertex (3 x 8-byte doubles), 32
+                               with ETAs, plus ~250 bytes fixed overhead
+    cache entry (to_cache)     ~32 bytes per vertex, ~43 with ETAs (base64
+                               of the columns)
+A typical 1,000-vertex urban route therefore drops from ~125 KB to ~24 KB.
+"""
+import base64
+import math
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+_EARTH_RADIUS_M = 6_371_000.0
+_METERS_PER_DEG = math.pi * _EARTH_RADIUS_M / 180
+
+
+def _haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    dlat = math.radians(lat2 - lat1)
+    dlng = math.radians(lng2 - lng1)
+    a = (
+        math.sin(dlat / 2) ** 2 +
+        math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
+        math.sin(dlng / 2) ** 2
+    )
+    return 2 * _EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class RouteGeometry:
+    """Route vertices as flat coordinate arrays with cumulative distance"""
+
+    __slots__ = ("lngs", "lats", "cumulative", "eta")
+
+    def __init__(
+        self,
+        lngs: array,
+        lats: array,
+        cumulative: Optional[array] = None,
+        eta: Optional[array] = None
+    ):
+        if len(lngs) != len(lats) or (eta is not None and len(eta) != len(lngs)):
+            raise ValueError("Route geometry columns differ in length")
+        self.lngs = lngs
+        self.lats = lats
+        if cumulative is None:
+            cumulative = array("d", [0.0]) * len(lngs)
+            for i in range(1, len(lngs)):
+                cumulative[i] = cumulative[i - 1] + _haversine_m(
+                    lats[i - 1], lngs[i - 1], lats[i], lngs[i]
+                )
+        self.cumulative = cumulative
+        # Seconds from the start to each vertex, when known
+        self.eta = eta
+
+    @classmethod
+    def from_coordinates(cls, coordinates: Iterable[Sequence[float]]) -> "RouteGeometry":
+        """Build from [lng, lat] pairs (GeoJSON order)"""
+        lngs = array("d")
+        lats = array("d")
+        for coord in coordinates:
+            lngs.append(coord[0])
+            lats.append(coord[1])
+        return cls(lngs, lats)
+
+    def __len__(self) -> int:
+        return len(self.lngs)
+
+    @property
+    def length(self) -> float:
+        """Total length in meters"""
+        return self.cumulative[-1] if len(self.cumulative) else 0.0
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the coordinate, distance and ETA arrays"""
+        return sum(a.itemsize * len(a) for a in self._columns())
+
+    def _columns(self) -> List[array]:
+        columns = [self.lngs, self.lats, self.cumulative]
+        if self.eta is not None:
+            columns.append(self.eta)
+        return columns
+
+    def with_segment_durations(self, durations: Sequence[float]) -> "RouteGeometry":
+        """
+        Attach ETAs from per-segment travel times (OSRM duration annotations)
+
+        Falls back to spreading the total evenly by distance if the number of
+        durations doesn't match the number of segments.
+        """
+        if len(durations) != len(self.lngs) - 1:
+            return self.with_total_duration(sum(durations))
+        eta = array("d", [0.0]) * len(self.lngs)
+        for i, duration in enumerate(durations, 1):
+            eta[i] = eta[i - 1] + (duration or 0.0)
+        return RouteGeometry(self.lngs, self.lats, self.cumulative, eta)
+
+    def with_total_duration(self, duration: float) -> "RouteGeometry":
+        """Attach ETAs assuming constant speed over the whole route"""
+        length = self.length
+        scale = duration / length if length > 0 else 0.0
+        eta = array("d", (d * scale for d in self.cumulative))
+        return RouteGeometry(self.lngs, self.lats, self.cumulative, eta)
+
+    def eta_at(self, distance_m: float) -> Optional[float]:
+        """Seconds from the start to the point distance_m meters along, if ETAs are known"""
+        if self.eta is None or not len(self.lngs):
+            return None
+        if len(self.lngs) == 1 or distance_m <= 0:
+            return self.eta[0]
+        if distance_m >= self.cumulative[-1]:
+            return self.eta[-1]
+        i = bisect_right(self.cumulative, distance_m) - 1
+        seg = self.cumulative[i + 1] - self.cumulative[i]
+        t = (distance_m - self.cumulative[i]) / seg if seg > 0 else 0.0
+        return self.eta[i] + t * (self.eta[i + 1] - self.eta[i])
+
+    def start(self) -> Tuple[float, float]:
+        """(lng, lat) of the first vertex"""
+        return self.lngs[0], self.lats[0]
+
+    def end(self) -> Tuple[float, float]:
+        """(lng, lat) of the last vertex"""
+        return self.lngs[-1], self.lats[-1]
+
+    def bbox(self) -> Tuple[float, float, float, float]:
+        """(min_lat, min_lng, max_lat, max_lng)"""
+        return min(self.lats), min(self.lngs), max(self.lats), max(self.lngs)
+
+    def interpolate(self, distance_m: float) -> Tuple[float, float]:
+        """(lng, lat) of the point distance_m meters along the route"""
+        n = len(self.lngs)
+        if n == 1 or distance_m <= 0:
+            return self.start()
+        if distance_m >= self.cumulative[-1]:
+            return self.end()
+        i = bisect_right(self.cumulative, distance_m) - 1
+        seg = self.cumulative[i + 1] - self.cumulative[i]
+        t = (distance_m - self.cumulative[i]) / seg if seg > 0 else 0.0
+        return (
+            self.lngs[i] + t * (self.lngs[i + 1] - self.lngs[i]),
+            self.lats[i] + t * (self.lats[i + 1] - self.lats[i]),
+        )
+
+    def sample(self, count: int) -> List[Tuple[float, float, float]]:
+        """
+        Points evenly spaced by distance, including both ends
+
+        Returns:
+            (lng, lat, distance along the route in meters) for each point
+        """
+        if count <= 0 or not len(self.lngs):
+            return []
+        if count == 1:
+            lng, lat = self.start()
+            return [(lng, lat, 0.0)]
+        step = self.length / (count - 1)
+        return [(*self.interpolate(i * step), i * step) for i in range(count)]
+
+    def simplify(self, tolerance_m: float) -> "RouteGeometry":
+        """
+        Douglas-Peucker simplification
+
+        Vertices within tolerance_m of the simplified line are dropped; the
+        result keeps the first and last vertex.
+        """
+        n = len(self.lngs)
+        if n <= 2 or tolerance_m <= 0:
+            return self
+        # Local equirectangular projection to meters
+        kx = _METERS_PER_DEG * math.cos(math.radians(sum(self.bbox()[0::2]) / 2))
+        ky = _METERS_PER_DEG
+        xs, ys = self.lngs, self.lats
+        keep = bytearray(n)
+        keep[0] = keep[-1] = 1
+        tolerance_sq = tolerance_m * tolerance_m
+        stack = [(0, n - 1)]
+        while stack:
+            first, last = stack.pop()
+            ax, ay = xs[first] * kx, ys[first] * ky
+            dx, dy = xs[last] * kx - ax, ys[last] * ky - ay
+            seg_sq = dx * dx + dy * dy
+            worst, worst_sq = -1, tolerance_sq
+            for i in range(first + 1, last):
+                px, py = xs[i] * kx - ax, ys[i] * ky - ay
+                t = (px * dx + py * dy) / seg_sq if seg_sq > 0 else 0.0
+                t = 0.0 if t < 0 else 1.0 if t > 1 else t
+                ex, ey = px - t * dx, py - t * dy
+                dist_sq = ex * ex + ey * ey
+                if dist_sq > worst_sq:
+                    worst, worst_sq = i, dist_sq
+            if worst >= 0:
+                keep[worst] = 1
+                stack.append((first, worst))
+                stack.append((worst, last))
+        indices = [i for i in range(n) if keep[i]]
+        return RouteGeometry(
+            array("d", (xs[i] for i in indices)),
+            array("d", (ys[i] for i in indices)),
+            eta=array("d", (self.eta[i] for i in indices)) if self.eta is not None else None,
+        )
+
+    def locate(
+        self,
+        lat: float,
+        lng: float,
+        start_m: float = 0.0,
+        end_m: Optional[float] = None
+    ) -> Tuple[float, float, int]:
+        """
+        Project a point onto the route
+
+        Args:
+            lat, lng: Point to project
+            start_m, end_m: Only consider the part of the route between
+                these distances (e.g. just ahead of a tracked vehicle)
+
+        Returns:
+            (distance from the route in meters, distance along the route in
+            meters of the closest point, index of the segment it lies on)
+        """
+        kx = _METERS_PER_DEG * math.cos(math.radians(lat))
+        ky = _METERS_PER_DEG
+        xs, ys, cumulative = self.lngs, self.lats, self.cumulative
+        if len(xs) == 1:
+            return math.hypot((xs[0] - lng) * kx, (ys[0] - lat) * ky), 0.0, 0
+        first = min(max(1, bisect_left(cumulative, start_m)), len(xs) - 1) if start_m > 0 else 1
+        last = len(xs) - 1
+        if end_m is not None:
+            last = max(first, min(last, bisect_right(cumulative, end_m)))
+        best_sq, best_along, best_seg = math.inf, 0.0, first - 1
+        bx, by = (xs[first - 1] - lng) * kx, (ys[first - 1] - lat) * ky
+        for i in range(first, last + 1):
+            ax, ay = bx, by
+            bx, by = (xs[i] - lng) * kx, (ys[i] - lat) * ky
+            dx, dy = bx - ax, by - ay
+            seg_sq = dx * dx + dy * dy
+            t = -(ax * dx + ay * dy) / seg_sq if seg_sq > 0 else 0.0
+            t = 0.0 if t < 0 else 1.0 if t > 1 else t
+            ex, ey = ax + t * dx, ay + t * dy
+            dist_sq = ex * ex + ey * ey
+            if dist_sq < best_sq:
+                best_sq = dist_sq
+                best_seg = i - 1
+                best_along = cumulative[i - 1] + t * (cumulative[i] - cumulative[i - 1])
+        return math.sqrt(best_sq), best_along, best_seg
+
+    def hazards_along(
+        self,
+        hazards: Iterable[Dict[str, Any]],
+        start_m: float = 0.0
+    ) -> List[Tuple[Dict[str, Any], float]]:
+        """
+        Circular hazards (e.g. road closures) the route passes through
+
+        Args:
+            hazards: Dicts with latitude, longitude and radius_m
+            start_m: Ignore the part of the route before this distance
+
+        Returns:
+            (hazard, distance along the route in meters) pairs, in route order
+        """
+        if not len(self.lngs):
+            return []
+        min_lat, min_lng, max_lat, max_lng = self.bbox()
+        hits = []
+        for hazard in hazards:
+            lat, lng = hazard["latitude"], hazard["longitude"]
+            radius = hazard.get("radius_m", 0)
+            # Cheap bounding-box rejection before projecting onto every segment
+            pad_lat = radius / _METERS_PER_DEG
+            pad_lng = pad_lat / max(math.cos(math.radians(lat)), 1e-6)
+            if not (min_lat - pad_lat <= lat <= max_lat + pad_lat and
+                    min_lng - pad_lng <= lng <= max_lng + pad_lng):
+                continue
+            distance, along, _ = self.locate(lat, lng)
+            if distance <= radius and along + radius >= start_m:
+                hits.append((hazard, along))
+        hits.sort(key=lambda hit: hit[1])
+        return hits
+
+    def to_coordinates(self) -> List[List[float]]:
+        """[lng, lat] pairs, for API responses that need plain lists"""
+        return [[lng, lat] for lng, lat in zip(self.lngs, self.lats)]
+
+    def coordinates_json(self) -> str:
+        """The [lng, lat] pairs rendered directly as a JSON array"""
+        return "[" + ",".join(map("[{!r},{!r}]".format, self.lngs, self.lats)) + "]"
+
+    def to_bytes(self) -> bytes:
+        """Pack a column count, then the columns back to back (lngs, lats, cumulative[, eta])"""
+        columns = self._columns()
+        return struct.pack("<Q", len(columns)) + b"".join(c.tobytes() for c in columns)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "RouteGeometry":
+        (column_count,) = struct.unpack_from("<Q", data)
+        values = array("d")
+        values.frombytes(data[8:])
+        n = len(values) // column_count if column_count in (3, 4) else -1
+        if n < 0 or n * column_count != len(values):
+            raise ValueError("Packed route geometry has an invalid length")
+        eta = values[3 * n:] if column_count == 4 else None
+        return cls(values[:n], values[n:2 * n], values[2 * n:3 * n], eta)
+
+    def to_cache(self) -> str:
+        """JSON-safe packed form for the shared cache"""
+        return base64.b64encode(self.to_bytes()).decode("ascii")
+
+    @classmethod
+    def from_cache(cls, data: str) -> "RouteGeometry":
+        return cls.from_bytes(base64.b64decode(data))
@@ -0,0 +1,406 @@
+"""
+Route tracking sessions: follow a vehicle along its route without re-routing
+
+A vehicle reporting its position every few seconds used to request a new
+route each time. A tracking session keeps the active route instead, and each
+position update is handled locally:
+- The position is projected onto the route just ahead of the last matched
+  point (RouteGeometry.locate with a window), falling back to the whole
+  remaining route, and the remaining distance and ETA are read off the
+  cached geometry.
+- Only when the vehicle is off the route for TRACKING_OFF_ROUTE_FIXES
+  consecutive fixes, or the road closures change and one of them lies on
+  the remaining route, is a new route requested from the current position.
+  New routes avoid the closures (see get_route_geometry_avoiding). If there
+  is no way around a closure ahead, the route is kept and the closure is
+  only reported in "hazards".
+
+Sessions live in the shared cache, so any worker can serve a vehicle's
+updates. Each route is stored once as an immutable entry (and decoded at
+most once per process); only the small session state is written per update.
+Every read-modify-write of a session holds the session key's cache lock (a
+lease across workers), so concurrent updates can't both take the same route
+version or overwrite each other's state. Sessions expire after
+TRACKING_SESSION_TTL seconds without updates.
+
+Without a shared cache, sessions are kept in their own in-process
+MemoryCache rather than the general one, so cached routes and weather can't
+push them out of its LRU before they expire.
+"""
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services import metrics
+from app.services.osrm_service import (
+    build_route_response,
+    format_distance,
+    format_duration,
+    get_route_geometry,
+    get_route_geometry_avoiding
+)
+from app.services.road_closures import get_closures
+from app.services.route_geometry import RouteGeometry
+from app.services.shared_cache import MemoryCache, get_cache
+from app.services.tracing import span
+
+# Seconds without a position update before a session expires
+TRACKING_SESSION_TTL = float(os.getenv("TRACKING_SESSION_TTL", "1800"))
+# A position further than this from the route (meters) counts as off route
+TRACKING_OFF_ROUTE_M = float(os.getenv("TRACKING_OFF_ROUTE_M", "60"))
+# Consecutive off-route positions before re-routing (absorbs GPS jumps)
+TRACKING_OFF_ROUTE_FIXES = int(os.getenv("TRACKING_OFF_ROUTE_FIXES", "2"))
+# Remaining distance (meters) at which the vehicle counts as arrived
+TRACKING_ARRIVAL_M = float(os.getenv("TRACKING_ARRIVAL_M", "30"))
+# Sessions kept per process when there is no shared cache (least recently
+# updated ones are dropped beyond this)
+TRACKING_MAX_SESSIONS = int(os.getenv("TRACKING_MAX_SESSIONS", "10000"))
+# Matching window around the last matched point: how far back (GPS jitter)
+# and at least how far ahead; the lookahead grows with time since the last
+# fix at TRACKING_MAX_SPEED_MS
+TRACKING_BACKTRACK_M = 100.0
+TRACKING_LOOKAHEAD_M = 2000.0
+TRACKING_MAX_SPEED_MS = 50.0
+
+# Position outcomes
+ON_ROUTE = "on_route"
+OFF_ROUTE = "off_route"
+REROUTED = "rerouted"
+ARRIVED = "arrived"
+# Re-route reasons (besides OFF_ROUTE)
+HAZARD = "hazard"
+
+# Decoded routes kept per process (route entries never change once written)
+_GEOMETRY_CACHE_SIZE = 256
+
+metrics.describe("route_tracking_updates_total", "counter", "Tracked position updates by outcome")
+metrics.describe("route_tracking_reroutes_total", "counter", "Tracking session re-routes by reason")
+
+_geometries: "OrderedDict[str, Tuple[RouteGeometry, float, float]]" = OrderedDict()
+_geometries_lock = threading.Lock()
+_SNAPSHOT_NAME = "tracking_sessions"
+
+_sessions: Optional[MemoryCache] = None
+_sessions_lock = threading.Lock()
+
+
+def _store():
+    """The shared cache, or the process's own session cache if that is in memory"""
+    global _sessions
+    cache = get_cache()
+    if not isinstance(cache, MemoryCache):
+        return cache
+    if _sessions is None:
+        with _sessions_lock:
+            if _sessions is None:
+                # A state and the current route entry per session
+                _sessions = MemoryCache(max_entries=2 * TRACKING_MAX_SESSIONS)
+    return _sessions
+
+
+def load_tracking_snapshot() -> int:
+    """Restore in-process sessions from the last snapshot; returns the number of entries"""
+    store = _store()
+    return store.load_snapshot(_SNAPSHOT_NAME) if isinstance(store, MemoryCache) else 0
+
+
+def save_tracking_snapshot() -> None:
+    store = _store()
+    if isinstance(store, MemoryCache):
+        store.save_snapshot(_SNAPSHOT_NAME)
+
+
+class TrackingSessionNotFound(KeyError):
+    """No tracking session with this id (never created, ended or expired)"""
+
+
+def _state_key(session_id: str) -> str:
+    return f"track:{session_id}"
+
+
+def _route_key(session_id: str, route_version: int) -> str:
+    return f"track:{session_id}:route:{route_version}"
+
+
+def _store_route(session_id: str, route_version: int, geometry: RouteGeometry, distance: float, duration: float) -> None:
+    key = _route_key(session_id, route_version)
+    _store().set(key, {"geometry": geometry.to_cache(), "distance": distance, "duration": duration}, TRACKING_SESSION_TTL)
+    _remember_geometry(key, (geometry, distance, duration))
+
+
+def _remember_geometry(key: str, route: Tuple[RouteGeometry, float, float]) -> None:
+    with _geometries_lock:
+        _geometries[key] = route
+        _geometries.move_to_end(key)
+        while len(_geometries) > _GEOMETRY_CACHE_SIZE:
+            _geometries.popitem(last=False)
+
+
+def _load_route(session_id: str, route_version: int) -> Tuple[RouteGeometry, float, float]:
+    key = _route_key(session_id, route_version)
+    cache = _store()
+    entry = cache.get(key)
+    if entry is None:
+        raise TrackingSessionNotFound(session_id)
+    data, age = entry
+    if age > TRACKING_SESSION_TTL / 2:
+        # Keep the route alive as long as the session is
+        cache.set(key, data, TRACKING_SESSION_TTL)
+    with _geometries_lock:
+        route = _geometries.get(key)
+        if route is not None:
+            _geometries.move_to_end(key)
+            return route
+    route = (RouteGeometry.from_cache(data["geometry"]), data["distance"], data["duration"])
+    _remember_geometry(key, route)
+    return route
+
+
+def _hazards_ahead(state: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Closures on the active route not yet passed, with how far ahead they are"""
+    progress = state["progress"]
+    return [
+        {**{k: v for k, v in hazard.items() if k != "along"}, "distance_ahead": max(0.0, hazard["along"] - progress)}
+        for hazard in state["hazards"]
+        if hazard["along"] + hazard.get("radius_m", 0) >= progress
+    ]
+
+
+def _remaining(geometry: RouteGeometry, distance: float, duration: float, along: float) -> Tuple[float, float]:
+    """(meters, seconds) left from the point along meters into the route"""
+    length = geometry.length
+    remaining_m = max(0.0, length - along)
+    eta_now, eta_end = geometry.eta_at(along), geometry.eta_at(length)
+    if eta_now is not None and eta_end is not None:
+        remaining_s = max(0.0, eta_end - eta_now)
+    else:
+        remaining_s = duration * remaining_m / length if length > 0 else 0.0
+    # Geometry length and OSRM's distance differ slightly; report OSRM's scale
+    if length > 0:
+        remaining_m *= distance / length
+    return remaining_m, remaining_s
+
+
+def _new_route(
+    session_id: str,
+    state: Dict[str, Any],
+    lat: float,
+    lng: float,
+    closures: List[Dict[str, Any]],
+    must_avoid: bool = False
+) -> Tuple[RouteGeometry, float, float]:
+    """
+    Route from (lat, lng) to the session's destination, stored as the next
+    route version
+
+    The route avoids the closures where possible; if it can't, the direct
+    route is used unless must_avoid is set.
+
+    Raises:
+        ValueError: If must_avoid is set and no route avoids the closures
+    """
+    end_lat, end_lng = state["end_lat"], state["end_lng"]
+    try:
+        geometry, distance, duration = get_route_geometry_avoiding(lat, lng, end_lat, end_lng, closures)
+    except ValueError:
+        if must_avoid:
+            raise
+        geometry, distance, duration = get_route_geometry(lat, lng, end_lat, end_lng)
+    previous = state["route_version"]
+    state["route_version"] += 1
+    state["progress"] = 0.0
+    state["off_route_fixes"] = 0
+    _store_route(session_id, state["route_version"], geometry, distance, duration)
+    if previous:
+        # Readers hold the session lock, so nobody still needs the old route
+        _store().delete(_route_key(session_id, previous))
+    return geometry, distance, duration
+
+
+def _result(
+    session_id: str,
+    state: Dict[str, Any],
+    route: Tuple[RouteGeometry, float, float],
+    outcome: str,
+    distance_from_route: float,
+    include_route: bool,
+    reroute_reason: Optional[str] = None
+) -> Dict[str, Any]:
+    geometry, distance, duration = route
+    remaining_m, remaining_s = _remaining(geometry, distance, duration, state["progress"])
+    return {
+        "session_id": session_id,
+        "status": outcome,
+        "reroute_reason": reroute_reason,
+        "route_version": state["route_version"],
+        "distance_from_route": distance_from_route,
+        "progress": state["progress"],
+        "remaining_distance": remaining_m,
+        "remaining_duration": remaining_s,
+        "remaining_distance_formatted": format_distance(remaining_m),
+        "remaining_duration_formatted": format_duration(remaining_s),
+        "hazards": _hazards_ahead(state),
+        "route": build_route_response(geometry, distance, duration) if include_route else None,
+        "reroutes": state["reroutes"],
+    }
+
+
+def _set_hazards(state: Dict[str, Any], geometry: RouteGeometry, closures_version: int, closures: List[Dict[str, Any]]) -> None:
+    state["closures_version"] = closures_version
+    state["hazards"] = [
+        {**hazard, "along": along} for hazard, along in geometry.hazards_along(closures)
+    ]
+
+
+def _save(session_id: str, state: Dict[str, Any]) -> None:
+    _store().set(_state_key(session_id), state, TRACKING_SESSION_TTL)
+
+
+def start_tracking(start_lat: float, start_lng: float, end_lat: float, end_lng: float) -> Dict[str, Any]:
+    """
+    Start a tracking session with a route from start to end
+
+    Returns:
+        The session state as returned by update_position, with "route" set
+
+    Raises:
+        Exception: If no route could be computed (see get_route_geometry)
+    """
+    session_id = secrets.token_urlsafe(16)
+    state = {
+        "end_lat": end_lat,
+        "end_lng": end_lng,
+        "route_version": 0,
+        "progress": 0.0,
+        "off_route_fixes": 0,
+        "reroutes": 0,
+        "updated_at": time.time(),
+        "closures_version": 0,
+        "hazards": [],
+    }
+    closures_version, closures = get_closures()
+    route = _new_route(session_id, state, start_lat, start_lng, closures)
+    _set_hazards(state, route[0], closures_version, closures)
+    _save(session_id, state)
+    return _result(session_id, state, route, ON_ROUTE, 0.0, include_route=True)
+
+
+def _load_state(session_id: str) -> Dict[str, Any]:
+    entry = _store().get(_state_key(session_id))
+    if entry is None:
+        raise TrackingSessionNotFound(session_id)
+    return entry[0]
+
+
+def get_tracking(session_id: str) -> Dict[str, Any]:
+    """
+    Current state of a session, including the active route (for clients
+    resuming after a reconnect)
+
+    Raises:
+        TrackingSessionNotFound: If the session doesn't exist
+    """
+    with _store().lock(_state_key(session_id)):
+        state = _load_state(session_id)
+        route = _load_route(session_id, state["route_version"])
+        remaining_m = _remaining(*route, state["progress"])[0]
+        outcome = ARRIVED if remaining_m <= TRACKING_ARRIVAL_M else ON_ROUTE
+        return _result(session_id, state, route, outcome, 0.0, include_route=True)
+
+
+def update_position(session_id: str, lat: float, lng: float) -> Dict[str, Any]:
+    """
+    Match a vehicle position onto its session's route
+
+    Args:
+        session_id: Tracking session
+        lat, lng: Current vehicle position
+
+    Returns:
+        Dictionary with status (on_route, off_route, rerouted or arrived),
+        reroute_reason (off_route or hazard, when rerouted), route_version,
+        distance_from_route, progress along the route, remaining distance and
+        duration (plus formatted forms), closures still ahead on the route
+        ("hazards", including ones there was no way around), the new route
+        when rerouted (else None) and the number of reroutes so far
+
+    Raises:
+        TrackingSessionNotFound: If the session doesn't exist
+    """
+    with _store().lock(_state_key(session_id)):
+        state = _load_state(session_id)
+        route = _load_route(session_id, state["route_version"])
+        geometry = route[0]
+        now = time.time()
+        elapsed = max(0.0, now - state["updated_at"])
+        state["updated_at"] = now
+
+        reroute_reason = None
+        with span("tracking.match"):
+            # Where the vehicle is expected to be first, then the whole remaining route
+            start_m = max(0.0, state["progress"] - TRACKING_BACKTRACK_M)
+            lookahead = max(TRACKING_LOOKAHEAD_M, elapsed * TRACKING_MAX_SPEED_MS)
+            offset, along, _ = geometry.locate(lat, lng, start_m, state["progress"] + lookahead)
+            if offset > TRACKING_OFF_ROUTE_M:
+                offset, along, _ = geometry.locate(lat, lng, start_m)
+
+        if offset > TRACKING_OFF_ROUTE_M:
+            state["off_route_fixes"] += 1
+            if state["off_route_fixes"] >= TRACKING_OFF_ROUTE_FIXES:
+                reroute_reason = OFF_ROUTE
+        else:
+            state["off_route_fixes"] = 0
+            state["progress"] = along
+
+        closures_version, closures = get_closures()
+        if closures_version != state["closures_version"]:
+            # Closures changed: re-route only if one now lies on the road ahead
+            _set_hazards(state, geometry, closures_version, closures)
+            if reroute_reason is None and _hazards_ahead(state):
+                reroute_reason = HAZARD
+
+        if reroute_reason is not None:
+            try:
+                route = _new_route(session_id, state, lat, lng, closures, must_avoid=reroute_reason == HAZARD)
+            except Exception as e:
+                if reroute_reason == HAZARD and isinstance(e, ValueError):
+                    # No way around the closure: keep the route and report the
+                    # hazard; not retried until the closures change again
+                    print(f"Warning: Tracking session can't avoid the closure ahead: {e}")
+                else:
+                    # Keep following the old route; the next update tries again
+                    print(f"Warning: Failed to re-route tracking session: {e}")
+            else:
+                state["reroutes"] += 1
+                _set_hazards(state, route[0], closures_version, closures)
+                _save(session_id, state)
+                metrics.inc("route_tracking_reroutes_total", reason=reroute_reason)
+                metrics.inc("route_tracking_updates_total", outcome=REROUTED)
+                return _result(session_id, state, route, REROUTED, offset, include_route=True, reroute_reason=reroute_reason)
+
+        _save(session_id, state)
+        if offset > TRACKING_OFF_ROUTE_M:
+            outcome = OFF_ROUTE
+        elif _remaining(*route, state["progress"])[0] <= TRACKING_ARRIVAL_M:
+            outcome = ARRIVED
+        else:
+            outcome = ON_ROUTE
+        metrics.inc("route_tracking_updates_total", outcome=outcome)
+        return _result(session_id, state, route, outcome, offset, include_route=False)
+
+
+def end_tracking(session_id: str) -> None:
+    """
+    End a session
+
+    Raises:
+        TrackingSessionNotFound: If the session doesn't exist
+    """
+    with _store().lock(_state_key(session_id)):
+        state = _load_state(session_id)
+        cache = _store()
+        cache.delete(_state_key(session_id))
+        cache.delete(_route_key(session_id, state["route_version"]))
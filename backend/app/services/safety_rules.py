@@ -0,0 +1,262 @@
+"""
+Configurable rules engine for weather safety assessment
+
+Thresholds and severities used to be hard-coded in assess_safety_status.
+They now live in a rule set (DEFAULT_SAFETY_RULES, or a JSON file named by
+SAFETY_RULES_PATH) that is compiled once and evaluated column by column over
+a batch of weather samples: each rule makes one pass over the column it
+tests, so assessing a route's samples or a whole region's tiles costs a
+handful of passes instead of an if-chain per point.
+
+Rule set format:
+    {
+      "rules": [
+        {"type": "Heavy Rainfall", "field": "rainfall", "op": ">", "value": 20,
+         "severity": "high", "level": "unsafe", "group": "rainfall",
+         "description": "Heavy rainfall detected: {value:.1f}mm/h"},
+        ...
+      ],
+      "alert_levels": {"high": "unsafe"},
+      "messages": {"safe": "...", "caution": "...", "unsafe": "..."}
+    }
+Within a group only the first matching rule applies (like an if/elif
+chain). A point's level is the highest level of any matching rule or of its
+alerts' severities as mapped by alert_levels. Descriptions are format
+strings receiving the tested value as {value}.
+"""
+import json
+import operator
+import os
+import threading
+from array import array
+from itertools import compress, repeat
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+SAFETY_RULES_PATH = os.getenv("SAFETY_RULES_PATH", "")
+
+LEVELS = ("safe", "caution", "unsafe")
+
+DEFAULT_SAFETY_RULES: Dict[str, Any] = {
+    "rules": [
+        {"type": "Heavy Rainfall", "field": "rainfall", "op": ">", "value": 20.0,
+         "severity": "high", "level": "unsafe", "group": "rainfall",
+         "description": "Heavy rainfall detected: {value:.1f}mm/h"},
+        {"type": "Moderate Rainfall", "field": "rainfall", "op": ">", "value": 10.0,
+         "severity": "moderate", "level": "caution", "group": "rainfall",
+         "description": "Moderate rainfall: {value:.1f}mm/h"},
+        {"type": "Severe Weather", "field": "condition", "op": "in",
+         "value": ["thunderstorm", "extreme"],
+         "severity": "high", "level": "unsafe", "group": "condition",
+         "description": "Severe weather condition: {value}"},
+        {"type": "Dangerous Weather", "field": "condition", "op": "in",
+         "value": ["heavy rain", "squall", "tornado"],
+         "severity": "high", "level": "unsafe", "group": "condition",
+         "description": "Dangerous weather: {value}"},
+        {"type": "Strong Winds", "field": "wind_speed", "op": ">", "value": 20.0,
+         "severity": "moderate", "level": "caution",
+         "description": "Strong winds: {value:.1f}m/s"},
+    ],
+    "alert_levels": {"high": "unsafe"},
+    "messages": {
+        "safe": "✅ SAFE TO TRAVEL - Weather conditions are favorable",
+        "caution": "⚠️ TRAVEL WITH CAUTION - Adverse weather conditions",
+        "unsafe": "⚠️ NOT SAFE TO TRAVEL - Severe weather conditions detected",
+    },
+}
+
+_NUMERIC_OPS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+}
+
+
+class _CompiledRule:
+    __slots__ = ("type", "field", "numeric", "test", "value", "severity", "level", "group", "description")
+
+    def __init__(self, spec: Dict[str, Any], index: int):
+        self.type = spec["type"]
+        self.field = spec["field"]
+        op = spec.get("op", ">")
+        if op in _NUMERIC_OPS:
+            self.numeric = True
+            self.test = _NUMERIC_OPS[op]
+            self.value = float(spec["value"])
+        elif op == "in":
+            self.numeric = False
+            self.test = frozenset(str(v).lower() for v in spec["value"]).__contains__
+            self.value = None
+        else:
+            raise ValueError(f"Unknown operator {op!r} in safety rule {self.type!r}")
+        level = spec.get("level", "caution")
+        if level not in LEVELS:
+            raise ValueError(f"Unknown level {level!r} in safety rule {self.type!r}")
+        self.level = LEVELS.index(level)
+        self.severity = spec.get("severity", "moderate")
+        # Ungrouped rules behave like their own group
+        self.group = spec.get("group") or f"#{index}"
+        self.description = spec.get("description", self.type)
+
+    def matches(self, column: Sequence) -> List[bool]:
+        if self.numeric:
+            return list(map(self.test, column, repeat(self.value)))
+        return list(map(self.test, column))
+
+
+class WeatherBatch:
+    """Weather samples stored column-wise: one array or list per field"""
+
+    def __init__(self, size: int, columns: Dict[str, Sequence], alerts: Sequence[List[Dict[str, Any]]]):
+        self.size = size
+        self.columns = columns
+        self.alerts = alerts
+
+    @classmethod
+    def from_records(cls, records: Sequence[Dict[str, Any]], fields: Iterable[str], numeric: Iterable[str]) -> "WeatherBatch":
+        numeric = set(numeric)
+        columns: Dict[str, Sequence] = {}
+        for field in fields:
+            if field in numeric:
+                columns[field] = array("d", (float(r.get(field) or 0.0) for r in records))
+            else:
+                columns[field] = [str(r.get(field) or "").lower() for r in records]
+        return cls(len(records), columns, [r.get("alerts") or [] for r in records])
+
+
+class BatchAssessment:
+    """Per-point and aggregate safety for a batch"""
+
+    def __init__(self, rules: "SafetyRules", batch: WeatherBatch, levels: bytearray, hits: List[List[int]]):
+        self._rules = rules
+        self._batch = batch
+        self.levels = levels
+        # Per rule (in rule order), the indices of the points it matched
+        self._hits = hits
+        self._by_point: Optional[List[List[int]]] = None
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+    def status(self, i: int) -> str:
+        return LEVELS[self.levels[i]]
+
+    def statuses(self) -> List[str]:
+        return [LEVELS[level] for level in self.levels]
+
+    def point(self, i: int) -> Dict[str, Any]:
+        """The assess_safety_status result for point i"""
+        if self._by_point is None:
+            by_point = [[] for _ in range(len(self.levels))]
+            for r, hits in enumerate(self._hits):
+                for j in hits:
+                    by_point[j].append(r)
+            self._by_point = by_point
+        calamities = []
+        for r in self._by_point[i]:
+            rule = self._rules.rules[r]
+            value = self._batch.columns[rule.field][i]
+            calamities.append({
+                "type": rule.type,
+                "severity": rule.severity,
+                "description": rule.description.format(value=value)
+            })
+        for alert in self._batch.alerts[i]:
+            calamities.append({
+                "type": alert.get("event", "Weather Alert"),
+                "severity": alert.get("severity", "moderate"),
+                "description": alert.get("description", "")
+            })
+        status = self.status(i)
+        return {
+            "status": status,
+            "message": self._rules.messages[status],
+            "calamities": calamities
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        """Worst status, count per status and count per calamity type"""
+        counts = {level: 0 for level in LEVELS}
+        for level in self.levels:
+            counts[LEVELS[level]] += 1
+        calamities = {}
+        for rule, hits in zip(self._rules.rules, self._hits):
+            if hits:
+                calamities[rule.type] = calamities.get(rule.type, 0) + len(hits)
+        worst = LEVELS[max(self.levels)] if self.levels else "safe"
+        return {
+            "status": worst,
+            "message": self._rules.messages[worst],
+            "counts": counts,
+            "calamities": calamities
+        }
+
+
+class SafetyRules:
+    """A compiled rule set"""
+
+    def __init__(self, config: Dict[str, Any]):
+        self.rules = [_CompiledRule(spec, i) for i, spec in enumerate(config.get("rules", []))]
+        self.alert_levels = {
+            severity: LEVELS.index(level) for severity, level in config.get("alert_levels", {}).items()
+        }
+        self.messages = {**DEFAULT_SAFETY_RULES["messages"], **config.get("messages", {})}
+        self.fields = list(dict.fromkeys(rule.field for rule in self.rules))
+        self.numeric_fields = {rule.field for rule in self.rules if rule.numeric}
+
+    def batch(self, records: Sequence[Dict[str, Any]]) -> WeatherBatch:
+        """Columnar batch of the fields these rules test"""
+        return WeatherBatch.from_records(records, self.fields, self.numeric_fields)
+
+    def evaluate(self, batch: WeatherBatch) -> BatchAssessment:
+        """Evaluate every rule over the whole batch, one column pass per rule"""
+        levels = bytearray(batch.size)
+        # Points already claimed by an earlier rule of the same group
+        claimed: Dict[str, bytearray] = {}
+        hits: List[List[int]] = []
+        for rule in self.rules:
+            mask = rule.matches(batch.columns[rule.field])
+            taken = claimed.get(rule.group)
+            if taken is None:
+                taken = claimed[rule.group] = bytearray(batch.size)
+            else:
+                mask = [m and not t for m, t in zip(mask, taken)]
+            matched = list(compress(range(batch.size), mask))
+            for i in matched:
+                taken[i] = 1
+                if levels[i] < rule.level:
+                    levels[i] = rule.level
+            hits.append(matched)
+        if self.alert_levels:
+            for i, alerts in enumerate(batch.alerts):
+                for alert in alerts:
+                    level = self.alert_levels.get(alert.get("severity"))
+                    if level is not None and levels[i] < level:
+                        levels[i] = level
+        return BatchAssessment(self, batch, levels, hits)
+
+    def assess(self, records: Sequence[Dict[str, Any]]) -> BatchAssessment:
+        return self.evaluate(self.batch(records))
+
+
+_rules: Optional[SafetyRules] = None
+_rules_lock = threading.Lock()
+
+
+def load_safety_rules(path: str = SAFETY_RULES_PATH) -> SafetyRules:
+    """Compile the rule set from a JSON file, or the defaults if path is empty"""
+    if not path:
+        return SafetyRules(DEFAULT_SAFETY_RULES)
+    with open(path, "r", encoding="utf-8") as f:
+        return SafetyRules(json.load(f))
+
+
+def get_safety_rules() -> SafetyRules:
+    """The process-wide compiled rule set (compiled on first use)"""
+    global _rules
+    if _rules is None:
+        with _rules_lock:
+            if _rules is None:
+                _rules = load_safety_rules()
+    return _rules
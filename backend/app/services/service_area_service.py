@@ -0,0 +1,340 @@
+"""
+Precomputed travel-time service areas (a travel-time Voronoi diagram)
+
+The region around the active relief centres is divided into a regular grid.
+Every cell stores the id of the centre with the shortest OSRM travel time
+from the cell centre, and that travel time. Nearest-centre lookups become an
+array index; only the winning route's geometry still needs OSRM.
+
+Each cell is only ranked against its SERVICE_AREA_CANDIDATES nearest centres
+by straight-line distance (from the centre index), and cells are processed in
+square tiles so one OSRM table call covers a tile and the few centres near
+it; no cells x centres matrix is ever built. The grid is updated
+incrementally: activating a centre re-ranks the cells that have it among
+their nearest candidates, deactivating one re-ranks only the cells it owned.
+The grid records the fingerprint of the centre index it was built from, so
+checking whether it is current is a single comparison.
+It is snapshotted after every change (see snapshots.py) so restarts reuse it;
+the snapshot is memory-mapped at startup and only copied when next updated.
+Building and updating run on a background thread; until the grid covers the
+current set of active centres, lookups for affected cells simply miss and the
+caller falls back to direct routing. Every worker process keeps its own grid,
+but tile rankings go through the shared cache, so when several workers sync
+to the same centres only one of them times each tile with OSRM.
+"""
+import hashlib
+import math
+import os
+import threading
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from app.services.centre_index import CentreIndex
+from app.services.osrm_service import get_table
+from app.services.shared_cache import get_cache
+from app.services.snapshots import read_snapshot, write_snapshot
+
+# Grid cell size in degrees (~500 m)
+SERVICE_AREA_CELL_DEG = float(os.getenv("SERVICE_AREA_CELL_DEG", "0.005"))
+# Margin added around the active centres when no explicit region is configured
+SERVICE_AREA_PADDING_DEG = float(os.getenv("SERVICE_AREA_PADDING_DEG", "0.1"))
+# Optional fixed region "min_lat,min_lng,max_lat,max_lng"
+SERVICE_AREA_BBOX = os.getenv("SERVICE_AREA_BBOX", "")
+# Centres (closest by straight-line distance) each cell is ranked against
+SERVICE_AREA_CANDIDATES = int(os.getenv("SERVICE_AREA_CANDIDATES", "5"))
+# Cells are ranked in square tiles of this many cells per side
+_TILE_CELLS = 16
+# Ranked tiles stay in the shared cache this long (seconds) for other workers
+_TILE_CACHE_TTL = 600
+_SNAPSHOT_NAME = "service_area"
+NO_CENTRE = -1
+
+# centre id -> (lat, lng)
+CentreCoords = Dict[int, Tuple[float, float]]
+
+
+class ServiceAreaGrid:
+    """Owner centre and travel time per grid cell"""
+
+    def __init__(self, bbox: Tuple[float, float, float, float], cell_deg: float):
+        self.bbox = bbox
+        self.cell_deg = cell_deg
+        self.rows = max(1, int(math.ceil((bbox[2] - bbox[0]) / cell_deg)))
+        self.cols = max(1, int(math.ceil((bbox[3] - bbox[1]) / cell_deg)))
+        size = self.rows * self.cols
+        self.owner = array("i", [NO_CENTRE]) * size
+        self.eta = array("f", [math.inf]) * size
+        self.centres: CentreCoords = {}
+        # Fingerprint of the centre index the grid was last synced to
+        self.fingerprint = ""
+
+    def cell_index(self, lat: float, lng: float) -> Optional[int]:
+        row = int((lat - self.bbox[0]) // self.cell_deg)
+        col = int((lng - self.bbox[1]) // self.cell_deg)
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            return row * self.cols + col
+        return None
+
+    def cell_centre(self, index: int) -> Tuple[float, float]:
+        row, col = divmod(index, self.cols)
+        return (
+            self.bbox[0] + (row + 0.5) * self.cell_deg,
+            self.bbox[1] + (col + 0.5) * self.cell_deg,
+        )
+
+    def _tiles(self, cells: Optional[Iterable[int]] = None) -> Iterator[List[int]]:
+        """Cell indexes grouped by tile (all cells if none are given)"""
+        t = _TILE_CELLS
+        if cells is None:
+            for row0 in range(0, self.rows, t):
+                for col0 in range(0, self.cols, t):
+                    yield [
+                        row * self.cols + col
+                        for row in range(row0, min(row0 + t, self.rows))
+                        for col in range(col0, min(col0 + t, self.cols))
+                    ]
+            return
+        tiles: Dict[Tuple[int, int], List[int]] = {}
+        for i in cells:
+            row, col = divmod(i, self.cols)
+            tiles.setdefault((row // t, col // t), []).append(i)
+        yield from tiles.values()
+
+    def _rank(self, index: CentreIndex, cells: Optional[Iterable[int]] = None, only: Optional[Set[int]] = None) -> None:
+        """
+        Give cells to whichever of their nearest candidate centres is faster
+        than their current owner
+
+        Args:
+            index: Active centres
+            cells: Cells to rank (default: all)
+            only: Only consider these centre ids as candidates
+        """
+        cache = get_cache()
+        for tile in self._tiles(cells):
+            # The same grid, tile and candidates give the same ranking in
+            # every worker, so the key only needs to capture those
+            digest = hashlib.sha1(repr((
+                index.fingerprint, self.bbox, self.cell_deg, tile,
+                sorted(only) if only is not None else None,
+            )).encode()).hexdigest()
+            ranked = cache.get_or_compute(
+                f"service_area:v1:{digest}",
+                lambda: self._rank_tile(index, tile, only),
+                _TILE_CACHE_TTL
+            )
+            for i, cid, duration in ranked:
+                if duration < self.eta[i]:
+                    self.eta[i] = duration
+                    self.owner[i] = cid
+
+    def _rank_tile(self, index: CentreIndex, tile: List[int], only: Optional[Set[int]]) -> List[list]:
+        """[cell, centre id, travel time] of the fastest candidate per cell, from one OSRM table call"""
+        coords = index.coordinates()
+        sources = []
+        candidates: Set[int] = set()
+        for i in tile:
+            lat, lng = self.cell_centre(i)
+            nearest = [
+                cid for cid, _ in index.nearest(lat, lng, SERVICE_AREA_CANDIDATES)
+                if only is None or cid in only
+            ]
+            if nearest:
+                sources.append(i)
+                candidates.update(nearest)
+        if not sources:
+            return []
+        ids = list(candidates)
+        durations, _ = get_table(
+            [self.cell_centre(i) for i in sources],
+            [coords[cid] for cid in ids]
+        )
+        ranked = []
+        for i, row in zip(sources, durations):
+            best = min(
+                ((duration, cid) for cid, duration in zip(ids, row) if duration is not None),
+                default=None
+            )
+            if best is not None:
+                ranked.append([i, best[1], best[0]])
+        return ranked
+
+    def activate(self, index: CentreIndex, centre_ids: Optional[Set[int]] = None) -> None:
+        """Add centres (default: all in the index); each cell keeps whichever centre is now fastest"""
+        coords = index.coordinates()
+        if centre_ids is None:
+            centre_ids = set(coords)
+        if not centre_ids:
+            return
+        self._rank(index, only=centre_ids)
+        self.centres.update({cid: coords[cid] for cid in centre_ids})
+
+    def deactivate(self, centre_ids: List[int], index: CentreIndex) -> None:
+        """Remove centres and re-rank only the cells they owned against the active ones"""
+        removed = set(centre_ids)
+        for cid in removed:
+            self.centres.pop(cid, None)
+        orphaned = [i for i, owner in enumerate(self.owner) if owner in removed]
+        for i in orphaned:
+            self.owner[i] = NO_CENTRE
+            self.eta[i] = math.inf
+        if orphaned and len(index):
+            self._rank(index, cells=orphaned)
+
+    def lookup(self, lat: float, lng: float) -> Optional[Tuple[int, float]]:
+        """(centre id, travel time in seconds) for a point, None outside the grid"""
+        index = self.cell_index(lat, lng)
+        if index is None or self.owner[index] == NO_CENTRE:
+            return None
+        return self.owner[index], self.eta[index]
+
+    def save(self) -> None:
+        write_snapshot(_SNAPSHOT_NAME, {
+            "bbox": self.bbox,
+            "cell_deg": self.cell_deg,
+            "fingerprint": self.fingerprint,
+            "centres": {str(k): v for k, v in self.centres.items()},
+        }, {
+            "owner": array("i", self.owner),
+            "eta": array("f", self.eta),
+        })
+
+    @classmethod
+    def load(cls) -> Optional["ServiceAreaGrid"]:
+        """Memory-map the last snapshot; arrays stay read-only until the next update copies them"""
+        snapshot = read_snapshot(_SNAPSHOT_NAME)
+        if snapshot is None:
+            return None
+        meta, arrays = snapshot
+        try:
+            grid = cls(tuple(meta["bbox"]), meta["cell_deg"])
+            size = grid.rows * grid.cols
+            if len(arrays["owner"]) != size or len(arrays["eta"]) != size:
+                return None
+            grid.owner = arrays["owner"]
+            grid.eta = arrays["eta"]
+            grid.centres = {int(k): tuple(v) for k, v in meta["centres"].items()}
+            grid.fingerprint = meta.get("fingerprint", "")
+        except (KeyError, TypeError, ValueError):
+            return None
+        return grid
+
+
+def _region_for(centres: CentreCoords) -> Tuple[float, float, float, float]:
+    if SERVICE_AREA_BBOX:
+        min_lat, min_lng, max_lat, max_lng = (float(v) for v in SERVICE_AREA_BBOX.split(","))
+        return min_lat, min_lng, max_lat, max_lng
+    lats = [lat for lat, _ in centres.values()]
+    lngs = [lng for _, lng in centres.values()]
+    pad = SERVICE_AREA_PADDING_DEG
+    return min(lats) - pad, min(lngs) - pad, max(lats) + pad, max(lngs) + pad
+
+
+def _covers(bbox, centres: CentreCoords) -> bool:
+    return all(
+        bbox[0] <= lat <= bbox[2] and bbox[1] <= lng <= bbox[3]
+        for lat, lng in centres.values()
+    )
+
+
+_grid: Optional[ServiceAreaGrid] = None
+_grid_lock = threading.Lock()
+_sync_lock = threading.Lock()
+_loaded = False
+
+
+def load_service_area_snapshot() -> bool:
+    """Load the last snapshot (once); returns True if a grid is available"""
+    global _grid, _loaded
+    with _grid_lock:
+        if not _loaded:
+            _loaded = True
+            _grid = ServiceAreaGrid.load()
+        return _grid is not None
+
+
+def sync_service_area(index: CentreIndex) -> None:
+    """
+    Bring the grid in line with the active centres (blocking)
+
+    Moved centres are treated as a deactivation plus an activation. A full
+    rebuild only happens when there is no grid yet or an active centre lies
+    outside the grid's region.
+    """
+    global _grid
+    load_service_area_snapshot()
+    with _grid_lock:
+        current = _grid
+
+    active = index.coordinates()
+    if not active or (current is not None and current.fingerprint == index.fingerprint):
+        return
+    if current is None or not _covers(current.bbox, active):
+        grid = ServiceAreaGrid(_region_for(active), SERVICE_AREA_CELL_DEG)
+        grid.activate(index)
+    else:
+        # Work on a copy so lookups never see a half-updated grid
+        grid = ServiceAreaGrid(current.bbox, current.cell_deg)
+        grid.owner = array("i", current.owner)
+        grid.eta = array("f", current.eta)
+        grid.centres = dict(current.centres)
+        removed = [cid for cid, coords in grid.centres.items() if active.get(cid) != coords]
+        added = {cid for cid, coords in active.items() if grid.centres.get(cid) != coords}
+        grid.deactivate(removed, index)
+        grid.activate(index, added)
+    grid.fingerprint = index.fingerprint
+
+    with _grid_lock:
+        _grid = grid
+    grid.save()
+
+
+def request_service_area_sync(index: CentreIndex) -> bool:
+    """
+    Start a background sync unless one is already running
+
+    Returns:
+        True if a sync was started
+    """
+    if not _sync_lock.acquire(blocking=False):
+        return False
+
+    def run():
+        try:
+            sync_service_area(index)
+        except Exception as e:
+            print(f"Warning: Service area update failed: {e}")
+        finally:
+            _sync_lock.release()
+
+    threading.Thread(target=run, name="service-area-sync", daemon=True).start()
+    return True
+
+
+def lookup_service_area(index: CentreIndex, lat: float, lng: float) -> Optional[Tuple[int, float]]:
+    """
+    Nearest active centre for a point from the precomputed grid
+
+    Schedules a background update when the grid was built from a different
+    centre index than `index`.
+
+    Returns:
+        (centre id, travel time in seconds), or None if the grid can't answer
+        reliably for this point yet
+    """
+    load_service_area_snapshot()
+    with _grid_lock:
+        grid = _grid
+    if grid is None or grid.fingerprint != index.fingerprint:
+        # A centre added since the last sync might be closer, so a stale
+        # grid doesn't answer at all
+        request_service_area_sync(index)
+        return None
+    hit = grid.lookup(lat, lng)
+    if hit is None:
+        return None
+    # The fingerprint is a summary, so still make sure the winner is active
+    # where the grid thinks it is
+    if index.coordinates().get(hit[0]) != grid.centres.get(hit[0]):
+        return None
+    return hit
@@ -0,0 +1,373 @@
+"""
+Cache backend shared between uvicorn worker processes
+
+With several workers, an in-process cache is duplicated and cold in every
+worker and each one pays upstream costs separately. SQLiteCache keeps entries
+in one SQLite file (WAL mode) on the local disk, so all workers on the host
+see the same entries, and get_or_compute() uses a lease row so only one
+process computes a missing key while the others wait for its result.
+
+MemoryCache offers the same interface for single-process deployments and is
+used when SHARED_CACHE_PATH is set to an empty string. Since it would start
+cold after every restart, it can be snapshotted to disk; a loaded snapshot is
+memory-mapped and entries are only decoded when first read.
+
+lock(key) serializes read-modify-write updates of one key across threads
+and, for SQLiteCache, across processes.
+
+Values must be JSON-serializable.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from app.services import metrics
+from app.services.snapshots import read_snapshot, write_snapshot
+
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "shared_cache.db")
+# How long a worker may hold a compute lease before others take over (seconds)
+SHARED_CACHE_LEASE_TIMEOUT = float(os.getenv("SHARED_CACHE_LEASE_TIMEOUT", "30"))
+# Entries kept by the in-process backend
+MEMORY_CACHE_MAX_ENTRIES = int(os.getenv("MEMORY_CACHE_MAX_ENTRIES", "10000"))
+
+metrics.describe("cache_requests_total", "counter", "Cache lookups by namespace and result")
+
+
+def _namespace(key: str) -> str:
+    return key.split(":", 1)[0]
+
+
+class KeyLocks:
+    """
+    Per-key locks so threads of one process don't compute the same key twice
+
+    A key's lock only exists while some thread holds or waits for it, so the
+    table doesn't grow with the number of keys ever computed.
+    """
+
+    def __init__(self):
+        self._locks: Dict[Hashable, list] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: Hashable) -> threading.Lock:
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        entry[0].acquire()
+        return entry[0]
+
+    def release(self, key: Hashable) -> None:
+        with self._lock:
+            entry = self._locks[key]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+        entry[0].release()
+
+
+class MemoryCache:
+    """In-process cache with TTLs and LRU eviction"""
+
+    def __init__(self, max_entries: int = MEMORY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        # key -> (value, created_at, expires_at)
+        self._entries: "OrderedDict[str, Tuple[Any, float, float]]" = OrderedDict()
+        # Entries loaded from a snapshot and not decoded yet: key -> position
+        self._cold: Dict[str, int] = {}
+        self._cold_arrays: Dict[str, memoryview] = {}
+        self._lock = threading.Lock()
+        self._key_locks = KeyLocks()
+
+    def _thaw(self, key: str) -> Optional[Tuple[Any, float, float]]:
+        """Decode a snapshot entry into the live entries (caller holds the lock)"""
+        i = self._cold.pop(key, None)
+        if i is None:
+            return None
+        arrays = self._cold_arrays
+        raw = arrays["blob"][arrays["offsets"][i]:arrays["offsets"][i + 1]]
+        entry = (json.loads(bytes(raw)), arrays["created"][i], arrays["expires"][i])
+        self._entries[key] = entry
+        return entry
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """(value, age in seconds) or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._thaw(key)
+            if entry is None:
+                return None
+            if entry[2] < now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0], now - entry[1]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._cold.pop(key, None)
+            self._entries[key] = (value, now, now + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._cold.pop(key, None)
+            self._entries.pop(key, None)
+
+    @contextmanager
+    def lock(self, key: str):
+        """Hold key exclusively within this process for the duration of the block"""
+        self._key_locks.acquire(key)
+        try:
+            yield
+        finally:
+            self._key_locks.release(key)
+
+    def save_snapshot(self, name: str = "memory_cache") -> int:
+        """Write unexpired entries to a snapshot; returns the number written"""
+        now = time.time()
+        with self._lock:
+            for key in list(self._cold):
+                self._thaw(key)
+            entries = [(k, e) for k, e in self._entries.items() if e[2] >= now]
+        keys = []
+        offsets = array("Q", [0])
+        created = array("d")
+        expires = array("d")
+        blob = bytearray()
+        for key, (value, created_at, expires_at) in entries:
+            keys.append(key)
+            blob += json.dumps(value).encode()
+            offsets.append(len(blob))
+            created.append(created_at)
+            expires.append(expires_at)
+        write_snapshot(name, {"keys": keys}, {
+            "offsets": offsets,
+            "created": created,
+            "expires": expires,
+            "blob": array("B", blob),
+        })
+        return len(keys)
+
+    def load_snapshot(self, name: str = "memory_cache") -> int:
+        """Map a snapshot written by save_snapshot; returns the number of entries"""
+        snapshot = read_snapshot(name)
+        if snapshot is None:
+            return 0
+        meta, arrays = snapshot
+        keys = meta.get("keys", [])
+        if len(arrays.get("offsets", ())) != len(keys) + 1:
+            return 0
+        with self._lock:
+            self._cold_arrays = arrays
+            self._cold = {
+                key: i for i, key in enumerate(keys) if key not in self._entries
+            }
+        return len(keys)
+
+    def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Any],
+        ttl: float,
+        max_age: Optional[float] = None
+    ) -> Any:
+        """
+        Cached value, or the result of compute() stored under key
+
+        Entries older than max_age count as missing. Only one caller computes
+        a key at a time; concurrent callers wait and reuse its result.
+        compute() returning None is passed through without being stored.
+        """
+        entry = self.get(key)
+        if entry is not None and (max_age is None or entry[1] <= max_age):
+            metrics.inc("cache_requests_total", namespace=_namespace(key), result="hit")
+            return entry[0]
+        self._key_locks.acquire(key)
+        try:
+            entry = self.get(key)
+            if entry is not None and (max_age is None or entry[1] <= max_age):
+                metrics.inc("cache_requests_total", namespace=_namespace(key), result="hit")
+                return entry[0]
+            metrics.inc("cache_requests_total", namespace=_namespace(key), result="miss")
+            value = compute()
+            if value is not None:
+                self.set(key, value, ttl)
+            return value
+        finally:
+            self._key_locks.release(key)
+
+
+class SQLiteCache:
+    """Cache stored in a local SQLite file, shared by all processes using it"""
+
+    def __init__(self, path: str, lease_timeout: float = SHARED_CACHE_LEASE_TIMEOUT):
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self._local = threading.local()
+        self._key_locks = KeyLocks()
+        self._owner = uuid.uuid4().hex
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_leases ("
+            "key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """(value, age in seconds) or None if missing or expired"""
+        now = time.time()
+        row = self._conn().execute(
+            "SELECT value, created_at FROM cache_entries WHERE key = ? AND expires_at >= ?",
+            (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), now - row[1]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, created_at, expires_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now, now + ttl)
+        )
+        # Opportunistic cleanup keeps the file from growing without a janitor process
+        if hash((key, now)) % 1000 == 0:
+            conn.execute("DELETE FROM cache_entries WHERE expires_at < ?", (now,))
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def _claim_lease(self, key: str) -> bool:
+        now = time.time()
+        cursor = self._conn().execute(
+            "INSERT INTO cache_leases (key, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE cache_leases.expires_at < ?",
+            (key, self._owner, now + self.lease_timeout, now)
+        )
+        return cursor.rowcount == 1
+
+    def _release_lease(self, key: str) -> None:
+        self._conn().execute(
+            "DELETE FROM cache_leases WHERE key = ? AND owner = ?", (key, self._owner)
+        )
+
+    def _lease_held(self, key: str) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM cache_leases WHERE key = ? AND expires_at >= ?", (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    @contextmanager
+    def lock(self, key: str):
+        """
+        Hold key exclusively across all processes for the duration of the block
+
+        Uses the key's lease, so a holder that dies (or takes longer than
+        lease_timeout) doesn't block the others forever.
+        """
+        self._key_locks.acquire(key)
+        try:
+            delay = 0.01
+            while not self._claim_lease(key):
+                time.sleep(delay)
+                delay = min(delay * 2, 0.2)
+            try:
+                yield
+            finally:
+                self._release_lease(key)
+        finally:
+            self._key_locks.release(key)
+
+    def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Any],
+        ttl: float,
+        max_age: Optional[float] = None
+    ) -> Any:
+        """
+        Cached value, or the result of compute() stored under key
+
+        Entries older than max_age count as missing. Across all processes only
+        the holder of the key's lease computes it; others poll for the result
+        and take over if the lease expires. compute() returning None is passed
+        through without being stored.
+        """
+        def fresh() -> Optional[Tuple[Any, float]]:
+            entry = self.get(key)
+            if entry is not None and (max_age is None or entry[1] <= max_age):
+                return entry
+            return None
+
+        entry = fresh()
+        if entry is not None:
+            metrics.inc("cache_requests_total", namespace=_namespace(key), result="hit")
+            return entry[0]
+
+        self._key_locks.acquire(key)
+        try:
+            delay = 0.01
+            while True:
+                entry = fresh()
+                if entry is not None:
+                    metrics.inc("cache_requests_total", namespace=_namespace(key), result="hit")
+                    return entry[0]
+                if self._claim_lease(key):
+                    break
+                time.sleep(delay)
+                delay = min(delay * 2, 0.2)
+                if not self._lease_held(key):
+                    # The computing process gave up (compute failed or returned None)
+                    continue
+
+            metrics.inc("cache_requests_total", namespace=_namespace(key), result="miss")
+            try:
+                value = compute()
+                if value is not None:
+                    self.set(key, value, ttl)
+                return value
+            finally:
+                self._release_lease(key)
+        finally:
+            self._key_locks.release(key)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The process-wide cache backend (SQLite if SHARED_CACHE_PATH is set, else memory)"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SQLiteCache(SHARED_CACHE_PATH) if SHARED_CACHE_PATH else MemoryCache()
+    return _cache
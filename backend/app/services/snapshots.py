@@ -0,0 +1,152 @@
+"""
+Compact on-disk snapshots of caches and derived indexes
+
+A snapshot file holds a small JSON header followed by flat typed arrays
+(array module typecodes), each aligned to 8 bytes. Loading memory-maps the
+file and hands out memoryviews over the arrays, so startup cost doesn't grow
+with snapshot size: pages are only read when an index is actually used.
+
+File layout:
+    magic(8s) header_length(u32) header(JSON, padded to 8 bytes) arrays...
+The header has the caller's metadata under "meta" and, per array, its
+typecode, byte offset and item count under "arrays". It also records the id
+of the database the snapshot was taken against (see database_id), and a
+snapshot from any other database is ignored, even if its change cursors
+happen to match.
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+from array import array
+from typing import Any, Dict, Optional, Tuple
+
+from app.database import database_id
+from app.services import metrics
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+# Seconds between periodic snapshots (0 disables; a snapshot is still taken at shutdown)
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "300"))
+
+_MAGIC = b"RSNAP001"
+_PREFIX = struct.Struct("<8sI")
+
+metrics.describe("startup_seconds", "gauge", "Time spent in each startup phase")
+metrics.describe("snapshot_bytes", "gauge", "Size of the last written snapshot file")
+
+
+def snapshot_path(name: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"{name}.snap")
+
+
+def write_snapshot(name: str, meta: Dict[str, Any], arrays: Dict[str, array]) -> str:
+    """
+    Atomically write a snapshot
+
+    Args:
+        name: Snapshot name (file name without extension)
+        meta: JSON-serializable metadata
+        arrays: Named typed arrays
+
+    Returns:
+        Path of the written file
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = snapshot_path(name)
+
+    # Lay out arrays after the header; offsets are relative to the data start
+    descriptors = {}
+    offset = 0
+    for key, arr in arrays.items():
+        offset += -offset % 8
+        descriptors[key] = {"typecode": arr.typecode, "offset": offset, "count": len(arr)}
+        offset += arr.itemsize * len(arr)
+    header = json.dumps({"database_id": database_id(), "meta": meta, "arrays": descriptors}).encode()
+    header += b" " * (-(len(header) + _PREFIX.size) % 8)
+
+    # A unique temp file per writer, since several workers may snapshot at once
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{name}.", suffix=".tmp", dir=SNAPSHOT_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_PREFIX.pack(_MAGIC, len(header)))
+            f.write(header)
+            written = 0
+            for key, arr in arrays.items():
+                pad = descriptors[key]["offset"] - written
+                f.write(b"\0" * pad)
+                f.write(arr.tobytes())
+                written += pad + arr.itemsize * len(arr)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    metrics.set_gauge("snapshot_bytes", os.path.getsize(path), snapshot=name)
+    return path
+
+
+def read_snapshot(name: str) -> Optional[Tuple[Dict[str, Any], Dict[str, memoryview]]]:
+    """
+    Memory-map a snapshot
+
+    Returns:
+        (meta, arrays as read-only memoryviews), or None if the snapshot is
+        missing, unreadable or from another database
+    """
+    path = snapshot_path(name)
+    try:
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        magic, header_len = _PREFIX.unpack_from(mapped, 0)
+        if magic != _MAGIC:
+            return None
+        header = json.loads(mapped[_PREFIX.size:_PREFIX.size + header_len])
+        if header.get("database_id") != database_id():
+            print(f"Snapshot {name} was taken against another database, ignoring it")
+            return None
+        data_start = _PREFIX.size + header_len
+        view = memoryview(mapped)
+        arrays = {}
+        for key, desc in header["arrays"].items():
+            itemsize = array(desc["typecode"]).itemsize
+            start = data_start + desc["offset"]
+            arrays[key] = view[start:start + itemsize * desc["count"]].cast(desc["typecode"])
+        return header["meta"], arrays
+    except (struct.error, ValueError, KeyError, TypeError):
+        return None
+
+
+class StartupTimer:
+    """Records how long each startup phase takes, for logs and /metrics"""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self._started = time.perf_counter()
+
+    def phase(self, name: str):
+        timer = self
+
+        class _Phase:
+            def __enter__(self):
+                self.started = time.perf_counter()
+
+            def __exit__(self, *exc):
+                elapsed = time.perf_counter() - self.started
+                timer.phases[name] = elapsed
+                metrics.set_gauge("startup_seconds", elapsed, phase=name)
+
+        return _Phase()
+
+    def finish(self) -> float:
+        total = time.perf_counter() - self._started
+        metrics.set_gauge("startup_seconds", total, phase="total")
+        details = ", ".join(f"{name} {secs * 1000:.0f}ms" for name, secs in self.phases.items())
+        print(f"Startup completed in {total * 1000:.0f}ms ({details})")
+        return total
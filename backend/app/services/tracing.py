@@ -0,0 +1,346 @@
+"""
+Lightweight per-request spans, reported as Server-Timing and OTLP JSON
+
+TracingMiddleware starts a trace for every HTTP request. Routes using
+TracedRoute time their endpoint as the "handler" span; code on the request
+path marks the parts worth timing with span() or @traced(); the trace is held
+in a context variable, which Starlette copies into the threadpool running
+sync handlers, so spans nest across the handler, services and SQL queries
+(see instrument_engine) without passing anything around. Outside a request
+span() costs one context variable lookup.
+
+When the response starts, spans are added up by name into a Server-Timing
+header (visible in the browser devtools' network timing tab), e.g.
+    Server-Timing: total;dur=48.2, handler;dur=44.9, osrm.route;dur=31.0;desc="2x", ...
+plus "encode" for the time between the handler returning and the response
+starting (response validation and serialization).
+
+With TRACE_EXPORT_PATH set, each finished trace is also appended to that
+file as one OTLP/JSON ExportTraceServiceRequest per line (the format of the
+OpenTelemetry collector's file exporter and otlpjsonfile receiver), written
+by a background thread. An incoming W3C traceparent header is honoured, so
+spans join the caller's trace.
+"""
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.routing import APIRoute
+
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "1") != "0"
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+# Origins allowed to read Server-Timing from scripts (Resource Timing API);
+# devtools show it regardless. "*" or a single origin, empty to not send it
+TIMING_ALLOW_ORIGIN = os.getenv("TIMING_ALLOW_ORIGIN", "")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "relief-routing-backend")
+# Spans kept per trace; later ones are only counted
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "500"))
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+_SPAN_KIND_INTERNAL = 1
+_SPAN_KIND_SERVER = 2
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start_ns", "end_ns", "attributes")
+
+    def __init__(self, name: str, parent_id: Optional[str], attributes: Optional[Dict[str, Any]]):
+        self.name = name
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+
+class Trace:
+    """The spans of one request"""
+
+    def __init__(self, name: str, traceparent: Optional[str] = None):
+        match = _TRACEPARENT.match(traceparent or "")
+        self.trace_id = match.group(1) if match else _new_id(128)
+        self.epoch_ns = time.time_ns()
+        self.root = Span(name, match.group(2) if match else None, None)
+        self.spans: List[Span] = []
+        self.dropped = 0
+        # perf_counter_ns when the handler returned (for the "encode" timing)
+        self.handler_end_ns = 0
+
+    def add(self, span: Span) -> None:
+        if len(self.spans) < TRACE_MAX_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+    def server_timing(self, now_ns: int) -> str:
+        """Server-Timing header value: total, then span durations summed by name"""
+        totals: Dict[str, List[float]] = {}
+        for span in self.spans:
+            entry = totals.setdefault(span.name, [0.0, 0])
+            entry[0] += span.duration_ms
+            entry[1] += 1
+        parts = [f"total;dur={(now_ns - self.root.start_ns) / 1e6:.1f}"]
+        for name, (duration, count) in totals.items():
+            desc = f';desc="{count}x"' if count > 1 else ""
+            parts.append(f"{name};dur={duration:.1f}{desc}")
+        if self.handler_end_ns:
+            parts.append(f"encode;dur={(now_ns - self.handler_end_ns) / 1e6:.1f}")
+        return ", ".join(parts)
+
+    def _unix_ns(self, perf_ns: int) -> str:
+        return str(self.epoch_ns + perf_ns - self.root.start_ns)
+
+    def _otlp_span(self, span: Span, kind: int) -> Dict[str, Any]:
+        otlp = {
+            "traceId": self.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": kind,
+            "startTimeUnixNano": self._unix_ns(span.start_ns),
+            "endTimeUnixNano": self._unix_ns(span.end_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in (span.attributes or {}).items()
+            ],
+        }
+        if span.parent_id:
+            otlp["parentSpanId"] = span.parent_id
+        return otlp
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """The trace as an OTLP/JSON ExportTraceServiceRequest"""
+        spans = [self._otlp_span(self.root, _SPAN_KIND_SERVER)]
+        spans.extend(self._otlp_span(span, _SPAN_KIND_INTERNAL) for span in self.spans)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}
+            ]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+        }]}
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_current_span_id: ContextVar[Optional[str]] = ContextVar("span_id", default=None)
+
+
+class span:
+    """
+    Time a block as a span of the current request's trace
+
+        with span("osrm.route", cached=False):
+            ...
+
+    Does nothing outside a traced request.
+    """
+    __slots__ = ("_name", "_attributes", "_trace", "_span", "_token")
+
+    def __init__(self, name: str, **attributes):
+        self._name = name
+        self._attributes = attributes or None
+
+    def __enter__(self) -> "span":
+        self._trace = _current_trace.get()
+        if self._trace is not None:
+            self._span = Span(self._name, _current_span_id.get() or self._trace.root.span_id, self._attributes)
+            self._token = _current_span_id.set(self._span.span_id)
+        return self
+
+    def set(self, key: str, value: Any) -> None:
+        """Add an attribute (exported to OTLP, not shown in Server-Timing)"""
+        if self._trace is not None:
+            if self._span.attributes is None:
+                self._span.attributes = {}
+            self._span.attributes[key] = value
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self._trace is not None:
+            self._span.end_ns = time.perf_counter_ns()
+            if exc_type is not None:
+                self.set("error", exc_type.__name__)
+            _current_span_id.reset(self._token)
+            self._trace.add(self._span)
+
+
+def traced(name: str) -> Callable:
+    """Decorator: run the function inside span(name)"""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_trace.get() is None:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _mark_handler_end() -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.handler_end_ns = time.perf_counter_ns()
+
+
+def _instrument(endpoint: Callable) -> Callable:
+    """Wrap an endpoint in a "handler" span and note when it returned"""
+    if getattr(endpoint, "_traced", False):
+        # include_router() builds the route again from the wrapped endpoint
+        return endpoint
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            try:
+                with span("handler"):
+                    return await endpoint(*args, **kwargs)
+            finally:
+                _mark_handler_end()
+        async_wrapper._traced = True
+        return async_wrapper
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        try:
+            with span("handler"):
+                return endpoint(*args, **kwargs)
+        finally:
+            _mark_handler_end()
+    wrapper._traced = True
+    return wrapper
+
+
+class TracedRoute(APIRoute):
+    """APIRoute timing its endpoint as the "handler" span (the rest is "encode")"""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if SERVER_TIMING_ENABLED or TRACE_EXPORT_PATH:
+            endpoint = _instrument(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+def instrument_engine(engine) -> None:
+    """Record every SQL statement run on engine as a "db.query" span"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if _current_trace.get() is not None:
+            conn.info.setdefault("trace_spans", []).append(span("db.query", statement=statement[:200]).__enter__())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("trace_spans")
+        if spans:
+            spans.pop().__exit__(None, None, None)
+
+    @event.listens_for(engine, "handle_error")
+    def failed(context):
+        spans = context.connection.info.get("trace_spans") if context.connection is not None else None
+        if spans:
+            spans.pop().__exit__(type(context.original_exception), None, None)
+
+
+class _FileExporter:
+    """Appends traces to TRACE_EXPORT_PATH from a background thread"""
+
+    def __init__(self, path: str, max_queue: int = 10000):
+        self.path = path
+        self._queue: "queue.Queue[Trace]" = queue.Queue(max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            pass  # Tracing must never slow down requests
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < 100:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    for trace in batch:
+                        f.write(json.dumps(trace.to_otlp(), separators=(",", ":")) + "\n")
+            except OSError as e:
+                print(f"Warning: Failed to write traces to {self.path}: {e}")
+
+
+_exporter = _FileExporter(TRACE_EXPORT_PATH) if TRACE_EXPORT_PATH else None
+
+
+class TracingMiddleware:
+    """ASGI middleware: one trace per HTTP request, Server-Timing on the response"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (SERVER_TIMING_ENABLED or _exporter):
+            await self.app(scope, receive, send)
+            return
+        traceparent = None
+        for key, value in scope["headers"]:
+            if key == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        trace = Trace(f"{scope['method']} {scope['path']}", traceparent)
+        token = _current_trace.set(trace)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                trace.root.attributes = {
+                    "http.method": scope["method"],
+                    "http.target": scope["path"],
+                    "http.status_code": message["status"],
+                }
+                if SERVER_TIMING_ENABLED:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", trace.server_timing(time.perf_counter_ns()).encode("latin-1")))
+                    if TIMING_ALLOW_ORIGIN:
+                        headers.append((b"timing-allow-origin", TIMING_ALLOW_ORIGIN.encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
+            trace.root.end_ns = time.perf_counter_ns()
+            if trace.dropped:
+                trace.root.attributes = {**(trace.root.attributes or {}), "spans.dropped": trace.dropped}
+            if _exporter is not None:
+                _exporter.export(trace)
@@ -0,0 +1,230 @@
+"""
+Rate-limit-aware scheduler for calls to quota-limited upstream APIs
+
+Each upstream gets a token bucket sized to its API plan. Callers ask for a
+token with a priority class and a deadline:
+- Waiting callers are served strictly in priority order, then FIFO.
+- Lower priority classes may only spend tokens while the bucket is above a
+  reserve, so dashboards and prefetching can't drain the budget that
+  routing safety checks need.
+- A caller that can't get a token before its deadline (or finds the queue
+  full) gets BudgetExhausted and is expected to fall back to cached data.
+
+The quota is per API key, not per process. Given a shared_path, the bucket's
+token count lives in that SQLite file and tokens are taken with a single
+conditional UPDATE, so all uvicorn workers on the host draw from one budget;
+only the queue of waiting callers is per process.
+"""
+import heapq
+import itertools
+import sqlite3
+import threading
+import time
+from enum import IntEnum
+from typing import Dict, List, Optional
+
+from app.services import metrics
+
+
+class Priority(IntEnum):
+    """Priority classes for upstream calls (lower value = more important)"""
+    ROUTING_SAFETY = 0
+    INTERACTIVE = 1
+    DASHBOARD = 2
+    BACKGROUND = 3
+
+
+# Fraction of the bucket each class must leave untouched
+PRIORITY_RESERVE = {
+    Priority.ROUTING_SAFETY: 0.0,
+    Priority.INTERACTIVE: 0.1,
+    Priority.DASHBOARD: 0.25,
+    Priority.BACKGROUND: 0.5,
+}
+
+# Default time a caller of each class is willing to wait for a token (seconds)
+DEFAULT_DEADLINES = {
+    Priority.ROUTING_SAFETY: 2.0,
+    Priority.INTERACTIVE: 1.0,
+    Priority.DASHBOARD: 0.5,
+    Priority.BACKGROUND: 10.0,
+}
+
+metrics.describe("upstream_calls_total", "counter", "Upstream call admissions by outcome")
+metrics.describe("upstream_tokens_available", "gauge", "Tokens currently in the upstream rate-limit bucket")
+metrics.describe("upstream_queue_depth", "gauge", "Callers waiting for an upstream token")
+
+
+class BudgetExhausted(Exception):
+    """No upstream token could be obtained before the caller's deadline"""
+
+
+# How often a caller re-checks a shared bucket that other processes also draw from (seconds)
+_SHARED_POLL_INTERVAL = 0.05
+
+
+class _LocalBucket:
+    """Token count kept in this process"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def level(self) -> float:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return self._tokens
+
+    def take(self, needed: float) -> bool:
+        if self.level() < needed:
+            return False
+        self._tokens -= 1.0
+        return True
+
+
+class _SQLiteBucket:
+    """Token count kept in a SQLite file shared by all processes using it"""
+
+    def __init__(self, path: str, name: str, rate: float, capacity: float):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS upstream_buckets ("
+            "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "INSERT OR IGNORE INTO upstream_buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+            (name, capacity, time.time())
+        )
+
+    def _params(self, **extra) -> Dict:
+        return {"name": self.name, "rate": self.rate, "capacity": self.capacity, "now": time.time(), **extra}
+
+    # Tokens after refilling for the time since the last update (wall clock,
+    # since it is compared across processes)
+    _REFILLED = "min(:capacity, tokens + max(0, :now - updated_at) * :rate)"
+
+    def level(self) -> float:
+        row = self._conn.execute(
+            f"SELECT {self._REFILLED} FROM upstream_buckets WHERE name = :name", self._params()
+        ).fetchone()
+        return row[0] if row else self.capacity
+
+    def take(self, needed: float) -> bool:
+        try:
+            cursor = self._conn.execute(
+                f"UPDATE upstream_buckets SET tokens = {self._REFILLED} - 1, "
+                "updated_at = max(updated_at, :now) "
+                f"WHERE name = :name AND {self._REFILLED} >= :needed",
+                self._params(needed=needed)
+            )
+        except sqlite3.OperationalError as e:
+            print(f"Warning: Shared rate-limit bucket {self.name} unavailable: {e}")
+            return False
+        return cursor.rowcount == 1
+
+
+class UpstreamScheduler:
+    """Token bucket with a priority queue of waiting callers"""
+
+    def __init__(
+        self,
+        name: str,
+        calls_per_minute: float,
+        burst: int,
+        max_queue: int = 100,
+        shared_path: str = ""
+    ):
+        """
+        Args:
+            name: Upstream name (metric label, and bucket key in shared_path)
+            calls_per_minute: Sustained rate of the API plan
+            burst: Bucket capacity
+            max_queue: Waiting callers per process before new ones are rejected
+            shared_path: SQLite file holding the bucket for all processes
+                (empty = this process only)
+        """
+        self.name = name
+        self.rate = calls_per_minute / 60.0
+        self.capacity = float(max(1, burst))
+        self.max_queue = max_queue
+        if shared_path:
+            self._bucket = _SQLiteBucket(shared_path, name, self.rate, self.capacity)
+        else:
+            self._bucket = _LocalBucket(self.rate, self.capacity)
+        self._shared = bool(shared_path)
+        self._waiters: List[list] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        metrics.register_callback("upstream_tokens_available", self._tokens_metric)
+        metrics.register_callback("upstream_queue_depth", self._queue_metric)
+
+    def _seconds_until(self, level: float) -> float:
+        if self.rate <= 0:
+            return float("inf")
+        wait = max(0.0, (level - self._bucket.level()) / self.rate)
+        # Other processes may take the tokens first, so check again soon
+        return min(max(wait, 0.01), _SHARED_POLL_INTERVAL) if self._shared else wait
+
+    def acquire(self, priority: Priority, deadline: Optional[float] = None) -> None:
+        """
+        Block until a token is granted
+
+        Args:
+            priority: Priority class of the call
+            deadline: Maximum seconds to wait (defaults per class)
+
+        Raises:
+            BudgetExhausted: If the queue is full or the deadline passes
+        """
+        wait_limit = DEFAULT_DEADLINES[priority] if deadline is None else deadline
+        give_up_at = time.monotonic() + wait_limit
+        # A class may only take a token if one is left above its reserve
+        needed = 1.0 + PRIORITY_RESERVE[priority] * self.capacity
+
+        with self._cond:
+            if len(self._waiters) >= self.max_queue:
+                self._record(priority, "rejected")
+                raise BudgetExhausted(f"{self.name} queue is full")
+            entry = [int(priority), next(self._seq)]
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    if self._waiters[0] is entry and self._bucket.take(needed):
+                        heapq.heappop(self._waiters)
+                        self._record(priority, "granted")
+                        return
+                    remaining = give_up_at - time.monotonic()
+                    if remaining <= 0:
+                        self._record(priority, "timeout")
+                        raise BudgetExhausted(f"{self.name} rate limit budget exhausted")
+                    if self._waiters[0] is entry:
+                        self._cond.wait(min(remaining, self._seconds_until(needed)))
+                    else:
+                        self._cond.wait(remaining)
+            finally:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                # The head of the queue may have changed
+                self._cond.notify_all()
+
+    def _record(self, priority: Priority, outcome: str) -> None:
+        metrics.inc(
+            "upstream_calls_total",
+            upstream=self.name, priority=priority.name.lower(), outcome=outcome
+        )
+
+    def _tokens_metric(self) -> Dict:
+        with self._cond:
+            return {metrics.labels(upstream=self.name): round(self._bucket.level(), 2)}
+
+    def _queue_metric(self) -> Dict:
+        with self._cond:
+            return {metrics.labels(upstream=self.name): len(self._waiters)}
@@ -0,0 +1,128 @@
+"""
+Background weather prefetcher
+
+Keeps the weather tile cache warm for the areas that matter right now:
+tiles containing an active relief centre and tiles recently requested by
+route weather lookups. Tiles with adverse conditions are refreshed more
+often, using the safety status of each tile's last payload under the
+current safety rules (assessed for all cached tiles in one batch).
+
+Started and stopped from the lifespan hook in main.py.
+"""
+import asyncio
+import os
+import time
+from typing import Optional, Set
+
+from app.database import SessionLocal
+from app.services.centre_index import get_centre_index
+from app.services.weather_service import (
+    WeatherTile,
+    weather_tile,
+    get_cached_weather,
+    recently_requested_tiles,
+    refresh_weather_tile,
+    assess_weather_batch
+)
+
+# Refresh cadence per safety status (minutes)
+WEATHER_REFRESH_INTERVAL = float(os.getenv("WEATHER_REFRESH_INTERVAL", "15"))
+WEATHER_REFRESH_CAUTION = float(os.getenv("WEATHER_REFRESH_CAUTION", "5"))
+WEATHER_REFRESH_UNSAFE = float(os.getenv("WEATHER_REFRESH_UNSAFE", "2"))
+# How often the scheduler wakes up to look for due tiles (seconds)
+WEATHER_PREFETCH_TICK = float(os.getenv("WEATHER_PREFETCH_TICK", "15"))
+# Upstream calls in flight at once
+WEATHER_PREFETCH_CONCURRENCY = int(os.getenv("WEATHER_PREFETCH_CONCURRENCY", "4"))
+# Set to 0 to disable the prefetcher
+WEATHER_PREFETCH_ENABLED = os.getenv("WEATHER_PREFETCH_ENABLED", "1") != "0"
+
+
+def refresh_interval(safety_status: Optional[str]) -> float:
+    """Seconds between refreshes for a tile with the given safety status"""
+    if safety_status == "unsafe":
+        return WEATHER_REFRESH_UNSAFE * 60
+    if safety_status == "caution":
+        return WEATHER_REFRESH_CAUTION * 60
+    return WEATHER_REFRESH_INTERVAL * 60
+
+
+def active_centre_tiles() -> Set[WeatherTile]:
+    """Tiles containing at least one active relief centre"""
+    db = SessionLocal()
+    try:
+        return {
+            weather_tile(lat, lng)
+            for lat, lng in get_centre_index(db).coordinates().values()
+        }
+    finally:
+        db.close()
+
+
+def due_tiles(tiles: Set[WeatherTile]) -> list:
+    """Tiles never fetched or past their severity-based refresh interval, most stale first"""
+    due = []
+    cached_tiles = []
+    for tile in tiles:
+        cached = get_cached_weather(tile)
+        if cached is None:
+            due.append((float("inf"), tile))
+        else:
+            cached_tiles.append((tile, cached))
+    statuses = assess_weather_batch([data for _, (data, _) in cached_tiles]).statuses()
+    for (tile, (_, age)), status in zip(cached_tiles, statuses):
+        overdue = age - refresh_interval(status)
+        if overdue >= 0:
+            due.append((overdue, tile))
+    due.sort(reverse=True)
+    return [tile for _, tile in due]
+
+
+class WeatherPrefetcher:
+    """Periodically refreshes due weather tiles on worker threads"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._semaphore = asyncio.Semaphore(WEATHER_PREFETCH_CONCURRENCY)
+
+    async def _refresh(self, tile: WeatherTile) -> None:
+        async with self._semaphore:
+            try:
+                # Skip tiles another worker refreshed during this tick
+                await asyncio.to_thread(refresh_weather_tile, tile, min_age=WEATHER_PREFETCH_TICK)
+            except Exception as e:
+                print(f"Warning: Weather prefetch failed for tile {tile}: {e}")
+
+    async def run_once(self) -> int:
+        """Refresh every due tile once; returns the number of tiles refreshed"""
+        tiles = await asyncio.to_thread(active_centre_tiles)
+        tiles.update(recently_requested_tiles())
+        due = await asyncio.to_thread(due_tiles, tiles)
+        if due:
+            await asyncio.gather(*(self._refresh(tile) for tile in due))
+        return len(due)
+
+    async def _run(self) -> None:
+        while True:
+            started = time.monotonic()
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Warning: Weather prefetch cycle failed: {e}")
+            elapsed = time.monotonic() - started
+            await asyncio.sleep(max(0.0, WEATHER_PREFETCH_TICK - elapsed))
+
+    def start(self) -> None:
+        if WEATHER_PREFETCH_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+weather_prefetcher = WeatherPrefetcher()
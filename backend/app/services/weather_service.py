@@ -3,108 +3,203 @@ Weather service for fetching real-time weather data from OpenWeatherMap API
 """
 import requests
 import os
+import math
 import time
-from typing import Dict, Any, Optional
+import threading
+from bisect import bisect_right
+from typing import Dict, Any, List, Optional, Tuple, Union
 from dotenv import load_dotenv
+from app.services import metrics
+from app.services.shared_cache import SHARED_CACHE_PATH, get_cache
+from app.services.route_geometry import RouteGeometry
+from app.services.tracing import span, traced
+from app.services.safety_rules import BatchAssessment, get_safety_rules
+from app.services.upstream_scheduler import UpstreamScheduler, Priority, BudgetExhausted
 
 load_dotenv()
 
 # OpenWeatherMap API configuration
 # Get your free API key from: https://openweathermap.org/api
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY", "")
-OPENWEATHER_BASE_URL = "https://api.openweathermap.org/data/2.5"
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5")
+
+# Weather is cached per tile of WEATHER_TILE_DEG degrees (~11 km at 0.1)
+WEATHER_TILE_DEG = float(os.getenv("WEATHER_TILE_DEG", "0.1"))
+# Cached weather older than this (seconds) is refetched on the request path
+WEATHER_MAX_AGE = float(os.getenv("WEATHER_MAX_AGE", "1800"))
+# How long weather is kept at all, as a fallback during outages (seconds)
+WEATHER_STALE_TTL = float(os.getenv("WEATHER_STALE_TTL", "21600"))
+# How long a tile requested by a route stays on the prefetch list (seconds)
+WEATHER_RECENT_TILE_TTL = float(os.getenv("WEATHER_RECENT_TILE_TTL", "3600"))
+# Cached forecasts older than this are refetched (OpenWeatherMap updates them every 3 h)
+WEATHER_FORECAST_MAX_AGE = float(os.getenv("WEATHER_FORECAST_MAX_AGE", "10800"))
+# Forecast slot length of the 5 day / 3 hour forecast (seconds)
+FORECAST_STEP = 3 * 3600
+# Spacing of route weather samples when ETAs are known, and their maximum count
+ROUTE_WEATHER_SAMPLE_KM = float(os.getenv("ROUTE_WEATHER_SAMPLE_KM", "10"))
+ROUTE_WEATHER_MAX_SAMPLES = int(os.getenv("ROUTE_WEATHER_MAX_SAMPLES", "48"))
+
+# OpenWeatherMap plan limits (free tier: 60 calls/minute)
+OPENWEATHER_CALLS_PER_MINUTE = float(os.getenv("OPENWEATHER_CALLS_PER_MINUTE", "60"))
+OPENWEATHER_BURST = int(os.getenv("OPENWEATHER_BURST", "20"))
+
+# The plan's quota is shared by all workers, so the bucket lives next to the
+# shared cache when there is one
+openweather_scheduler = UpstreamScheduler(
+    "openweathermap", OPENWEATHER_CALLS_PER_MINUTE, OPENWEATHER_BURST,
+    shared_path=SHARED_CACHE_PATH
+)
+metrics.describe("weather_stale_served_total", "counter", "Weather responses served from stale cache")
+
+WeatherTile = Tuple[int, int]
+
+# tile -> last time a handler asked for it (monotonic seconds)
+_recent_tiles: Dict[WeatherTile, float] = {}
+_cache_lock = threading.Lock()
 
 
 def assess_safety_status(weather_info: Dict[str, Any]) -> Dict[str, Any]:
     """
     Assess safety status based on weather conditions
     
+    Evaluates the configured safety rules (see safety_rules.py) for a single
+    payload; use assess_weather_batch for many points at once.
+    
     Returns:
         Dictionary with safety status, message, and calamities list
     """
-    condition = weather_info.get("condition", "").lower()
-    rainfall = weather_info.get("rainfall", 0.0) or 0.0
-    wind_speed = weather_info.get("wind_speed", 0.0) or 0.0
-    alerts = weather_info.get("alerts", [])
-    
-    calamities = []
-    safety_level = "safe"  # safe, caution, unsafe
-    
-    # Check for heavy rainfall
-    if rainfall > 20.0:  # mm/h - heavy rain
-        calamities.append({
-            "type": "Heavy Rainfall",
-            "severity": "high",
-            "description": f"Heavy rainfall detected: {rainfall:.1f}mm/h"
-        })
-        safety_level = "unsafe"
-    elif rainfall > 10.0:
-        calamities.append({
-            "type": "Moderate Rainfall",
-            "severity": "moderate",
-            "description": f"Moderate rainfall: {rainfall:.1f}mm/h"
-        })
-        safety_level = "caution"
+    return get_safety_rules().assess([weather_info]).point(0)
+
+
+def assess_weather_batch(payloads: List[Dict[str, Any]]) -> BatchAssessment:
+    """
+    Assess many weather payloads in one columnar pass
     
-    # Check for severe weather conditions
-    if condition in ["thunderstorm", "extreme"]:
-        calamities.append({
-            "type": "Severe Weather",
-            "severity": "high",
-            "description": f"Severe weather condition: {condition}"
-        })
-        safety_level = "unsafe"
-    elif condition in ["heavy rain", "squall", "tornado"]:
-        calamities.append({
-            "type": "Dangerous Weather",
-            "severity": "high",
-            "description": f"Dangerous weather: {condition}"
-        })
-        safety_level = "unsafe"
+    Returns:
+        Assessment with per-point results (point(i), statuses()) and an
+        aggregate summary()
+    """
+    return get_safety_rules().assess(payloads)
+
+
+def weather_tile(latitude: float, longitude: float) -> WeatherTile:
+    """Cache tile containing a coordinate"""
+    return int(latitude // WEATHER_TILE_DEG), int(longitude // WEATHER_TILE_DEG)
+
+
+def weather_tile_centre(tile: WeatherTile) -> Tuple[float, float]:
+    """(latitude, longitude) at the centre of a cache tile"""
+    return (tile[0] + 0.5) * WEATHER_TILE_DEG, (tile[1] + 0.5) * WEATHER_TILE_DEG
+
+
+def _cache_key(tile: WeatherTile) -> str:
+    return f"weather:{tile[0]}:{tile[1]}"
+
+
+def get_cached_weather(tile: WeatherTile) -> Optional[Tuple[Dict[str, Any], float]]:
+    """(weather payload, age in seconds) for a tile, or None if never fetched"""
+    return get_cache().get(_cache_key(tile))
+
+
+def recently_requested_tiles() -> List[WeatherTile]:
+    """Tiles handlers asked for within WEATHER_RECENT_TILE_TTL"""
+    cutoff = time.monotonic() - WEATHER_RECENT_TILE_TTL
+    with _cache_lock:
+        for tile in [t for t, seen in _recent_tiles.items() if seen < cutoff]:
+            del _recent_tiles[tile]
+        return list(_recent_tiles)
+
+
+def _fetch_into_cache(
+    tile: WeatherTile,
+    latitude: float,
+    longitude: float,
+    priority: Priority,
+    max_age: float
+) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Fetch a tile unless the shared cache has it younger than max_age
     
-    # Check for high wind speeds
-    if wind_speed > 20.0:  # m/s - strong wind
-        calamities.append({
-            "type": "Strong Winds",
-            "severity": "moderate",
-            "description": f"Strong winds: {wind_speed:.1f}m/s"
-        })
-        if safety_level == "safe":
-            safety_level = "caution"
+    Only one worker process fetches a given tile at a time. Failed fetches
+    aren't stored, so a provider outage keeps serving the last good payload.
     
-    # Check for alerts
-    if alerts:
-        for alert in alerts:
-            calamities.append({
-                "type": alert.get("event", "Weather Alert"),
-                "severity": alert.get("severity", "moderate"),
-                "description": alert.get("description", "")
-            })
-            if alert.get("severity") == "high":
-                safety_level = "unsafe"
+    Returns:
+        (weather payload or None on failure, error payload if the fetch failed)
+    """
+    failure = {}
+
+    def compute():
+        data = fetch_weather_data(latitude, longitude, priority)
+        if "error" in data:
+            failure["data"] = data
+            return None
+        return data
+
+    data = get_cache().get_or_compute(_cache_key(tile), compute, WEATHER_STALE_TTL, max_age=max_age)
+    return data, failure.get("data")
+
+
+def refresh_weather_tile(
+    tile: WeatherTile,
+    priority: Priority = Priority.BACKGROUND,
+    min_age: float = 0.0
+) -> Dict[str, Any]:
+    """
+    Fetch a tile's weather from upstream and store it in the cache
     
-    # Generate safety message
-    if safety_level == "unsafe":
-        message = "⚠️ NOT SAFE TO TRAVEL - Severe weather conditions detected"
-    elif safety_level == "caution":
-        message = "⚠️ TRAVEL WITH CAUTION - Adverse weather conditions"
-    else:
-        message = "✅ SAFE TO TRAVEL - Weather conditions are favorable"
+    A tile refreshed by another worker within the last min_age seconds is
+    left alone.
+    """
+    lat, lng = weather_tile_centre(tile)
+    data, error = _fetch_into_cache(tile, lat, lng, priority, max_age=min_age)
+    return data if data is not None else error
+
+
+@traced("weather")
+def get_weather_data(
+    latitude: float,
+    longitude: float,
+    priority: Priority = Priority.INTERACTIVE
+) -> Dict[str, Any]:
+    """
+    Get current weather for a location, served from the tile cache
     
-    return {
-        "status": safety_level,
-        "message": message,
-        "calamities": calamities
-    }
+    The background prefetcher keeps tiles around active relief centres and
+    recently requested routes fresh, so handlers normally read from the
+    cache shared by all workers.
+    Only a missing or expired tile is fetched upstream; if that fetch fails
+    or the rate-limit budget for `priority` runs out, the last cached
+    payload is returned instead of an error.
+    """
+    tile = weather_tile(latitude, longitude)
+    with _cache_lock:
+        _recent_tiles[tile] = time.monotonic()
+
+    data, error = _fetch_into_cache(tile, latitude, longitude, priority, max_age=WEATHER_MAX_AGE)
+    if data is not None:
+        return data
+    stale = get_cached_weather(tile)
+    if stale is None:
+        return error
+    metrics.inc("weather_stale_served_total")
+    return stale[0]
 
 
-def get_weather_data(latitude: float, longitude: float) -> Dict[str, Any]:
+def fetch_weather_data(
+    latitude: float,
+    longitude: float,
+    priority: Priority = Priority.INTERACTIVE
+) -> Dict[str, Any]:
     """
     Fetch current weather data from OpenWeatherMap API
     
+    Calls go through the OpenWeatherMap rate-limit scheduler; if no token
+    is available in time the error payload is returned.
+    
     Args:
         latitude: Latitude coordinate
         longitude: Longitude coordinate
+        priority: Scheduling priority of the upstream call
     
     Returns:
         Dictionary containing weather information including:
@@ -154,10 +249,12 @@ def get_weather_data(latitude: float, longitude: float) -> Dict[str, Any]:
             "units": "metric"  # Get temperature in Celsius
         }
         
-        response = requests.get(url, params=params, timeout=5)
-        response.raise_for_status()
-        
-        data = response.json()
+        with span("weather.quota"):
+            openweather_scheduler.acquire(priority)
+        with span("weather.fetch"):
+            response = requests.get(url, params=params, timeout=5)
+            response.raise_for_status()
+            data = response.json()
         
         # Extract weather information
         weather_info = {
@@ -176,14 +273,7 @@ def get_weather_data(latitude: float, longitude: float) -> Dict[str, Any]:
         }
         
         # Get weather alerts if available (requires One Call API 3.0 subscription)
-        # For free tier, we'll check for severe weather conditions
-        weather_main = weather_info["condition"].lower()
-        if weather_main in ["thunderstorm", "heavy rain", "extreme"]:
-            weather_info["alerts"] = [{
-                "event": "Severe Weather Warning",
-                "description": f"Current conditions: {weather_info['description']}",
-                "severity": "moderate"
-            }]
+        weather_info["alerts"] = _severe_weather_alerts(weather_info, "Current conditions")
         
         # Assess safety status based on weather conditions
         safety_status = assess_safety_status(weather_info)
@@ -193,7 +283,7 @@ def get_weather_data(latitude: float, longitude: float) -> Dict[str, Any]:
         
         return weather_info
         
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, BudgetExhausted) as e:
         # Return error information
         error_data = {
             "temperature": None,
@@ -216,21 +306,130 @@ def get_weather_data(latitude: float, longitude: float) -> Dict[str, Any]:
         return error_data
 
 
+def _severe_weather_alerts(weather_info: Dict[str, Any], label: str) -> List[Dict[str, Any]]:
+    # Alerts need the One Call API 3.0 subscription; for the free tier we
+    # flag severe conditions instead
+    weather_main = weather_info["condition"].lower()
+    if weather_main in ["thunderstorm", "heavy rain", "extreme"]:
+        return [{
+            "event": "Severe Weather Warning",
+            "description": f"{label}: {weather_info['description']}",
+            "severity": "moderate"
+        }]
+    return []
+
+
+def fetch_forecast_data(
+    latitude: float,
+    longitude: float,
+    priority: Priority = Priority.INTERACTIVE
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Fetch the 5 day / 3 hour forecast from OpenWeatherMap
+    
+    Returns:
+        Forecast slots ordered by time, each shaped like the current weather
+        payload (rainfall converted to mm/h) with "timestamp" at the start of
+        the slot; None if no API key is configured or the call fails
+    """
+    if not OPENWEATHER_API_KEY:
+        return None
+    try:
+        with span("weather.quota"):
+            openweather_scheduler.acquire(priority)
+        with span("weather.forecast"):
+            response = requests.get(
+                f"{OPENWEATHER_BASE_URL}/forecast",
+                params={
+                    "lat": latitude,
+                    "lon": longitude,
+                    "appid": OPENWEATHER_API_KEY,
+                    "units": "metric"
+                },
+                timeout=5
+            )
+            response.raise_for_status()
+            data = response.json()
+    except (requests.exceptions.RequestException, BudgetExhausted, ValueError) as e:
+        print(f"Warning: Forecast unavailable for {latitude},{longitude}: {e}")
+        return None
+
+    slots = []
+    for item in data.get("list", []):
+        weather = item.get("weather", [{}])[0]
+        slot = {
+            "temperature": item.get("main", {}).get("temp"),
+            "condition": weather.get("main", "Unknown"),
+            "description": weather.get("description", "Unknown"),
+            "humidity": item.get("main", {}).get("humidity"),
+            "wind_speed": item.get("wind", {}).get("speed", 0),
+            "rainfall": round(item.get("rain", {}).get("3h", 0.0) / 3, 2),
+            "icon": weather.get("icon", "01d"),
+            "timestamp": item.get("dt", 0),
+            "api_available": True,
+            "forecast": True
+        }
+        slot["alerts"] = _severe_weather_alerts(slot, "Expected conditions")
+        slots.append(slot)
+    slots.sort(key=lambda slot: slot["timestamp"])
+    return slots or None
+
+
+def get_forecast(tile: WeatherTile, priority: Priority = Priority.INTERACTIVE) -> Optional[List[Dict[str, Any]]]:
+    """
+    Forecast slots for a tile, from the shared cache
+    
+    Fetched at most once per WEATHER_FORECAST_MAX_AGE per tile across all
+    workers; if a refetch fails the older forecast is used.
+    """
+    lat, lng = weather_tile_centre(tile)
+    key = f"forecast:{tile[0]}:{tile[1]}"
+    slots = get_cache().get_or_compute(
+        key,
+        lambda: fetch_forecast_data(lat, lng, priority),
+        WEATHER_STALE_TTL,
+        max_age=WEATHER_FORECAST_MAX_AGE
+    )
+    if slots is None:
+        stale = get_cache().get(key)
+        if stale is not None:
+            metrics.inc("weather_stale_served_total")
+            slots = stale[0]
+    return slots
+
+
+def forecast_at(slots: List[Dict[str, Any]], timestamp: float) -> Dict[str, Any]:
+    """Copy of the forecast slot covering a Unix timestamp (clamped to the forecast range)"""
+    i = bisect_right([slot["timestamp"] for slot in slots], timestamp) - 1
+    return dict(slots[min(max(i, 0), len(slots) - 1)])
+
+
+@traced("weather.route")
 def get_weather_along_route(
-    coordinates: list,
-    sample_points: int = 5
+    coordinates: Union[list, RouteGeometry],
+    sample_points: Optional[int] = None,
+    priority: Priority = Priority.ROUTING_SAFETY,
+    departure_time: Optional[float] = None
 ) -> Dict[str, Any]:
     """
     Get weather data for multiple points along a route
     
+    If the geometry carries ETAs, each sample gets the forecast conditions
+    for the time the vehicle is expected to reach it (one cached forecast
+    per tile); otherwise current conditions are reported. Samples whose
+    forecast is unavailable fall back to current conditions.
+    
     Args:
-        coordinates: List of [lng, lat] coordinate pairs
-        sample_points: Number of points to sample along the route
+        coordinates: Route geometry, or a list of [lng, lat] coordinate pairs
+        sample_points: Number of points to sample, evenly spaced by distance
+            (default 5, or one per ROUTE_WEATHER_SAMPLE_KM when ETAs are known)
+        priority: Scheduling priority of any upstream calls
+        departure_time: Unix time the trip starts (default now)
     
     Returns:
         Dictionary with weather data for sampled points and summary
     """
-    if not coordinates or len(coordinates) < 2:
+    if coordinates is None or len(coordinates) < 2:
         return {
             "route_weather": [],
             "summary": {
@@ -240,22 +439,40 @@ def get_weather_along_route(
             }
         }
     
-    # Sample points along the route
-    step = max(1, len(coordinates) // sample_points)
-    sampled_coords = coordinates[::step][:sample_points]
+    geometry = coordinates if isinstance(coordinates, RouteGeometry) else RouteGeometry.from_coordinates(coordinates)
+    use_forecast = geometry.eta is not None
+    if sample_points is None:
+        sample_points = 5
+        if use_forecast:
+            per_distance = math.ceil(geometry.length / (ROUTE_WEATHER_SAMPLE_KM * 1000)) + 1
+            sample_points = min(max(sample_points, per_distance), ROUTE_WEATHER_MAX_SAMPLES)
+    departure = departure_time if departure_time is not None else time.time()
+    
+    # Sample points evenly along the route
+    sampled_coords = geometry.sample(sample_points)
     
     route_weather = []
+    forecasts: Dict[WeatherTile, Optional[List[Dict[str, Any]]]] = {}
     total_temp = 0
     max_rainfall = 0
     has_alerts = False
     
-    for coord in sampled_coords:
-        lng, lat = coord[0], coord[1]
-        weather = get_weather_data(lat, lng)
-        route_weather.append({
-            "location": {"lat": lat, "lng": lng},
-            "weather": weather
-        })
+    for lng, lat, along in sampled_coords:
+        point = {"location": {"lat": lat, "lng": lng}}
+        weather = None
+        if use_forecast:
+            eta = geometry.eta_at(along)
+            point["eta_seconds"] = round(eta, 1)
+            point["arrival_time"] = int(departure + eta)
+            tile = weather_tile(lat, lng)
+            if tile not in forecasts:
+                forecasts[tile] = get_forecast(tile, priority)
+            if forecasts[tile]:
+                weather = forecast_at(forecasts[tile], departure + eta)
+        if weather is None:
+            weather = get_weather_data(lat, lng, priority)
+        point["weather"] = weather
+        route_weather.append(point)
         
         if weather.get("temperature") is not None:
             total_temp += weather["temperature"]
@@ -266,12 +483,33 @@ def get_weather_along_route(
     
     avg_temp = total_temp / len(route_weather) if route_weather else None
     
+    # Assess all samples together with the current rules
+    assessment = assess_weather_batch([point["weather"] for point in route_weather])
+    for i, point in enumerate(route_weather):
+        point["safety_status"] = assessment.status(i)
+        weather = point["weather"]
+        if weather.get("forecast"):
+            # Forecast slots are copies, so they can carry their own assessment
+            safety = assessment.point(i)
+            weather["safety_status"] = safety["status"]
+            weather["safety_message"] = safety["message"]
+            weather["calamities"] = safety["calamities"]
+    safety = assessment.summary()
+    
+    summary = {
+        "avg_temperature": round(avg_temp, 1) if avg_temp else None,
+        "max_rainfall": round(max_rainfall, 2) if max_rainfall else None,
+        "has_alerts": has_alerts,
+        "points_sampled": len(route_weather),
+        "safety_status": safety["status"],
+        "safety_message": safety["message"],
+        "safety_counts": safety["counts"],
+        "forecast": use_forecast
+    }
+    if use_forecast:
+        summary["departure_time"] = int(departure)
+        summary["forecast_tiles"] = len(forecasts)
     return {
         "route_weather": route_weather,
-        "summary": {
-            "avg_temperature": round(avg_temp, 1) if avg_temp else None,
-            "max_rainfall": round(max_rainfall, 2) if max_rainfall else None,
-            "has_alerts": has_alerts,
-            "points_sampled": len(route_weather)
-        }
+        "summary": summary
     }
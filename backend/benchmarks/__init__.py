@@ -0,0 +1,9 @@
+"""
+Offline benchmark harness for the relief routing backend
+
+Modules:
+- stubs: local stand-ins for OSRM and OpenWeatherMap
+- dataset: seeded synthetic relief centres and requests
+- scenarios: request generators for each endpoint under test
+- run: command line entry point (python -m benchmarks.run)
+"""
@@ -0,0 +1,236 @@
+"""
+Benchmark runner
+
+Builds a synthetic database, starts the OSRM and weather stubs, launches the
+backend under uvicorn in a subprocess and drives each load scenario with a
+fixed number of concurrent clients. Reports throughput and p50/p95/p99
+latency per scenario.
+
+Usage (from the backend directory):
+    python -m benchmarks.run --scale small --duration 10 --concurrency 8
+    python -m benchmarks.run --scenario nearest --osrm-latency-ms 20 --osrm-failure-rate 0.05
+    python -m benchmarks.run --scenario route --osrm-replicas 3
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List
+
+import requests
+
+from benchmarks.dataset import SCALES, write_dataset
+from benchmarks.scenarios import SCENARIOS, Scenario, build_scenarios
+from benchmarks.stubs import StubConfig, start_osrm_stub, start_weather_stub
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclass
+class ScenarioResult:
+    """Outcome of one load scenario"""
+    scenario: str
+    requests: int = 0
+    errors: int = 0
+    elapsed_s: float = 0.0
+    latencies_ms: List[float] = field(default_factory=list, repr=False)
+
+    @property
+    def throughput(self) -> float:
+        return self.requests / self.elapsed_s if self.elapsed_s else 0.0
+
+    def percentile(self, pct: float) -> float:
+        """Nearest-rank percentile of the recorded latencies"""
+        if not self.latencies_ms:
+            return 0.0
+        ordered = sorted(self.latencies_ms)
+        rank = max(1, int(round(pct / 100 * len(ordered))))
+        return ordered[rank - 1]
+
+    def summary(self) -> Dict[str, float]:
+        data = asdict(self)
+        data.pop("latencies_ms")
+        data.update({
+            "throughput_rps": round(self.throughput, 1),
+            "p50_ms": round(self.percentile(50), 2),
+            "p95_ms": round(self.percentile(95), 2),
+            "p99_ms": round(self.percentile(99), 2),
+        })
+        return data
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_health(base_url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{base_url}/health", timeout=1).ok:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Backend did not become healthy at {base_url}")
+
+
+def start_backend(env_overrides: Dict[str, str], workers: int = 1):
+    """Launch uvicorn serving app.main:app; returns (process, base_url)"""
+    port = _free_port()
+    env = dict(os.environ, **env_overrides)
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning",
+        ],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_for_health(base_url)
+    except RuntimeError:
+        process.terminate()
+        raise
+    return process, base_url
+
+
+def run_scenario(
+    name: str,
+    scenario: Scenario,
+    base_url: str,
+    concurrency: int,
+    duration_s: float,
+    seed: int,
+) -> ScenarioResult:
+    """Closed-loop load: each client issues its next call as soon as the last one returns"""
+    result = ScenarioResult(scenario=name)
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration_s
+
+    def client(client_id: int):
+        rng = random.Random(seed * 1000 + client_id)
+        session = requests.Session()
+        latencies = []
+        errors = 0
+        while time.monotonic() < deadline:
+            method, path, body = scenario(rng)
+            started = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path, json=body, timeout=30)
+                ok = response.status_code < 400
+            except requests.exceptions.RequestException:
+                ok = False
+            latencies.append((time.perf_counter() - started) * 1000)
+            if not ok:
+                errors += 1
+        with lock:
+            result.latencies_ms.extend(latencies)
+            result.requests += len(latencies)
+            result.errors += errors
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.elapsed_s = time.perf_counter() - started
+    return result
+
+
+def print_report(results: List[ScenarioResult]) -> None:
+    header = f"{'scenario':<16}{'reqs':>8}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        s = result.summary()
+        print(
+            f"{s['scenario']:<16}{s['requests']:>8}{s['errors']:>8}{s['throughput_rps']:>10}"
+            f"{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load benchmark for the relief routing backend")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument(
+        "--scenario", action="append", choices=sorted(SCENARIOS),
+        help="Scenario to run (repeatable); default: all"
+    )
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--osrm-latency-ms", type=float, default=5.0)
+    parser.add_argument("--osrm-jitter-ms", type=float, default=2.0)
+    parser.add_argument("--osrm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--osrm-replicas", type=int, default=1, help="OSRM stubs behind the backend pool")
+    parser.add_argument("--weather-latency-ms", type=float, default=50.0)
+    parser.add_argument("--weather-jitter-ms", type=float, default=20.0)
+    parser.add_argument("--weather-failure-rate", type=float, default=0.0)
+    parser.add_argument("--json", dest="json_path", help="Also write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="relief-bench-") as workdir:
+        db_path = os.path.join(workdir, "bench.db")
+        print(f"Generating '{args.scale}' dataset (seed={args.seed})...")
+        centre_count, request_count = write_dataset(db_path, args.scale, args.seed)
+        print(f"  {centre_count} centres, {request_count} requests")
+
+        osrm_replicas = [
+            start_osrm_stub(StubConfig(
+                args.osrm_latency_ms, args.osrm_jitter_ms, args.osrm_failure_rate, args.seed + i
+            ))
+            for i in range(max(1, args.osrm_replicas))
+        ]
+        weather = start_weather_stub(StubConfig(
+            args.weather_latency_ms, args.weather_jitter_ms, args.weather_failure_rate, args.seed
+        ))
+        process, base_url = start_backend({
+            "DATABASE_PATH": db_path,
+            # Keep caches and snapshots of earlier runs (and of a developer's
+            # own server) out of the measurement
+            "SHARED_CACHE_PATH": os.path.join(workdir, "shared_cache.db"),
+            "SNAPSHOT_DIR": os.path.join(workdir, "snapshots"),
+            "OSRM_BACKENDS": " ".join(osrm.url for osrm in osrm_replicas),
+            "OPENWEATHER_BASE_URL": f"{weather.url}/data/2.5",
+            "OPENWEATHER_API_KEY": "benchmark",
+        }, workers=args.workers)
+
+        try:
+            scenarios = build_scenarios(centre_count)
+            selected = args.scenario or list(scenarios)
+            results = []
+            for name in selected:
+                print(f"Running {name} for {args.duration:.0f}s with {args.concurrency} clients...")
+                results.append(run_scenario(
+                    name, scenarios[name], base_url, args.concurrency, args.duration, args.seed
+                ))
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+            for osrm in osrm_replicas:
+                osrm.stop()
+            weather.stop()
+
+    print()
+    print_report(results)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump([r.summary() for r in results], f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Load scenarios: each scenario produces the next HTTP call to make
+
+A scenario is a callable taking a seeded Random and returning
+(method, path, json_body). Bodies are drawn from the benchmark region so the
+OSRM and weather stubs see realistic coordinate spread.
+"""
+import random
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from benchmarks.dataset import SUPPLY_TYPES, random_point
+
+Call = Tuple[str, str, Optional[Dict[str, Any]]]
+Scenario = Callable[[random.Random], Call]
+
+
+def route_scenario(rng: random.Random) -> Call:
+    start_lat, start_lng = random_point(rng)
+    end_lat, end_lng = random_point(rng)
+    return "POST", "/route/", {
+        "start_lat": start_lat,
+        "start_lng": start_lng,
+        "end_lat": end_lat,
+        "end_lng": end_lng,
+    }
+
+
+def nearest_scenario(rng: random.Random) -> Call:
+    lat, lng = random_point(rng)
+    return "POST", "/relief-centres/nearest", {"latitude": lat, "longitude": lng}
+
+
+def weather_route_scenario(rng: random.Random) -> Call:
+    start_lat, start_lng = random_point(rng)
+    end_lat, end_lng = random_point(rng)
+    steps = 50
+    coordinates = [
+        [start_lng + (end_lng - start_lng) * i / steps, start_lat + (end_lat - start_lat) * i / steps]
+        for i in range(steps + 1)
+    ]
+    return "POST", "/weather/route", {"coordinates": coordinates}
+
+
+def make_request_intake_scenario(centre_count: int) -> Scenario:
+    def request_intake_scenario(rng: random.Random) -> Call:
+        lat, lng = random_point(rng)
+        return "POST", "/relief-centres/requests", {
+            "relief_centre_id": rng.randint(1, centre_count),
+            "latitude": lat,
+            "longitude": lng,
+            "supplies": rng.sample(SUPPLY_TYPES, rng.randint(1, 3)),
+        }
+    return request_intake_scenario
+
+
+def list_centres_scenario(rng: random.Random) -> Call:
+    return "GET", "/relief-centres/", None
+
+
+def _viewport_query(rng: random.Random, span: float) -> str:
+    lat, lng = random_point(rng)
+    return f"min_lat={lat}&min_lng={lng}&max_lat={lat + span}&max_lng={lng + span}"
+
+
+def centres_within_scenario(rng: random.Random) -> Call:
+    # About a city district
+    return "GET", f"/relief-centres/within?{_viewport_query(rng, 0.05)}", None
+
+
+def requests_within_scenario(rng: random.Random) -> Call:
+    # A street-level map view
+    return "GET", f"/relief-centres/requests?{_viewport_query(rng, 0.01)}&limit=1000", None
+
+
+def build_scenarios(centre_count: int) -> Dict[str, Scenario]:
+    """All scenarios by name, in the order they are run by default"""
+    return {
+        "route": route_scenario,
+        "nearest": nearest_scenario,
+        "weather_route": weather_route_scenario,
+        "request_intake": make_request_intake_scenario(centre_count),
+        "list_centres": list_centres_scenario,
+        "centres_within": centres_within_scenario,
+        "requests_within": requests_within_scenario,
+    }
+
+
+# Scenario names, for validating command-line choices before a dataset exists
+SCENARIOS = tuple(build_scenarios(0))
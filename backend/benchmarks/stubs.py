@@ -0,0 +1,296 @@
+"""
+Local stand-in servers for OSRM and OpenWeatherMap
+
+The stubs answer with deterministic, plausible payloads so the backend can be
+exercised without network access. Latency and failure rate are configurable
+per server to reproduce slow or flaky upstreams.
+
+Run standalone:
+    python -m benchmarks.stubs --osrm-port 5001 --weather-port 5002
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+# Average driving speed used to turn straight-line distance into duration (m/s)
+STUB_SPEED_MS = 11.0
+# Road networks are never straight; inflate haversine distance by this factor
+STUB_DETOUR_FACTOR = 1.3
+# Number of vertices generated per kilometre of stub route geometry
+STUB_VERTICES_PER_KM = 40
+
+
+@dataclass
+class StubConfig:
+    """Latency and failure behaviour of a stub server"""
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    failure_rate: float = 0.0
+    seed: int = 0
+
+
+def _haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in meters"""
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = (
+        math.sin(dlat / 2) ** 2 +
+        math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
+        math.sin(dlon / 2) ** 2
+    )
+    return 6371000 * 2 * math.asin(math.sqrt(a))
+
+
+def _parse_coordinates(raw: str) -> List[Tuple[float, float]]:
+    """Parse an OSRM coordinate string 'lng,lat;lng,lat' into (lng, lat) tuples"""
+    coords = []
+    for pair in raw.split(";"):
+        lng, lat = pair.split(",")
+        coords.append((float(lng), float(lat)))
+    return coords
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Shared request handling: latency injection, failures and JSON replies"""
+
+    config: StubConfig = StubConfig()
+    rng: random.Random = random.Random(0)
+    rng_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        # Keep benchmark output readable
+        pass
+
+    def _inject_faults(self) -> bool:
+        """Sleep for the configured latency; return True if this call should fail"""
+        with self.rng_lock:
+            jitter = self.rng.uniform(-self.config.jitter_ms, self.config.jitter_ms)
+            fail = self.rng.random() < self.config.failure_rate
+        delay = max(0.0, self.config.latency_ms + jitter) / 1000
+        if delay:
+            time.sleep(delay)
+        if fail:
+            self._send_json(503, {"code": "Unavailable", "message": "Injected failure"})
+        return fail
+
+    def _send_json(self, status_code: int, payload) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class OSRMStubHandler(_StubHandler):
+    """Mimics osrm-routed /route/v1 and /table/v1 for the driving profile"""
+
+    def do_GET(self):
+        if self._inject_faults():
+            return
+        parsed = urlsplit(self.path)
+        params = parse_qs(parsed.query)
+        parts = parsed.path.strip("/").split("/")
+        if len(parts) != 4 or parts[1] != "v1":
+            self._send_json(400, {"code": "InvalidUrl", "message": "Unsupported path"})
+            return
+        try:
+            coords = _parse_coordinates(parts[3])
+        except ValueError:
+            self._send_json(400, {"code": "InvalidQuery", "message": "Bad coordinates"})
+            return
+
+        if parts[0] == "route":
+            self._send_json(200, self._route(coords, params))
+        elif parts[0] == "table":
+            self._send_json(200, self._table(coords, params))
+        else:
+            self._send_json(400, {"code": "InvalidService", "message": "Unsupported service"})
+
+    def _route(self, coords, params):
+        (lng1, lat1), (lng2, lat2) = coords[0], coords[-1]
+        distance = _haversine_m(lat1, lng1, lat2, lng2) * STUB_DETOUR_FACTOR
+        duration = distance / STUB_SPEED_MS
+        vertices = max(2, int(distance / 1000 * STUB_VERTICES_PER_KM))
+        geometry = [
+            [lng1 + (lng2 - lng1) * i / (vertices - 1), lat1 + (lat2 - lat1) * i / (vertices - 1)]
+            for i in range(vertices)
+        ]
+        leg = {"distance": distance, "duration": duration, "steps": [], "summary": ""}
+        if "annotations" in params:
+            segment_distance = distance / (vertices - 1)
+            leg["annotation"] = {
+                "distance": [segment_distance] * (vertices - 1),
+                "duration": [segment_distance / STUB_SPEED_MS] * (vertices - 1),
+            }
+        return {
+            "code": "Ok",
+            "routes": [{
+                "geometry": {"type": "LineString", "coordinates": geometry},
+                "distance": distance,
+                "duration": duration,
+                "legs": [leg],
+            }],
+            "waypoints": [{"location": list(c)} for c in (coords[0], coords[-1])],
+        }
+
+    def _table(self, coords, params):
+        def indices(name):
+            raw = params.get(name, ["all"])[0]
+            if raw == "all":
+                return list(range(len(coords)))
+            return [int(i) for i in raw.split(";")]
+
+        sources = indices("sources")
+        destinations = indices("destinations")
+        distances = []
+        durations = []
+        for s in sources:
+            lng1, lat1 = coords[s]
+            row_distance = []
+            for d in destinations:
+                lng2, lat2 = coords[d]
+                row_distance.append(_haversine_m(lat1, lng1, lat2, lng2) * STUB_DETOUR_FACTOR)
+            distances.append(row_distance)
+            durations.append([d / STUB_SPEED_MS for d in row_distance])
+        result = {"code": "Ok", "durations": durations}
+        if "distance" in params.get("annotations", [""])[0]:
+            result["distances"] = distances
+        return result
+
+
+class WeatherStubHandler(_StubHandler):
+    """Mimics the OpenWeatherMap 2.5 current weather and 5 day / 3 hour forecast endpoints"""
+
+    def do_GET(self):
+        if self._inject_faults():
+            return
+        parsed = urlsplit(self.path)
+        params = parse_qs(parsed.query)
+        try:
+            lat = float(params["lat"][0])
+            lon = float(params["lon"][0])
+        except (KeyError, ValueError):
+            self._send_json(400, {"cod": "400", "message": "Nothing to geocode"})
+            return
+
+        if parsed.path.endswith("/weather"):
+            self._send_json(200, self._current(lat, lon))
+        elif parsed.path.endswith("/forecast"):
+            self._send_json(200, self._forecast(lat, lon))
+        else:
+            self._send_json(404, {"cod": "404", "message": "Internal error"})
+
+    @staticmethod
+    def _conditions(lat: float, lon: float, offset: int = 0):
+        # Deterministic per ~10 km tile so repeated queries agree
+        tile_rng = random.Random(hash((round(lat, 1), round(lon, 1), offset)))
+        main, icon = tile_rng.choice([
+            ("Clear", "01d"), ("Clouds", "03d"), ("Rain", "10d"), ("Thunderstorm", "11d"),
+        ])
+        rain = tile_rng.uniform(0, 25) if main in ("Rain", "Thunderstorm") else 0.0
+        return {
+            "main": {"temp": round(tile_rng.uniform(24, 34), 1), "humidity": tile_rng.randint(50, 95)},
+            "weather": [{"main": main, "description": main.lower(), "icon": icon}],
+            "wind": {"speed": round(tile_rng.uniform(0, 25), 1)},
+            "rain": {"1h": round(rain, 2)},
+        }
+
+    def _current(self, lat: float, lon: float):
+        payload = self._conditions(lat, lon)
+        payload.update({
+            "dt": int(time.time()),
+            "name": "Stubville",
+            "sys": {"country": "IN"},
+        })
+        return payload
+
+    def _forecast(self, lat: float, lon: float):
+        step = 3 * 3600
+        first = int(time.time()) // step * step
+        slots = []
+        for k in range(40):
+            slot = self._conditions(lat, lon, offset=k + 1)
+            slot["rain"] = {"3h": round(slot.pop("rain")["1h"] * 3, 2)}
+            slot["dt"] = first + k * step
+            slot["dt_txt"] = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(slot["dt"]))
+            slots.append(slot)
+        return {
+            "cod": "200",
+            "cnt": len(slots),
+            "list": slots,
+            "city": {"name": "Stubville", "country": "IN", "coord": {"lat": lat, "lon": lon}},
+        }
+
+
+class StubServer:
+    """A stub HTTP server running on a background thread"""
+
+    def __init__(self, handler_cls, config: StubConfig, host: str = "127.0.0.1", port: int = 0):
+        # Each server gets its own handler subclass so configs don't leak between servers
+        handler = type(handler_cls.__name__, (handler_cls,), {
+            "config": config,
+            "rng": random.Random(config.seed),
+            "rng_lock": threading.Lock(),
+        })
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def start_osrm_stub(config: StubConfig = StubConfig(), port: int = 0) -> StubServer:
+    """Start an OSRM stand-in; the base URL is available as `.url`"""
+    return StubServer(OSRMStubHandler, config, port=port).start()
+
+
+def start_weather_stub(config: StubConfig = StubConfig(), port: int = 0) -> StubServer:
+    """Start an OpenWeatherMap stand-in; use `.url + '/data/2.5'` as the base URL"""
+    return StubServer(WeatherStubHandler, config, port=port).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run OSRM and OpenWeatherMap stub servers")
+    parser.add_argument("--osrm-port", type=int, default=5001)
+    parser.add_argument("--weather-port", type=int, default=5002)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency_ms, args.jitter_ms, args.failure_rate, args.seed)
+    osrm = start_osrm_stub(config, args.osrm_port)
+    weather = start_weather_stub(config, args.weather_port)
+    print(f"OSRM stub:    {osrm.url}")
+    print(f"Weather stub: {weather.url}/data/2.5")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        osrm.stop()
+        weather.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Script to build the embedded fallback road graph from the OSM extract
+Run this after placing map.osm.pbf in osrm/ (the same file OSRM is built from)
+
+Requires pyosmium for reading the extract (pip install osmium). The backend
+itself only needs the generated graph file, not pyosmium.
+
+Usage:
+    python build_road_graph.py [osrm/map.osm.pbf] [osrm/map.graph]
+"""
+import math
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.services.road_graph import write_graph
+
+# Car profile: highway tag -> default speed (km/h), roughly matching OSRM's car.lua
+HIGHWAY_SPEEDS_KMH = {
+    "motorway": 90, "motorway_link": 45,
+    "trunk": 85, "trunk_link": 40,
+    "primary": 65, "primary_link": 30,
+    "secondary": 55, "secondary_link": 25,
+    "tertiary": 40, "tertiary_link": 20,
+    "unclassified": 25, "residential": 25,
+    "living_street": 10, "service": 15,
+}
+BLOCKED_ACCESS = {"no", "private", "agricultural", "forestry", "delivery"}
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = (
+        math.sin(dlat / 2) ** 2 +
+        math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
+        math.sin(dlon / 2) ** 2
+    )
+    return 6371000 * 2 * math.asin(math.sqrt(a))
+
+
+def parse_speed(tags, highway: str) -> float:
+    """Speed in m/s from maxspeed (km/h or mph) or the highway default
+
+    Non-positive or non-numeric maxspeed values (e.g. "0", "none", "signals")
+    are treated as missing so edge weights stay finite.
+    """
+    speed = HIGHWAY_SPEEDS_KMH[highway]
+    maxspeed = tags.get("maxspeed", "")
+    try:
+        if maxspeed.endswith("mph"):
+            tagged = float(maxspeed[:-3].strip()) * 1.609
+        elif maxspeed:
+            tagged = float(maxspeed)
+        else:
+            tagged = 0.0
+    except ValueError:
+        tagged = 0.0
+    if math.isfinite(tagged) and tagged > 0:
+        speed = tagged
+    return speed / 3.6
+
+
+def parse_direction(tags, highway: str) -> int:
+    """1 = forward only, -1 = backward only, 0 = both directions"""
+    oneway = tags.get("oneway", "")
+    if oneway in ("yes", "1", "true"):
+        return 1
+    if oneway == "-1":
+        return -1
+    if oneway == "no":
+        return 0
+    if highway in ("motorway", "motorway_link") or tags.get("junction") == "roundabout":
+        return 1
+    return 0
+
+
+def read_ways(pbf_path: str):
+    """Return routable ways as (speed m/s, direction, [(osm node id, lat, lng), ...])"""
+    try:
+        import osmium
+    except ImportError:
+        sys.exit("pyosmium is required to build the road graph: pip install osmium")
+
+    ways = []
+
+    class WayHandler(osmium.SimpleHandler):
+        def way(self, w):
+            highway = w.tags.get("highway")
+            if highway not in HIGHWAY_SPEEDS_KMH:
+                return
+            if w.tags.get("access") in BLOCKED_ACCESS or w.tags.get("motor_vehicle") in BLOCKED_ACCESS:
+                return
+            try:
+                nodes = [(n.ref, n.location.lat, n.location.lon) for n in w.nodes]
+            except osmium.InvalidLocationError:
+                return
+            if len(nodes) >= 2:
+                ways.append((parse_speed(w.tags, highway), parse_direction(w.tags, highway), nodes))
+
+    WayHandler().apply_file(pbf_path, locations=True)
+    return ways
+
+
+def build_graph(ways):
+    """
+    Collapse ways into a junction graph
+
+    A node becomes a graph node if it ends a way or is shared by several ways;
+    everything in between is kept as edge shape. Only the largest connected
+    component is kept so queries never snap onto an isolated fragment.
+    """
+    usage: Dict[int, int] = {}
+    for _, _, nodes in ways:
+        for i, (ref, _, _) in enumerate(nodes):
+            usage[ref] = usage.get(ref, 0) + (2 if i in (0, len(nodes) - 1) else 1)
+
+    junction_index: Dict[int, int] = {}
+    coords: List[Tuple[float, float]] = []
+    edges = []
+
+    def junction(ref, lat, lng) -> int:
+        if ref not in junction_index:
+            junction_index[ref] = len(coords)
+            coords.append((lat, lng))
+        return junction_index[ref]
+
+    for speed, direction, nodes in ways:
+        start = 0
+        for i in range(1, len(nodes)):
+            if usage[nodes[i][0]] < 2 and i != len(nodes) - 1:
+                continue
+            segment = nodes[start:i + 1]
+            distance = sum(
+                haversine_m(a[1], a[2], b[1], b[2]) for a, b in zip(segment, segment[1:])
+            )
+            duration = distance / speed
+            u = junction(*segment[0])
+            v = junction(*segment[-1])
+            shape = [(lat, lng) for _, lat, lng in segment[1:-1]]
+            if u != v:
+                if direction >= 0:
+                    edges.append((u, v, duration, distance, shape))
+                if direction <= 0:
+                    edges.append((v, u, duration, distance, shape[::-1]))
+            start = i
+
+    # Union-find over undirected connectivity
+    parent = list(range(len(coords)))
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for u, v, _, _, _ in edges:
+        ru, rv = find(u), find(v)
+        if ru != rv:
+            parent[ru] = rv
+    sizes: Dict[int, int] = {}
+    for i in range(len(coords)):
+        root = find(i)
+        sizes[root] = sizes.get(root, 0) + 1
+    largest: Optional[int] = max(sizes, key=sizes.get) if sizes else None
+
+    remap: Dict[int, int] = {}
+    kept_coords = []
+    for i, coord in enumerate(coords):
+        if find(i) == largest:
+            remap[i] = len(kept_coords)
+            kept_coords.append(coord)
+    kept_edges = [
+        (remap[u], remap[v], dur, dist, shape)
+        for u, v, dur, dist, shape in edges
+        if u in remap and v in remap
+    ]
+    return kept_coords, kept_edges
+
+
+def main():
+    pbf_path = sys.argv[1] if len(sys.argv) > 1 else "osrm/map.osm.pbf"
+    graph_path = sys.argv[2] if len(sys.argv) > 2 else "osrm/map.graph"
+
+    started = time.time()
+    print(f"Reading routable ways from {pbf_path}...")
+    ways = read_ways(pbf_path)
+    print(f"  {len(ways)} ways")
+
+    print("Building junction graph...")
+    coords, edges = build_graph(ways)
+    print(f"  {len(coords)} nodes, {len(edges)} edges")
+
+    print(f"Writing {graph_path}...")
+    write_graph(graph_path, coords, edges)
+    print(f"Done in {time.time() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Script to bulk import relief centres from CSV or GeoJSON
+Rows with an external_id update the existing centre with that id, so the same
+list can be re-imported after corrections.
+
+Usage:
+    python import_relief_centres.py centres.csv [more files...]
+        [--batch-size 1000] [--bbox min_lat,min_lng,max_lat,max_lng] [--dry-run]
+
+See app/services/centre_import.py for the accepted columns.
+"""
+import argparse
+import sys
+import time
+
+from app.database import SessionLocal, init_db
+from app.services.centre_import import (
+    IMPORT_BATCH_SIZE,
+    CentreImportError,
+    import_centres,
+    read_centres,
+    rebuild_derived_indexes
+)
+
+
+def parse_bbox(value: str):
+    try:
+        min_lat, min_lng, max_lat, max_lng = (float(v) for v in value.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected min_lat,min_lng,max_lat,max_lng")
+    return min_lat, min_lng, max_lat, max_lng
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk import relief centres from CSV or GeoJSON")
+    parser.add_argument("paths", nargs="+", help=".csv, .geojson or newline-delimited .geojsonl files")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Rows per transaction")
+    parser.add_argument("--bbox", type=parse_bbox, help="Reject centres outside min_lat,min_lng,max_lat,max_lng")
+    parser.add_argument("--dry-run", action="store_true", help="Validate only, write nothing")
+    args = parser.parse_args(argv)
+
+    print("Initializing database...")
+    init_db()
+    db = SessionLocal()
+    invalid = 0
+    try:
+        for path in args.paths:
+            started = time.perf_counter()
+            try:
+                report = import_centres(
+                    db, read_centres(path), args.batch_size, args.bbox, args.dry_run
+                )
+            except (CentreImportError, OSError, ValueError) as e:
+                print(f"Error importing {path}: {e}")
+                return 1
+            elapsed = time.perf_counter() - started
+            invalid += report.invalid
+            print(
+                f"{path}: {report.rows} rows in {elapsed:.1f}s - {report.inserted} inserted, "
+                f"{report.updated} updated, {report.unchanged} unchanged, "
+                f"{report.duplicates} duplicates, {report.invalid} invalid"
+            )
+            for error in report.errors:
+                print(f"  {error}")
+            if report.invalid > len(report.errors):
+                print(f"  ... and {report.invalid - len(report.errors)} more")
+
+        if not args.dry_run:
+            print("Rebuilding derived indexes...")
+            rebuild_derived_indexes(db)
+    finally:
+        db.close()
+    print("Done." if not invalid else f"Done, {invalid} rows skipped.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -222,7 +222,10 @@ export default function NeedHelpPage() {
       const response = await fetch(`${BACKEND_URL}/weather/route`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ coordinates: routeData.coordinates }),
+        body: JSON.stringify({
+          coordinates: routeData.coordinates,
+          duration: routeData.summary.duration,
+        }),
       });
       if (response.ok) {
         const data = await response.json();